@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+"""
+Shared uint8 alignment matrix used by the conservation scoring and plotting scripts
+
+An alignment is held as one uint8 matrix (sequences x columns) of residue
+codes plus the sequence IDs and a per-column residue count table:
+
+    codes      0 = gap, 1-20 = ACDEFGHIKLMNPQRSTVWY, 21 = any other residue (X)
+    counts     columns x 22, occurrences of every code in every column
+
+Lowercase residues count as uppercase; '-' and '.' are gaps. Loaded
+alignments are cached next to the FASTA file under .alignment_cache/ and
+reused while the size and mtime of the FASTA are unchanged, so the
+scripts reading the same *_bHLH_aligned.fasta parse it only once.
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+SYMBOLS = '-' + AMINO_ACIDS + 'X'
+GAP = 0
+UNKNOWN = len(SYMBOLS) - 1
+N_SYMBOLS = len(SYMBOLS)
+
+CACHE_DIR = '.alignment_cache'
+CACHE_VERSION = 1
+
+# Byte -> residue code
+_ENCODE = np.full(256, UNKNOWN, dtype=np.uint8)
+for _code, _symbol in enumerate(SYMBOLS):
+    _ENCODE[ord(_symbol)] = _code
+    _ENCODE[ord(_symbol.lower())] = _code
+_ENCODE[ord('.')] = GAP
+
+_DECODE = np.frombuffer(SYMBOLS.encode(), dtype=np.uint8)
+
+
+def encode(sequences):
+    """uint8 code matrix of equal-length aligned sequences"""
+    sequences = [seq.encode() if isinstance(seq, str) else seq for seq in sequences]
+    lengths = {len(seq) for seq in sequences}
+    if len(lengths) > 1:
+        raise ValueError(f"Sequences have different lengths ({min(lengths)}-{max(lengths)}), not an alignment")
+    width = lengths.pop() if lengths else 0
+    data = np.frombuffer(b''.join(sequences), dtype=np.uint8)
+    return _ENCODE[data].reshape(len(sequences), width)
+
+
+def flat_codes(codes):
+    """Index of the (column, code) pair of every cell in a flat columns x N_SYMBOLS table"""
+    return codes.astype(np.int64) + np.arange(codes.shape[1], dtype=np.int64) * N_SYMBOLS
+
+
+def pair_one_hot(codes, mask=None):
+    """(sequences x occurring (column, code) pairs one-hot float32 matrix, flat index of every pair)
+
+    Only the cells where mask is set are encoded (all cells without a mask).
+    """
+    flat = flat_codes(codes)
+    rows, cols = np.nonzero(np.ones(codes.shape, dtype=bool) if mask is None else mask)
+    present, inverse = np.unique(flat[rows, cols], return_inverse=True)
+    one_hot = np.zeros((len(codes), len(present)), dtype=np.float32)
+    one_hot[rows, inverse] = 1.0
+    return one_hot, present
+
+
+def column_counts(codes, weights=None):
+    """columns x N_SYMBOLS table of code occurrences, summed sequence weights if given"""
+    n_columns = codes.shape[1]
+    flat = flat_codes(codes)
+    if weights is not None:
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64)[:, None], codes.shape)
+        return np.bincount(flat.ravel(), weights=weights.ravel(),
+                           minlength=n_columns * N_SYMBOLS).reshape(n_columns, N_SYMBOLS)
+    return np.bincount(flat.ravel(), minlength=n_columns * N_SYMBOLS).reshape(
+        n_columns, N_SYMBOLS).astype(np.int32)
+
+
+class AlignmentMatrix:
+    """Encoded alignment: ids, index {id: row}, codes and counts (see module docstring)"""
+
+    def __init__(self, ids, codes, counts=None):
+        self.ids = list(ids)
+        self.index = {seq_id: row for row, seq_id in enumerate(self.ids)}
+        self.codes = codes
+        self.counts = column_counts(codes) if counts is None else counts
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def length(self):
+        return self.codes.shape[1]
+
+    def residues(self, rows=slice(None)):
+        """Characters of the selected rows as a (rows x columns) array of one-letter strings"""
+        return _DECODE[self.codes[rows]].view('S1').astype(str)
+
+    def sequence(self, seq_id):
+        """Aligned sequence of one ID"""
+        return _DECODE[self.codes[self.index[seq_id]]].tobytes().decode()
+
+    def weighted_counts(self, weights):
+        """columns x N_SYMBOLS table of summed sequence weights"""
+        return column_counts(self.codes, weights)
+
+    def residue_counts(self):
+        """Non-gap residues per column"""
+        return self.counts[:, 1:].sum(axis=1)
+
+    def gap_fraction(self):
+        return self.counts[:, GAP] / max(len(self), 1)
+
+    def frequencies(self):
+        """columns x 20 frequencies of the standard amino acids among the non-gap residues"""
+        total = self.residue_counts()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            freq = self.counts[:, 1:UNKNOWN] / total[:, None]
+        return np.nan_to_num(freq)
+
+    def consensus(self):
+        """Most common non-gap code per column (GAP for all-gap columns)
+
+        Ties go to the residue seen first in the column, like Counter.most_common.
+        """
+        residue_counts = self.counts[:, 1:]
+        best = residue_counts.max(axis=1)
+        consensus = (residue_counts.argmax(axis=1) + 1).astype(np.uint8)
+        consensus[best == 0] = GAP
+
+        tied = np.flatnonzero((best > 0) & ((residue_counts == best[:, None]).sum(axis=1) > 1))
+        if len(tied):
+            columns = self.codes[:, tied]
+            first_row = np.full((len(tied), N_SYMBOLS), len(self), dtype=np.int64)
+            for code in range(1, N_SYMBOLS):
+                hit = columns == code
+                seen = hit.any(axis=0)
+                first_row[seen, code] = hit[:, seen].argmax(axis=0)
+            first_row[self.counts[tied] != best[tied, None]] = len(self)
+            first_row[:, GAP] = len(self)
+            consensus[tied] = first_row.argmin(axis=1)
+        return consensus
+
+    def consensus_residues(self):
+        """Consensus character per column ('-' for all-gap columns)"""
+        return _DECODE[self.consensus()].view('S1').astype(str)
+
+
+def read_alignment_matrix(fasta_file):
+    """AlignmentMatrix of an aligned FASTA file (no caching)"""
+    with open(fasta_file, 'rb') as f:
+        data = f.read()
+
+    ids, sequences = [], []
+    for record in data.split(b'\n>'):
+        header, _, body = record.lstrip(b'>').partition(b'\n')
+        if not header.strip() and not body.strip():
+            continue
+        ids.append(header.split()[0].decode() if header.split() else '')
+        sequences.append(body.replace(b'\n', b'').replace(b'\r', b'').replace(b' ', b''))
+    return AlignmentMatrix(ids, encode(sequences))
+
+
+def cache_file(fasta_file, suffix='npz', cache_dir=None):
+    """Path of a cache entry derived from an alignment"""
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(fasta_file)), CACHE_DIR)
+    return os.path.join(cache_dir, f"{os.path.basename(fasta_file)}.{suffix}")
+
+
+def source_key(path):
+    """Cache version, size and mtime of a file; cache entries store it to detect changes"""
+    stat = os.stat(path)
+    return np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def load_alignment(fasta_file, cache_dir=None, use_cache=True):
+    """AlignmentMatrix of an aligned FASTA file, from the cache when it is up to date"""
+    path = cache_file(fasta_file, cache_dir=cache_dir)
+    source = source_key(fasta_file)
+    if use_cache and os.path.exists(path):
+        with np.load(path) as cached:
+            if np.array_equal(cached['source'], source):
+                return AlignmentMatrix(cached['ids'].tolist(), cached['codes'], cached['counts'])
+
+    matrix = read_alignment_matrix(fasta_file)
+    if use_cache:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}.npz"
+        np.savez(tmp, source=source, ids=np.array(matrix.ids, dtype=str),
+                 codes=matrix.codes, counts=matrix.counts)
+        os.replace(tmp, path)
+    return matrix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('alignments', nargs='+', help="aligned FASTA files")
+    parser.add_argument('--no-cache', action='store_true', help="parse without reading or writing the cache")
+    args = parser.parse_args()
+
+    for fasta_file in args.alignments:
+        start = time.time()
+        matrix = load_alignment(fasta_file, use_cache=not args.no_cache)
+        print(f"  ✓ {fasta_file}: {len(matrix)} sequences x {matrix.length} columns, "
+              f"{matrix.gap_fraction().mean():.1%} gaps ({time.time() - start:.3f}s)")
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
 
-from Bio import AlignIO
-from collections import Counter
-import numpy as np
+import argparse
 import os
 
-def calculate_conservation(alignment_file, output_file):
+from alignment_matrix import load_alignment
+from bootstrap_conservation import bootstrap_alignment
+from conservation_scores import alignment_scores
+from sequence_weights import load_effective_sequences, load_weights
+
+# Sequence weighting ('henikoff', 'identity' or None for raw counts), so that
+# the many near-identical mammalian homologs do not inflate conservation
+SEQUENCE_WEIGHTING = 'henikoff'
+
+# Bootstrap replicates (sequences resampled with replacement) behind the
+# confidence intervals and class stability of every position; off unless
+# asked for (--bootstrap 1000)
+BOOTSTRAP_REPLICATES = 0
+
+def calculate_conservation(alignment_file, output_file, weighting=SEQUENCE_WEIGHTING,
+                           n_boot=BOOTSTRAP_REPLICATES, workers=None):
     """Calculate per-position conservation scores"""
     
     if not os.path.exists(alignment_file):
@@ -13,86 +26,90 @@ def calculate_conservation(alignment_file, output_file):
         return
     
     try:
-        alignment = AlignIO.read(alignment_file, "fasta")
+        alignment = load_alignment(alignment_file)
     except:
         print(f"  ⚠ Could not read {alignment_file}")
         return
     
     n_seqs = len(alignment)
-    aln_len = alignment.get_alignment_length()
+    aln_len = alignment.length
     
-    conservation = []
+    # All metrics for all columns at once, from the (weighted) column counts
+    weights = load_weights(alignment_file, weighting, alignment=alignment) if weighting else None
+    scores = alignment_scores(alignment, weights)
+    conservation = scores['Conservation_Score'].values
     
-    for pos in range(aln_len):
-        column = alignment[:, pos]
-        
-        # Skip gap-only columns
-        non_gap = [aa for aa in column if aa != '-']
-        if len(non_gap) == 0:
-            conservation.append(0)
-            continue
-        
-        # Calculate Shannon entropy (lower = more conserved)
-        counts = Counter(non_gap)
-        total = len(non_gap)
-        
-        entropy = 0
-        for count in counts.values():
-            p = count / total
-            if p > 0:
-                entropy -= p * np.log2(p)
-        
-        # Normalize to 0-1 (1 = perfectly conserved)
-        max_entropy = np.log2(min(20, len(non_gap)))
-        if max_entropy > 0:
-            conservation_score = 1 - (entropy / max_entropy)
-        else:
-            conservation_score = 1
-        
-        conservation.append(conservation_score)
+    # Confidence intervals and class probabilities from resampled count matrices
+    if n_boot:
+        bootstrap = bootstrap_alignment(alignment, conservation, weights, n_boot, workers=workers)
+        scores = scores.join(bootstrap)
     
     # Save conservation scores
     with open(output_file, 'w') as f:
-        f.write("Position\tConservation_Score\tResidue\n")
-        for pos, score in enumerate(conservation, 1):
-            column = alignment[:, pos-1]
-            non_gap = [aa for aa in column if aa != '-']
-            if non_gap:
-                consensus = Counter(non_gap).most_common(1)[0][0]
-            else:
-                consensus = '-'
-            
-            f.write(f"{pos}\t{score:.3f}\t{consensus}\n")
+        if n_boot:
+            f.write("Position\tConservation_Score\tResidue\tCI_Low\tCI_High\tClass_Stability\n")
+            for row in scores.itertuples():
+                f.write(f"{row.Position}\t{row.Conservation_Score:.3f}\t{row.Residue}\t"
+                        f"{row.CI_Low:.3f}\t{row.CI_High:.3f}\t{row.Class_Stability:.3f}\n")
+        else:
+            f.write("Position\tConservation_Score\tResidue\n")
+            for pos, score, consensus in zip(scores['Position'], conservation, scores['Residue']):
+                f.write(f"{pos}\t{score:.3f}\t{consensus}\n")
+    
+    # Entropy, gap fraction, JSD and sum-of-pairs scores
+    metrics_file = os.path.splitext(output_file)[0] + '_metrics.tsv'
+    scores.to_csv(metrics_file, sep='\t', index=False, float_format='%.4f')
     
     print(f"  ✓ Analyzed {alignment_file}")
-    print(f"    Sequences: {n_seqs}, Length: {aln_len}")
+    # The effective count comes with the cached identity weights; computing
+    # it for other weightings would cost a full all-against-all comparison
+    if weighting == 'identity':
+        effective = load_effective_sequences(alignment_file, alignment=alignment)
+        print(f"    Sequences: {n_seqs} ({effective:.1f} effective), "
+              f"Length: {aln_len}, weighting: {weighting}")
+    else:
+        print(f"    Sequences: {n_seqs}, Length: {aln_len}, weighting: {weighting or 'none'}")
     
-    highly_conserved = sum(1 for s in conservation if s > 0.9)
-    moderate = sum(1 for s in conservation if 0.7 <= s <= 0.9)
+    highly_conserved = int((conservation > 0.9).sum())
+    moderate = int(((conservation >= 0.7) & (conservation <= 0.9)).sum())
     
     print(f"    Highly conserved (>0.9): {highly_conserved} positions")
     print(f"    Moderately conserved (0.7-0.9): {moderate} positions")
+    if n_boot:
+        unstable = int((scores['Class_Stability'] < 0.9).sum())
+        print(f"    Class unstable in >10% of {n_boot} bootstrap replicates: {unstable} positions")
+    print(f"    Mean JSD: {scores['JSD'].mean():.3f}, mean sum-of-pairs: {scores['Sum_of_Pairs'].mean():.2f}")
+    print(f"  ✓ Metrics saved: {metrics_file}")
     print("")
 
-print("\n" + "="*70)
-print("Conservation Analysis")
-print("="*70)
-print("")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-position conservation of the bHLH domain alignments")
+    parser.add_argument('--bootstrap', type=int, default=BOOTSTRAP_REPLICATES,
+                        help="bootstrap replicates for confidence intervals (default: none)")
+    parser.add_argument('--workers', type=int, help="bootstrap processes (default: all cores)")
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("Conservation Analysis")
+    print("="*70)
+    print("")
 
-if os.path.exists('05_domains/hmmer/OG0000000_bHLH_aligned.fasta'):
-    print("OG0000000 bHLH domains:")
-    calculate_conservation(
-        '05_domains/hmmer/OG0000000_bHLH_aligned.fasta',
-        '05_domains/hmmer/OG0000000_bHLH_conservation.txt'
-    )
+    if os.path.exists('05_domains/hmmer/OG0000000_bHLH_aligned.fasta'):
+        print("OG0000000 bHLH domains:")
+        calculate_conservation(
+            '05_domains/hmmer/OG0000000_bHLH_aligned.fasta',
+            '05_domains/hmmer/OG0000000_bHLH_conservation.txt',
+            n_boot=args.bootstrap, workers=args.workers
+        )
 
-if os.path.exists('05_domains/hmmer/OG0000001_bHLH_aligned.fasta'):
-    print("OG0000001 bHLH domains:")
-    calculate_conservation(
-        '05_domains/hmmer/OG0000001_bHLH_aligned.fasta',
-        '05_domains/hmmer/OG0000001_bHLH_conservation.txt'
-    )
+    if os.path.exists('05_domains/hmmer/OG0000001_bHLH_aligned.fasta'):
+        print("OG0000001 bHLH domains:")
+        calculate_conservation(
+            '05_domains/hmmer/OG0000001_bHLH_aligned.fasta',
+            '05_domains/hmmer/OG0000001_bHLH_conservation.txt',
+            n_boot=args.bootstrap, workers=args.workers
+        )
 
-print("✓ Conservation analysis complete")
-print("")
+    print("✓ Conservation analysis complete")
+    print("")
 
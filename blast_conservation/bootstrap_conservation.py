@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""
+Bootstrap confidence intervals and class stability of per-position conservation
+
+Sequences are resampled with replacement: one replicate is a multinomial
+draw of how often every sequence occurs (n draws over n sequences). Its
+column counts are a bincount of the (column, residue) index of every cell
+weighted by that multiplicity (times the sequence weights), so no one-hot
+matrix is built and the alignment is never re-read or re-encoded. Every
+replicate is scored with the entropy score of conservation_scores.py;
+batches of replicates are spread over a process pool.
+
+Sequence weights are kept fixed at their full-alignment values rather than
+recomputed for every replicate.
+
+Per position:
+
+    CI_Low, CI_High      percentile bootstrap interval of Conservation_Score
+    Class                high (>0.9), moderate (0.7-0.9) or variable (<0.7)
+    Class_Stability      fraction of replicates in the same class as the
+                         observed score
+    P_High, P_Moderate, P_Variable   fraction of replicates in every class
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from alignment_matrix import GAP, N_SYMBOLS, flat_codes, load_alignment
+from conservation_scores import alignment_scores, entropy_score
+from sequence_weights import load_weights
+
+N_BOOTSTRAP = 1000
+BATCH_SIZE = 64
+CONFIDENCE = 0.95
+
+# Conservation classes of analyze_conservation_fixed.py / generate_final_summary.py
+HIGH_THRESHOLD = 0.9
+MODERATE_THRESHOLD = 0.7
+CLASS_NAMES = ('variable', 'moderate', 'high')
+
+
+def conservation_class(scores):
+    """0 = variable (<0.7), 1 = moderate (0.7-0.9), 2 = high (>0.9)"""
+    return np.where(scores > HIGH_THRESHOLD, 2, np.where(scores >= MODERATE_THRESHOLD, 1, 0))
+
+
+def replicate_scores(codes, multiplicity, weights=None, flat=None, residue=None):
+    """Entropy scores (replicates x columns) of resampled sequence multiplicities
+
+    flat (flat_codes(codes).ravel()) and residue (codes != GAP) can be
+    passed in when scoring several batches of the same alignment.
+    """
+    n_sequences, n_columns = codes.shape
+    flat = flat_codes(codes).ravel() if flat is None else flat
+    residue = (codes != GAP) if residue is None else residue
+
+    scores = np.empty((len(multiplicity), n_columns), dtype=np.float32)
+    for i, counts_of in enumerate(multiplicity):
+        row_weights = counts_of if weights is None else counts_of * weights
+        counts = np.bincount(flat, weights=np.repeat(row_weights.astype(np.float64), n_columns),
+                             minlength=n_columns * N_SYMBOLS).reshape(n_columns, N_SYMBOLS)
+        # Weighted scores are normalized by the plain number of residues
+        residues = None if weights is None else counts_of.astype(np.float64) @ residue
+        scores[i] = entropy_score(counts, residues)
+    return scores
+
+
+def _bootstrap_block(codes, weights, n, seed):
+    """Scores of n bootstrap replicates (one pool task)"""
+    rng = np.random.default_rng(seed)
+    n_sequences = len(codes)
+    flat = flat_codes(codes).ravel()
+    residue = codes != GAP
+    probabilities = np.full(n_sequences, 1.0 / n_sequences)
+
+    scores = np.empty((n, codes.shape[1]), dtype=np.float32)
+    for start in range(0, n, BATCH_SIZE):
+        size = min(BATCH_SIZE, n - start)
+        multiplicity = rng.multinomial(n_sequences, probabilities, size)
+        scores[start:start + size] = replicate_scores(codes, multiplicity, weights, flat, residue)
+    return scores
+
+
+def _split(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (i < extra) for i in range(parts) if base + (i < extra)]
+
+
+def bootstrap_scores(codes, weights=None, n_boot=N_BOOTSTRAP, seed=0, workers=None):
+    """Conservation scores of n_boot replicates (replicates x columns)"""
+    workers = workers or os.cpu_count() or 1
+    weights = None if weights is None else np.asarray(weights, dtype=np.float32)
+    sizes = _split(n_boot, workers)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if len(sizes) == 1:
+        return _bootstrap_block(codes, weights, sizes[0], seeds[0])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        jobs = [pool.submit(_bootstrap_block, codes, weights, n, s) for n, s in zip(sizes, seeds)]
+        return np.concatenate([job.result() for job in jobs])
+
+
+def bootstrap_table(scores, replicates, confidence=CONFIDENCE):
+    """Per-position intervals and class probabilities (see module docstring)"""
+    tail = 100 * (1 - confidence) / 2
+    low, high = np.percentile(replicates, [tail, 100 - tail], axis=0)
+    observed = conservation_class(scores)
+    classes = conservation_class(replicates)
+    probabilities = np.stack([(classes == c).mean(axis=0) for c in range(len(CLASS_NAMES))], axis=1)
+    return pd.DataFrame({
+        'CI_Low': low,
+        'CI_High': high,
+        'Class': np.array(CLASS_NAMES)[observed],
+        'Class_Stability': probabilities[np.arange(len(scores)), observed],
+        'P_High': probabilities[:, 2],
+        'P_Moderate': probabilities[:, 1],
+        'P_Variable': probabilities[:, 0],
+    })
+
+
+def bootstrap_alignment(alignment, scores, weights=None, n_boot=N_BOOTSTRAP, seed=0, workers=None,
+                        confidence=CONFIDENCE):
+    """bootstrap_table() of an AlignmentMatrix and its observed Conservation_Score values"""
+    replicates = bootstrap_scores(alignment.codes, weights, n_boot, seed, workers)
+    return bootstrap_table(np.asarray(scores), replicates, confidence)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('alignment', help="aligned FASTA file")
+    parser.add_argument('--output', help="table to write (default: <alignment>_bootstrap.tsv)")
+    parser.add_argument('--weighting', choices=['henikoff', 'identity', 'none'], default='henikoff')
+    parser.add_argument('--bootstrap', type=int, default=N_BOOTSTRAP, help="number of replicates")
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE)
+    parser.add_argument('--workers', type=int, help="processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.time()
+    alignment = load_alignment(args.alignment)
+    weighting = None if args.weighting == 'none' else args.weighting
+    weights = load_weights(args.alignment, weighting, alignment=alignment) if weighting else None
+    scores = alignment_scores(alignment, weights)
+    table = pd.concat([scores[['Position', 'Conservation_Score', 'Residue']],
+                       bootstrap_alignment(alignment, scores['Conservation_Score'], weights, args.bootstrap,
+                                           args.seed, args.workers, args.confidence)], axis=1)
+
+    output = args.output or os.path.splitext(args.alignment)[0] + '_bootstrap.tsv'
+    table.to_csv(output, sep='\t', index=False, float_format='%.3f')
+    unstable = int((table['Class_Stability'] < 0.9).sum())
+    print(f"✓ {args.bootstrap} replicates of {len(alignment)} sequences x {alignment.length} columns "
+          f"({time.time() - start:.1f}s)")
+    print(f"  Positions changing class in >10% of replicates: {unstable}")
+    print(f"Results saved to {output}")
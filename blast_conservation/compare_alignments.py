@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""
+Sum-of-pairs and total-column comparison of the MAFFT and PRANK alignments
+
+Both alignments of an orthogroup are turned into residue-index matrices
+(sequences x columns, the position of the residue in its ungapped sequence
+or -1 for a gap). Every residue of the reference alignment (MAFFT) is then
+looked up in the test alignment (PRANK): two residues aligned in a
+reference column are still aligned when they land in the same test
+column. Counting residues per (reference column, test column) gives the
+preserved pairs without looping over pairs of sequences, so the cost is
+linear in the size of the alignment:
+
+    SP     preserved pairs / aligned pairs of the reference
+    TC     reference columns reproduced exactly in the test alignment
+    agreement of a column   preserved pairs / aligned pairs of the column
+
+The scores are computed in both directions (PRANK vs MAFFT and MAFFT vs
+PRANK). Runs of columns where the aligners disagree are reported in the
+coordinates of a reference sequence (human MYOD1 by default) together with
+the HMMER domains (05_domains/hmmer/<OG>_parsed.json) they overlap, and the
+agreement is averaged over every annotated domain, e.g. Basic and HLH.
+"""
+
+import argparse
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+
+REFERENCE_SEQUENCE = 'NP_002469.2'  # human MYOD1
+
+
+def read_alignment(fasta_file):
+    """{name: aligned sequence} in file order"""
+    sequences = {}
+    name = None
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                name = line[1:].split()[0]
+                sequences[name] = []
+            elif name is not None:
+                sequences[name].append(line)
+    return {name: ''.join(parts).upper() for name, parts in sequences.items()}
+
+
+def residue_index_matrix(aligned):
+    """Residue number of every cell of an alignment, -1 for gaps"""
+    width = max(len(seq) for seq in aligned)
+    chars = np.full((len(aligned), width), ord('-'), dtype=np.uint8)
+    for i, seq in enumerate(aligned):
+        chars[i, :len(seq)] = np.frombuffer(seq.encode(), dtype=np.uint8)
+    residue = (chars != ord('-')) & (chars != ord('.'))
+    index = np.cumsum(residue, axis=1, dtype=np.int32) - 1
+    index[~residue] = -1
+    return index
+
+
+def residue_columns(index):
+    """Column of every residue: (sequences x longest sequence), -1 past the end"""
+    lengths = (index >= 0).sum(axis=1)
+    columns = np.full((index.shape[0], max(lengths.max(), 1)), -1, dtype=np.int32)
+    rows, cols = np.nonzero(index >= 0)
+    columns[rows, index[rows, cols]] = cols
+    return columns
+
+
+def _pairs(k):
+    return k * (k - 1) // 2
+
+
+def pair_scores(reference, test):
+    """Per-column and overall scores of a test alignment against a reference
+
+    Both arguments are residue-index matrices with the sequences in the same
+    order. Returns a dict with 'sp', 'tc', 'pairs' and 'preserved' (per
+    reference column) and 'residue' (per-residue agreement, NaN for gaps and
+    residues alone in their column).
+    """
+    n_ref_columns = reference.shape[1]
+    test_columns = residue_columns(test)
+
+    rows, ref_cols = np.nonzero(reference >= 0)
+    test_cols = test_columns[rows, reference[rows, ref_cols]]
+
+    # Residues sharing a reference column and a test column are aligned in both
+    key = ref_cols.astype(np.int64) * test.shape[1] + test_cols
+    _, group, group_size = np.unique(key, return_inverse=True, return_counts=True)
+
+    column_size = np.bincount(ref_cols, minlength=n_ref_columns)
+    pairs = _pairs(column_size)
+    preserved = np.bincount(ref_cols, weights=_pairs(group_size)[group] / group_size[group],
+                            minlength=n_ref_columns).round().astype(np.int64)
+
+    # A column is reproduced when all its residues share one test column that
+    # holds nothing else
+    test_size = np.bincount(test_cols, minlength=test.shape[1])
+    exact = np.zeros(n_ref_columns, dtype=bool)
+    whole = group_size[group] == column_size[ref_cols]
+    exact[ref_cols[whole]] = test_size[test_cols[whole]] == column_size[ref_cols[whole]]
+    scored = column_size >= 2
+
+    residue = np.full(reference.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        residue[rows, ref_cols] = (group_size[group] - 1) / (column_size[ref_cols] - 1)
+
+    return {'sp': preserved.sum() / pairs.sum() if pairs.sum() else float('nan'),
+            'tc': exact[scored].mean() if scored.any() else float('nan'),
+            'pairs': pairs, 'preserved': preserved, 'exact': exact, 'residue': residue}
+
+
+def disagreement_regions(agreement, reference_index, threshold=0.8, min_length=3):
+    """[(first column, last column, first residue, last residue, mean agreement)]
+
+    Runs of at least min_length reference columns scoring below threshold;
+    the residue range is 1-based in the reference sequence (None if the
+    sequence is gapped over the whole run).
+    """
+    low = np.nan_to_num(agreement, nan=1.0) < threshold
+    edges = np.diff(np.concatenate(([0], low.astype(np.int8), [0])))
+    regions = []
+    for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        if end - start < min_length:
+            continue
+        residues = reference_index[start:end]
+        residues = residues[residues >= 0]
+        first, last = (int(residues[0]) + 1, int(residues[-1]) + 1) if len(residues) else (None, None)
+        regions.append((int(start), int(end) - 1, first, last, float(np.nanmean(agreement[start:end]))))
+    return regions
+
+
+def domain_agreement(residue_agreement, names, domains):
+    """{domain: (annotations, mean per-residue agreement)} from HMMER hits"""
+    rows = {name: i for i, name in enumerate(names)}
+    values = {}
+    for name, hits in domains.items():
+        if name not in rows:
+            continue
+        per_residue = residue_agreement[rows[name]]
+        for hit in hits:
+            region = per_residue[hit['start'] - 1:hit['end']]
+            values.setdefault(hit['domain'], []).append(region[~np.isnan(region)])
+    return {domain: (len(parts), float(np.concatenate(parts).mean()) if sum(map(len, parts)) else float('nan'))
+            for domain, parts in values.items()}
+
+
+def compare(reference_file, test_file):
+    """(names, reference matrix, test matrix) with the sequences in reference order"""
+    reference = read_alignment(reference_file)
+    test = read_alignment(test_file)
+    if set(reference) != set(test):
+        raise ValueError(f"{reference_file} and {test_file} hold different sequences")
+    names = list(reference)
+    for name in names:
+        if reference[name].replace('-', '') != test[name].replace('-', ''):
+            raise ValueError(f"{name}: residues differ between {reference_file} and {test_file}")
+    return (names, residue_index_matrix([reference[n] for n in names]),
+            residue_index_matrix([test[n] for n in names]))
+
+
+def compare_orthogroup(og, align_dir='03_alignments', domain_dir='05_domains/hmmer',
+                       reference_sequence=REFERENCE_SEQUENCE, threshold=0.8, min_length=3):
+    """Scores, per-column table, disagreement regions and domain agreement of one orthogroup"""
+    names, mafft, prank = compare(os.path.join(align_dir, 'mafft', f"{og}_mafft.fasta"),
+                                  os.path.join(align_dir, 'prank', f"{og}_prank.fasta"))
+    forward = pair_scores(mafft, prank)
+    reverse = pair_scores(prank, mafft)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        agreement = forward['preserved'] / forward['pairs']
+    ref_row = names.index(reference_sequence) if reference_sequence in names else 0
+    columns = pd.DataFrame({'Column': np.arange(1, mafft.shape[1] + 1),
+                            'Residues': (mafft >= 0).sum(axis=0),
+                            'Pairs': forward['pairs'], 'Preserved_Pairs': forward['preserved'],
+                            'Agreement': agreement, 'Exact': forward['exact'],
+                            'Reference_Residue': np.where(mafft[ref_row] >= 0, mafft[ref_row] + 1, 0)})
+
+    domains = {}
+    domain_file = os.path.join(domain_dir, f"{og}_parsed.json")
+    if os.path.exists(domain_file):
+        with open(domain_file, 'r') as f:
+            domains = json.load(f)
+    reference_domains = domains.get(names[ref_row], [])
+
+    regions = []
+    for start, end, first, last, mean in disagreement_regions(agreement, mafft[ref_row], threshold, min_length):
+        overlaps = [hit['domain'] for hit in reference_domains
+                    if first is not None and hit['start'] <= last and hit['end'] >= first]
+        regions.append({'columns': f"{start + 1}-{end + 1}",
+                        'residues': f"{first}-{last}" if first is not None else 'gap',
+                        'agreement': mean, 'domains': ','.join(overlaps) or '-'})
+
+    return {'og': og, 'sequences': len(names), 'reference': names[ref_row],
+            'mafft_columns': mafft.shape[1], 'prank_columns': prank.shape[1],
+            'sp': forward['sp'], 'tc': forward['tc'], 'sp_reverse': reverse['sp'], 'tc_reverse': reverse['tc'],
+            'columns': columns, 'regions': regions,
+            'domains': domain_agreement(forward['residue'], names, domains)}
+
+
+def report_lines(result):
+    """Human-readable summary of compare_orthogroup()"""
+    lines = [f"{result['og']}: {result['sequences']} sequences, "
+             f"MAFFT {result['mafft_columns']} columns, PRANK {result['prank_columns']} columns",
+             f"  SP score (PRANK vs MAFFT): {result['sp']:.3f}   TC score: {result['tc']:.3f}",
+             f"  SP score (MAFFT vs PRANK): {result['sp_reverse']:.3f}   TC score: {result['tc_reverse']:.3f}"]
+    for domain, (n, mean) in sorted(result['domains'].items()):
+        lines.append(f"  {domain}: agreement {mean:.3f} over {n} annotated sequences")
+    if result['regions']:
+        lines.append(f"  Disagreement regions ({result['reference']} coordinates):")
+        for region in result['regions']:
+            lines.append(f"    columns {region['columns']}, residues {region['residues']}: "
+                         f"agreement {region['agreement']:.3f} [{region['domains']}]")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--og', nargs='+', help="orthogroups (default: every OG with both alignments)")
+    parser.add_argument('--align-dir', default='03_alignments')
+    parser.add_argument('--domain-dir', default='05_domains/hmmer')
+    parser.add_argument('--reference', default=REFERENCE_SEQUENCE,
+                        help="sequence giving the residue coordinates of the report")
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help="columns with a lower pair agreement count as disagreement")
+    parser.add_argument('--min-length', type=int, default=3, help="shortest reported region (columns)")
+    parser.add_argument('--out-dir', default='03_alignments/comparison')
+    args = parser.parse_args()
+
+    ogs = args.og or sorted(os.path.basename(path).replace('_mafft.fasta', '')
+                            for path in glob.glob(os.path.join(args.align_dir, 'mafft', '*_mafft.fasta'))
+                            if os.path.exists(path.replace('mafft', 'prank')))
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    summary = []
+    for og in ogs:
+        result = compare_orthogroup(og, args.align_dir, args.domain_dir, args.reference,
+                                    args.threshold, args.min_length)
+        for line in report_lines(result):
+            print(line)
+        result['columns'].to_csv(os.path.join(args.out_dir, f"{og}_columns.tsv"), sep='\t',
+                                 index=False, float_format='%.4f')
+        summary.append({'Orthogroup': og, 'Sequences': result['sequences'],
+                        'MAFFT_Columns': result['mafft_columns'], 'PRANK_Columns': result['prank_columns'],
+                        'SP': result['sp'], 'TC': result['tc'],
+                        'SP_Reverse': result['sp_reverse'], 'TC_Reverse': result['tc_reverse'],
+                        **{f"{domain}_Agreement": mean for domain, (_, mean) in result['domains'].items()},
+                        'Disagreement_Regions': ';'.join(f"{r['residues']}[{r['domains']}]"
+                                                         for r in result['regions']) or '-'})
+
+    summary_file = os.path.join(args.out_dir, 'alignment_scores.tsv')
+    pd.DataFrame(summary).to_csv(summary_file, sep='\t', index=False, float_format='%.4f')
+    print(f"\n✓ Compared {len(summary)} orthogroups")
+    print(f"Results saved to {summary_file}")
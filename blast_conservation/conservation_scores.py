@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""
+Vectorized per-column conservation metrics from an alignment count matrix
+
+column_scores() takes the columns x symbols count table of
+alignment_matrix.py (gap, 20 amino acids, X) and scores all columns at
+once:
+
+    Conservation_Score   1 - Shannon entropy / log2(min(20, residues)), the
+                         score of analyze_conservation_fixed.py
+    Residue              consensus residue
+    Gap_Fraction         gaps / sequences
+    JSD                  Jensen-Shannon divergence from the BLOSUM62
+                         background frequencies, times (1 - gap fraction)
+                         (Capra & Singh 2007)
+    Sum_of_Pairs         mean BLOSUM62 score over all residue pairs
+
+The counts may be summed sequence weights (sequence_weights.py); the
+entropy score is then still normalized by the number of residues in the
+column, and sum-of-pairs weights every pair by the product of its weights.
+"""
+
+import numpy as np
+import pandas as pd
+
+from alignment_matrix import AMINO_ACIDS, GAP, N_SYMBOLS, SYMBOLS, UNKNOWN
+
+_BLOSUM62_ORDER = 'ARNDCQEGHILKMFPSTWYV'
+_BLOSUM62_ROWS = """
+    A  4 -1 -2 -2  0 -1 -1  0 -2 -1 -1 -1 -1 -2 -1  1  0 -3 -2  0
+    R -1  5  0 -2 -3  1  0 -2  0 -3 -2  2 -1 -3 -2 -1 -1 -3 -2 -3
+    N -2  0  6  1 -3  0  0  0  1 -3 -3  0 -2 -3 -2  1  0 -4 -2 -3
+    D -2 -2  1  6 -3  0  2 -1 -1 -3 -4 -1 -3 -3 -1  0 -1 -4 -3 -3
+    C  0 -3 -3 -3  9 -3 -4 -3 -3 -1 -1 -3 -1 -2 -3 -1 -1 -2 -2 -1
+    Q -1  1  0  0 -3  5  2 -2  0 -3 -2  1  0 -3 -1  0 -1 -2 -1 -2
+    E -1  0  0  2 -4  2  5 -2  0 -3 -3  1 -2 -3 -1  0 -1 -3 -2 -2
+    G  0 -2  0 -1 -3 -2 -2  6 -2 -4 -4 -2 -3 -3 -2  0 -2 -2 -3 -3
+    H -2  0  1 -1 -3  0  0 -2  8 -3 -3 -1 -2 -1 -2 -1 -2 -2  2 -3
+    I -1 -3 -3 -3 -1 -3 -3 -4 -3  4  2 -3  1  0 -3 -2 -1 -3 -1  3
+    L -1 -2 -3 -4 -1 -2 -3 -4 -3  2  4 -2  2  0 -3 -2 -1 -2 -1  1
+    K -1  2  0 -1 -3  1  1 -2 -1 -3 -2  5 -1 -3 -1  0 -1 -3 -2 -2
+    M -1 -1 -2 -3 -1  0 -2 -3 -2  1  2 -1  5  0 -2 -1 -1 -1 -1  1
+    F -2 -3 -3 -3 -2 -3 -3 -3 -1  0  0 -3  0  6 -4 -2 -2  1  3 -1
+    P -1 -2 -2 -1 -3 -1 -1 -2 -2 -3 -3 -1 -2 -4  7 -1 -1 -4 -3 -2
+    S  1 -1  1  0 -1  0  0  0 -1 -2 -2  0 -1 -2 -1  4  1 -3 -2 -2
+    T  0 -1  0 -1 -1 -1 -1 -2 -2 -1 -1 -1 -1 -2 -1  1  5 -2 -2  0
+    W -3 -3 -4 -4 -2 -2 -3 -2 -2 -3 -2 -3 -1  1 -4 -3 -2 11  2 -3
+    Y -2 -2 -2 -3 -2 -1 -2 -3  2 -1 -1 -2 -1  3 -3 -2 -2  2  7 -1
+    V  0 -3 -3 -3 -1 -2 -2 -3 -3  3  1 -2  1 -1 -2 -2  0 -3 -1  4
+"""
+
+# Background amino acid frequencies of BLOSUM62, in _BLOSUM62_ORDER
+_BLOSUM62_BACKGROUND = [0.074, 0.052, 0.045, 0.054, 0.025, 0.034, 0.054, 0.074, 0.026, 0.068,
+                        0.099, 0.058, 0.025, 0.047, 0.039, 0.057, 0.051, 0.013, 0.032, 0.073]
+
+_ORDER = [_BLOSUM62_ORDER.index(aa) for aa in AMINO_ACIDS]
+BLOSUM62 = np.array([[int(v) for v in line.split()[1:]]
+                     for line in _BLOSUM62_ROWS.strip().splitlines()])[np.ix_(_ORDER, _ORDER)]
+BACKGROUND = np.array(_BLOSUM62_BACKGROUND)[_ORDER]
+
+JSD_PSEUDOCOUNT = 1e-6
+
+
+def entropy_score(counts, residues=None):
+    """Normalized Shannon entropy score of every column (0 for all-gap columns)
+
+    residues: number of residues per column for the normalization
+    (default: the column totals of counts).
+    """
+    weights = counts[:, 1:].astype(np.float64)
+    total = weights.sum(axis=1)
+    residues = total if residues is None else residues
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = weights / total[:, None]
+        entropy = -np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1)
+        max_entropy = np.log2(np.minimum(20, residues))
+        score = np.where(max_entropy > 0, 1 - entropy / max_entropy, 1.0)
+    return np.where(total > 0, score, 0.0)
+
+
+def consensus_codes(counts):
+    """Most common residue code of every column (GAP for all-gap columns)"""
+    consensus = (counts[:, 1:].argmax(axis=1) + 1).astype(np.uint8)
+    consensus[counts[:, 1:].sum(axis=1) == 0] = GAP
+    return consensus
+
+
+def jensen_shannon(counts, gap_penalty=True):
+    """JSD (bits) of the amino acid distribution of every column from the BLOSUM62 background"""
+    amino = counts[:, 1:UNKNOWN].astype(np.float64) + JSD_PSEUDOCOUNT
+    p = amino / amino.sum(axis=1, keepdims=True)
+    m = (p + BACKGROUND) / 2
+    jsd = 0.5 * (p * np.log2(p / m)).sum(axis=1) + 0.5 * (BACKGROUND * np.log2(BACKGROUND / m)).sum(axis=1)
+    if gap_penalty:
+        jsd *= 1 - gap_fraction(counts)
+    return jsd
+
+
+def sum_of_pairs(counts, squared_counts=None):
+    """Mean BLOSUM62 score of all pairs of amino acids in every column (0 below two residues)
+
+    squared_counts: column counts of the squared sequence weights, needed to
+    leave out self-pairs when counts are weighted (default: counts).
+    """
+    amino = counts[:, 1:UNKNOWN].astype(np.float64)
+    squared = amino if squared_counts is None else squared_counts[:, 1:UNKNOWN].astype(np.float64)
+    # Sum over pairs of different sequences: c'Bc - sum w_i^2 B_ii (twice the unordered sum)
+    pair_sum = ((amino @ BLOSUM62) * amino).sum(axis=1) - squared @ np.diag(BLOSUM62)
+    pairs = amino.sum(axis=1) ** 2 - squared.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(pairs > 0, pair_sum / pairs, 0.0)
+
+
+def gap_fraction(counts):
+    total = counts.sum(axis=1).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, counts[:, GAP] / total, 1.0)
+
+
+def column_scores(counts, consensus=None, residues=None, squared_counts=None):
+    """DataFrame with one row per column (see module docstring)
+
+    consensus, if given, replaces the argmax consensus codes, e.g. with
+    AlignmentMatrix.consensus() which breaks ties by first occurrence.
+    residues and squared_counts are needed for weighted counts, see
+    entropy_score() and sum_of_pairs().
+    """
+    if counts.shape[1] != N_SYMBOLS:
+        raise ValueError(f"Expected {N_SYMBOLS} symbol columns, got {counts.shape[1]}")
+    consensus = consensus_codes(counts) if consensus is None else consensus
+    return pd.DataFrame({
+        'Position': np.arange(1, len(counts) + 1),
+        'Conservation_Score': entropy_score(counts, residues),
+        'Residue': np.array(list(SYMBOLS))[consensus],
+        'Gap_Fraction': gap_fraction(counts),
+        'JSD': jensen_shannon(counts),
+        'Sum_of_Pairs': sum_of_pairs(counts, squared_counts),
+    })
+
+
+def alignment_scores(alignment, weights=None):
+    """column_scores() of an AlignmentMatrix, with sequence weights if given"""
+    if weights is None:
+        return column_scores(alignment.counts, alignment.consensus())
+    return column_scores(alignment.weighted_counts(weights),
+                         residues=alignment.residue_counts(),
+                         squared_counts=alignment.weighted_counts(weights ** 2))
@@ -10,10 +10,12 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
-from Bio import AlignIO
 from collections import Counter
 import os
 
+from alignment_matrix import GAP, encode, load_alignment
+from tile_renderer import MAX_FIGURE_ROWS, MAX_LABELLED_ROWS, build_pyramid, pool_to
+
 # Set style
 sns.set_style("whitegrid")
 plt.rcParams['figure.dpi'] = 300
@@ -77,17 +79,17 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
     conservation = cons_data['Conservation_Score'].values
     
     # Load alignment
-    alignment = AlignIO.read(alignment_file, 'fasta')
+    alignment = load_alignment(alignment_file)
     n_seqs = len(alignment)
-    aln_len = alignment.get_alignment_length()
+    aln_len = alignment.length
     
-    # Display only top 20 sequences
-    n_display = min(20, n_seqs)
+    # Display every sequence of the orthogroup
+    n_display = n_seqs
     
     # Get labels
     labels = []
     for i in range(n_display):
-        original_id = alignment[i].id
+        original_id = alignment.ids[i]
         full_label, species, protein = get_full_label(original_id)
         
         # Truncate if too long
@@ -96,26 +98,16 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
         
         labels.append(full_label)
     
-    # Create matrix
-    matrix = np.zeros((n_display, aln_len))
+    # Create matrix: column score where a sequence has the consensus residue
+    # of the column (from the conservation file), 0 elsewhere
+    consensus = encode([''.join(cons_data['Residue'].astype(str))])[0]
+    matches = (alignment.codes == consensus[None, :]) & (alignment.codes != GAP)
+    matrix = np.where(matches, conservation[None, :], 0.0)
     
-    for i in range(n_display):
-        for pos in range(aln_len):
-            aa = str(alignment[i].seq[pos])
-            column = alignment[:, pos]
-            non_gap = [a for a in column if a != '-']
-            if non_gap and aa != '-':
-                consensus = Counter(non_gap).most_common(1)[0][0]
-                if aa == consensus:
-                    matrix[i, pos] = conservation[pos]
-                else:
-                    matrix[i, pos] = 0
-            else:
-                matrix[i, pos] = 0
-    
-    # Create figure
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(18, 9), 
-                                    gridspec_kw={'height_ratios': [1, 4]})
+    # Create figure, taller for large orthogroups
+    heatmap_height = 7.2 if n_display <= 20 else min(7.2 + 0.12 * (n_display - 20), 18)
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(18, 1.8 + heatmap_height),
+                                    gridspec_kw={'height_ratios': [1.8, heatmap_height]})
     
     # Top panel: conservation line plot
     positions = np.arange(1, aln_len + 1)
@@ -131,14 +123,26 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
     ax1.grid(True, alpha=0.3)
     ax1.set_xticklabels([])
     
-    # Bottom panel: heatmap
+    # Bottom panel: heatmap, one rasterized image whatever the number of rows
+    if n_display > MAX_FIGURE_ROWS:
+        tile_dir = os.path.splitext(output_file)[0] + '_tiles'
+        build_pyramid(matrix.astype(np.float32), tile_dir, 'conservation',
+                      source=os.path.abspath(alignment_file))
+        print(f"  ✓ Full-resolution tiles: {tile_dir}/")
+        matrix = pool_to(matrix.astype(np.float32), MAX_FIGURE_ROWS, aln_len)
     im = ax2.imshow(matrix, aspect='auto', cmap='RdYlGn', interpolation='nearest', 
-                    vmin=0, vmax=1)
+                    vmin=0, vmax=1, rasterized=True,
+                    extent=(-0.5, aln_len - 0.5, n_display - 0.5, -0.5))
     
     # Set labels - species in italics, protein in regular
-    ax2.set_yticks(range(n_display))
-    ax2.set_yticklabels(labels, fontsize=9, style='italic')
-    ax2.set_ylabel('Species & Protein (top 20)', fontsize=12, fontweight='bold')
+    if n_display <= MAX_LABELLED_ROWS:
+        ax2.set_yticks(range(n_display))
+        ax2.set_yticklabels(labels, fontsize=9, style='italic')
+    else:
+        step = int(np.ceil(n_display / MAX_LABELLED_ROWS))
+        ax2.set_yticks(range(0, n_display, step))
+        ax2.set_yticklabels(labels[::step], fontsize=7, style='italic')
+    ax2.set_ylabel(f'Species & Protein (all {n_display})', fontsize=12, fontweight='bold')
     
     # X-axis
     ax2.set_xlabel('Position in Domain', fontsize=12, fontweight='bold')
@@ -155,10 +159,10 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
     plt.close()
     
     # Count proteins
-    protein_counts = Counter([get_full_label(alignment[i].id)[2] for i in range(n_display)])
+    protein_counts = Counter([get_full_label(alignment.ids[i])[2] for i in range(n_display)])
     
     print(f"  ✓ Saved: {output_file}")
-    print(f"  ✓ Showing top {n_display}/{n_seqs} sequences")
+    print(f"  ✓ Showing {n_display}/{n_seqs} sequences")
     print(f"  ✓ Protein distribution:", dict(protein_counts))
     print("")
 
@@ -1,6 +1,6 @@
 #!/bin/bash
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 echo "========================================"
 echo "Creating Publication-Quality Trees"
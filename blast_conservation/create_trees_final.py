@@ -8,6 +8,8 @@ import matplotlib.patches as mpatches
 import os
 import re
 
+from taxonomy_index import CLADE_COLORS, load_taxonomy
+
 # Load name mapping
 name_mapping = {}
 with open('04_phylogeny/accession_to_species.txt', 'r') as f:
@@ -17,8 +19,16 @@ with open('04_phylogeny/accession_to_species.txt', 'r') as f:
             if len(parts) == 2:
                 name_mapping[parts[0]] = parts[1]
 
+# Offline NCBI taxonomy (taxonomy_index.py), when it has been built
+taxonomy = load_taxonomy()
+
 def get_color(species_name):
     """Get color based on taxonomy"""
+    if taxonomy is not None:
+        clade = taxonomy.clade_of(species_name)
+        if clade != 'Other':
+            return CLADE_COLORS[clade]
+
     if any(x in species_name for x in ['Homo_sapiens', 'Mus_musculus', 'Bos_taurus', 'Canis_lupus']):
         return '#4169E1'
     elif any(x in species_name for x in ['Danio', 'Oryzias', 'Takifugu', 'Salmo']):
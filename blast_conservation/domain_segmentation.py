@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+"""
+Sliding-window conservation and data-driven domain boundaries of full-length alignments
+
+Works on the full-length 03_alignments/{mafft,prank} alignments rather than
+the HMMER-extracted bHLH fragments:
+
+1. Column profile: Henikoff-weighted conservation score (conservation_scores.py)
+   times the fraction of sequences with a residue, so gappy columns do not
+   look conserved.
+2. Sliding-window means of the profile for every window size (default 5 to
+   51), each in O(L) from one cumulative sum.
+3. Change points: optimal partition of the profile into segments of
+   constant mean (PELT, L2 cost from cumulative sums, penalty scaled to the
+   noise of the profile). Runs of segments with a mean above --threshold
+   are conserved blocks; a block is named after the HMMER domain of the
+   reference sequence it overlaps most (05_domains/hmmer/<OG>_parsed.json),
+   or numbered.
+4. Every block is mapped to residue coordinates of every sequence, giving
+   the domain layout of each protein (visualize_domains_fixed.py draws the
+   architecture diagram from it).
+
+Output, in 05_domains/segmentation/:
+
+    <OG>_<aligner>_windows.tsv    Column, Profile, W5, W9, ...
+    <OG>_<aligner>_blocks.tsv     segments with mean profile and class
+    <OG>_<aligner>_domains.json   {sequence: {"length": n, "domains": [...]}}
+"""
+
+import argparse
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from alignment_matrix import GAP, load_alignment
+from conservation_scores import alignment_scores
+from sequence_weights import load_weights
+
+WINDOWS = (5, 9, 15, 21, 31, 51)
+MIN_SEGMENT = 8
+PENALTY_FACTOR = 3.0
+CONSERVED_THRESHOLD = 0.5
+REFERENCE_SEQUENCES = ('NP_002469.2', 'NP_005584.2', 'NP_002470.2')  # human MYOD1, MYF5, MYOG
+
+
+def conservation_profile(alignment, weights=None):
+    """Conservation score times residue occupancy of every column"""
+    scores = alignment_scores(alignment, weights)
+    return (scores['Conservation_Score'] * (1 - scores['Gap_Fraction'])).to_numpy()
+
+
+def window_means(profile, window):
+    """Centered sliding-window mean (windows shrink at the ends), O(L)"""
+    n = len(profile)
+    total = np.concatenate(([0.0], np.cumsum(profile)))
+    positions = np.arange(n)
+    start = np.clip(positions - window // 2, 0, n)
+    end = np.clip(positions - window // 2 + window, 0, n)
+    return (total[end] - total[start]) / (end - start)
+
+
+def sliding_windows(profile, windows=WINDOWS):
+    """{window: window means} for every window size"""
+    return {window: window_means(profile, window) for window in windows}
+
+
+def noise_level(profile):
+    """Robust standard deviation of the profile noise (MAD of first differences)"""
+    if len(profile) < 3:
+        return 0.0
+    return float(np.median(np.abs(np.diff(profile))) / (0.6745 * np.sqrt(2)))
+
+
+def change_points(profile, penalty=None, min_size=MIN_SEGMENT):
+    """Segment ends (exclusive, last = L) of the optimal piecewise-constant fit (PELT)"""
+    n = len(profile)
+    if n < 2 * min_size:
+        return [n]
+    if penalty is None:
+        penalty = PENALTY_FACTOR * max(noise_level(profile), 1e-3) ** 2 * np.log(n)
+
+    s1 = np.concatenate(([0.0], np.cumsum(profile)))
+    s2 = np.concatenate(([0.0], np.cumsum(profile ** 2)))
+
+    def cost(starts, end):
+        length = end - starts
+        return s2[end] - s2[starts] - (s1[end] - s1[starts]) ** 2 / length
+
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    previous = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.zeros(0, dtype=np.int64)
+    pruned = {}
+    for t in range(min_size, n + 1):
+        # Starts pruned at t - min_size: t is now an admissible start instead
+        if t in pruned:
+            candidates = candidates[~np.isin(candidates, pruned.pop(t))]
+        # New admissible start: a segment may begin right after a valid end
+        start = t - min_size
+        if start == 0 or start >= min_size:
+            candidates = np.append(candidates, start)
+        totals = best[candidates] + cost(candidates, t) + penalty
+        i = totals.argmin()
+        best[t], previous[t] = totals[i], candidates[i]
+        # Starts that can never beat t as a start; t only becomes a start
+        # for ends from t + min_size on, so they are dropped only then
+        beaten = candidates[totals - penalty > best[t]]
+        if len(beaten):
+            pruned[t + min_size] = beaten
+
+    ends, t = [], n
+    while t > 0:
+        ends.append(int(t))
+        t = previous[t]
+    return ends[::-1]
+
+
+def segment_blocks(profile, ends, threshold=CONSERVED_THRESHOLD):
+    """[(start column, end column (exclusive), mean profile, conserved)] of the segments
+
+    Neighbouring segments of the same class are merged into one block.
+    """
+    spans = []
+    start = 0
+    for end in ends:
+        conserved = bool(profile[start:end].mean() >= threshold)
+        if spans and spans[-1][2] == conserved:
+            spans[-1][1] = end
+        else:
+            spans.append([start, end, conserved])
+        start = end
+    return [(start, end, float(profile[start:end].mean()), conserved) for start, end, conserved in spans]
+
+
+def residue_positions(codes):
+    """1-based residue number of every cell, 0 for gaps"""
+    residue = codes != GAP
+    return np.where(residue, np.cumsum(residue, axis=1), 0)
+
+
+def block_coordinates(positions, start, end):
+    """(first, last) residue of every sequence inside a column range, (0, 0) if all gaps"""
+    window = positions[:, start:end]
+    present = window > 0
+    first = np.where(present.any(axis=1), np.where(present, window, np.iinfo(np.int64).max).min(axis=1), 0)
+    return first, window.max(axis=1)
+
+
+def name_blocks(blocks, positions, ids, hmmer_domains, references=REFERENCE_SEQUENCES):
+    """Name of every conserved block: best-overlapping HMMER domain, else Block<n>"""
+    reference_rows = [ids.index(ref) for ref in references if ref in ids and ref in hmmer_domains]
+    if not reference_rows:
+        reference_rows = [ids.index(seq_id) for seq_id in ids if seq_id in hmmer_domains][:1]
+
+    names = {}
+    numbered = 0
+    for index, (start, end, _, conserved) in enumerate(blocks):
+        if not conserved:
+            continue
+        overlaps = {}
+        for row in reference_rows:
+            first, last = block_coordinates(positions[row:row + 1], start, end)
+            for hit in hmmer_domains[ids[row]]:
+                overlap = min(last[0], hit['end']) - max(first[0], hit['start']) + 1
+                if first[0] and overlap > 0:
+                    overlaps[hit['domain']] = max(overlaps.get(hit['domain'], 0), overlap)
+        if overlaps:
+            names[index] = max(overlaps, key=overlaps.get)
+        else:
+            numbered += 1
+            names[index] = f"Block{numbered}"
+    return names
+
+
+def segment_alignment(alignment_file, domain_file=None, windows=WINDOWS, threshold=CONSERVED_THRESHOLD,
+                      min_size=MIN_SEGMENT, penalty=None, weighting='henikoff'):
+    """(windows table, blocks table, per-protein domains) of one full-length alignment"""
+    alignment = load_alignment(alignment_file)
+    weights = load_weights(alignment_file, weighting, alignment=alignment) if weighting else None
+    profile = conservation_profile(alignment, weights)
+
+    window_table = pd.DataFrame({'Column': np.arange(1, alignment.length + 1), 'Profile': profile})
+    for window, means in sliding_windows(profile, windows).items():
+        window_table[f"W{window}"] = means
+
+    blocks = segment_blocks(profile, change_points(profile, penalty, min_size), threshold)
+    positions = residue_positions(alignment.codes)
+    hmmer_domains = {}
+    if domain_file and os.path.exists(domain_file):
+        with open(domain_file, 'r') as f:
+            hmmer_domains = json.load(f)
+    names = name_blocks(blocks, positions, alignment.ids, hmmer_domains)
+
+    block_table = pd.DataFrame([{'Block': names.get(i, '-'), 'Start_Column': start + 1, 'End_Column': end,
+                                 'Mean_Profile': mean, 'Class': 'conserved' if conserved else 'variable'}
+                                for i, (start, end, mean, conserved) in enumerate(blocks)])
+
+    lengths = positions.max(axis=1)
+    proteins = {seq_id: {'length': int(length), 'domains': []} for seq_id, length in zip(alignment.ids, lengths)}
+    for index, name in names.items():
+        start, end = blocks[index][:2]
+        first, last = block_coordinates(positions, start, end)
+        for seq_id, a, b in zip(alignment.ids, first.tolist(), last.tolist()):
+            if a:
+                proteins[seq_id]['domains'].append({'name': name, 'start': a, 'end': b})
+    return window_table, block_table, proteins
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--og', nargs='+', help="orthogroups (default: every OG with a full-length alignment)")
+    parser.add_argument('--aligners', nargs='+', default=['mafft', 'prank'], choices=['mafft', 'prank'])
+    parser.add_argument('--align-dir', default='03_alignments')
+    parser.add_argument('--domain-dir', default='05_domains/hmmer')
+    parser.add_argument('--windows', nargs='+', type=int, default=list(WINDOWS))
+    parser.add_argument('--threshold', type=float, default=CONSERVED_THRESHOLD,
+                        help="segments with a higher mean profile are conserved blocks")
+    parser.add_argument('--min-size', type=int, default=MIN_SEGMENT, help="shortest segment (columns)")
+    parser.add_argument('--penalty', type=float, help="change-point penalty (default: from the profile noise)")
+    parser.add_argument('--out-dir', default='05_domains/segmentation')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for aligner in args.aligners:
+        files = sorted(glob.glob(os.path.join(args.align_dir, aligner, f"*_{aligner}.fasta")))
+        ogs = args.og or [os.path.basename(path).replace(f"_{aligner}.fasta", '') for path in files]
+        for og in ogs:
+            alignment_file = os.path.join(args.align_dir, aligner, f"{og}_{aligner}.fasta")
+            windows, blocks, proteins = segment_alignment(
+                alignment_file, os.path.join(args.domain_dir, f"{og}_parsed.json"),
+                args.windows, args.threshold, args.min_size, args.penalty)
+
+            prefix = os.path.join(args.out_dir, f"{og}_{aligner}")
+            windows.to_csv(f"{prefix}_windows.tsv", sep='\t', index=False, float_format='%.4f')
+            blocks.to_csv(f"{prefix}_blocks.tsv", sep='\t', index=False, float_format='%.4f')
+            with open(f"{prefix}_domains.json", 'w') as f:
+                json.dump(proteins, f, indent=1)
+
+            conserved = blocks[blocks['Class'] == 'conserved']
+            print(f"  ✓ {og} ({aligner}): {len(blocks)} segments, {len(conserved)} conserved blocks: "
+                  + ', '.join(f"{row.Block} {row.Start_Column}-{row.End_Column}" for row in conserved.itertuples()))
+
+    print(f"Results saved to {args.out_dir}")
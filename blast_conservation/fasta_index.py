@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+"""
+faidx-style byte-offset index over proteome FASTAs and orthogroup sequence extraction
+
+The index is built once and kept next to the proteomes as
+.fasta_index.tsv. Besides the samtools faidx columns (name, length,
+sequence offset, bases per line, bytes per line) every entry records its
+FASTA file and the byte range of the whole record, header included:
+
+    # <file>  <size>  <mtime_ns>                       one line per proteome
+    name  length  offset  linebases  linewidth  file  record_start  record_end
+
+Proteomes whose size or mtime changed are re-indexed on the next run.
+
+extract_orthogroups() reads Orthogroups.txt, looks up every accession in
+the index and writes all <OG>_sequences.fasta files in one pass: each
+proteome is memory-mapped once and the records are copied byte for byte,
+in the accession order of the orthogroup.
+"""
+
+import argparse
+import glob
+import mmap
+import os
+import time
+
+INDEX_FILE = '.fasta_index.tsv'
+
+
+def index_fasta(fasta_file):
+    """[(name, length, offset, linebases, linewidth, record_start, record_end)]"""
+    entries = []
+    with open(fasta_file, 'rb') as f:
+        position = 0
+        current = None
+        for line in f:
+            start, position = position, position + len(line)
+            if line.startswith(b'>'):
+                if current:
+                    entries.append(_close_entry(current, start))
+                name = line[1:].split(None, 1)[0].decode() if line[1:].strip() else ''
+                current = {'name': name, 'record_start': start, 'offset': position,
+                           'length': 0, 'linebases': 0, 'linewidth': 0}
+            elif current is not None:
+                bases = len(line.rstrip(b'\r\n'))
+                if bases and not current['linebases']:
+                    current['linebases'], current['linewidth'] = bases, len(line)
+                current['length'] += bases
+        if current:
+            entries.append(_close_entry(current, position))
+    return entries
+
+
+def _close_entry(entry, end):
+    return (entry['name'], entry['length'], entry['offset'], entry['linebases'],
+            entry['linewidth'], entry['record_start'], end)
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class FastaIndex:
+    """Persistent record index of a set of FASTA files (see module docstring)"""
+
+    def __init__(self, fasta_files, index_file):
+        self.index_file = index_file
+        self.files = [os.path.abspath(path) for path in fasta_files]
+        self.entries = {}
+
+        stored_keys, stored = self._read()
+        changed = False
+        for path in self.files:
+            if stored_keys.get(path) == _file_key(path):
+                entries = stored.get(path, [])
+            else:
+                entries = index_fasta(path)
+                changed = True
+            for entry in entries:
+                self.entries.setdefault(entry[0], []).append((path,) + entry[1:])
+
+        if changed or set(stored_keys) != set(self.files):
+            self._write()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.entries.values())
+
+    # Files are stored relative to the index, so the project can be moved
+    def _relpath(self, path):
+        return os.path.relpath(path, os.path.dirname(os.path.abspath(self.index_file)))
+
+    def _abspath(self, path):
+        return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(self.index_file)), path))
+
+    def _read(self):
+        keys, stored = {}, {}
+        if not os.path.exists(self.index_file):
+            return keys, stored
+        with open(self.index_file, 'r') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if parts[0] == '#':
+                    keys[self._abspath(parts[1])] = (int(parts[2]), int(parts[3]))
+                else:
+                    name, path = parts[0], self._abspath(parts[5])
+                    numbers = [int(x) for x in parts[1:5] + parts[6:8]]
+                    stored.setdefault(path, []).append((name,) + tuple(numbers))
+        return keys, stored
+
+    def _write(self):
+        tmp = f"{self.index_file}.tmp"
+        with open(tmp, 'w') as f:
+            for path in self.files:
+                size, mtime_ns = _file_key(path)
+                f.write(f"#\t{self._relpath(path)}\t{size}\t{mtime_ns}\n")
+            for name, entries in self.entries.items():
+                for path, length, offset, linebases, linewidth, start, end in entries:
+                    f.write(f"{name}\t{length}\t{offset}\t{linebases}\t{linewidth}\t"
+                            f"{self._relpath(path)}\t{start}\t{end}\n")
+        os.replace(tmp, self.index_file)
+
+    def locate(self, name):
+        """[(file, record_start, record_end)] of every record with this ID"""
+        return [(entry[0], entry[5], entry[6]) for entry in self.entries.get(name, [])]
+
+    def fetch(self, names):
+        """{name: record bytes} for the given IDs, reading each file once
+
+        Records of an ID found in several files are concatenated in file
+        order; unknown IDs are left out.
+        """
+        by_file = {}
+        for name in dict.fromkeys(names):
+            for path, start, end in self.locate(name):
+                by_file.setdefault(path, []).append((start, end, name))
+
+        parts = {}
+        for path in self.files:
+            if path not in by_file:
+                continue
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for start, end, name in sorted(by_file[path]):
+                    parts.setdefault(name, []).append(data[start:end])
+        return {name: b''.join(chunks) for name, chunks in parts.items()}
+
+
+def read_orthogroups(orthogroups_file):
+    """{orthogroup: [accessions]} from OrthoFinder's Orthogroups.txt"""
+    orthogroups = {}
+    with open(orthogroups_file, 'r') as f:
+        for line in f:
+            og, sep, members = line.partition(':')
+            if sep:
+                orthogroups[og.strip()] = members.split()
+    return orthogroups
+
+
+def extract_orthogroups(index, orthogroups, out_dir, selected=None):
+    """Write <OG>_accessions.txt and <OG>_sequences.fasta for every orthogroup
+
+    Returns {orthogroup: (accessions, sequences written)}.
+    """
+    if selected:
+        orthogroups = {og: orthogroups[og] for og in selected}
+    os.makedirs(out_dir, exist_ok=True)
+
+    records = index.fetch(acc for members in orthogroups.values() for acc in members)
+
+    counts = {}
+    for og, members in orthogroups.items():
+        found = [records[acc] for acc in members if acc in records]
+        _write_if_changed(os.path.join(out_dir, f"{og}_accessions.txt"),
+                          ''.join(f"{acc}\n" for acc in members).encode())
+        _write_if_changed(os.path.join(out_dir, f"{og}_sequences.fasta"), b''.join(found))
+        counts[og] = (len(members), sum(record.count(b'>') for record in found))
+    return counts
+
+
+def _write_if_changed(path, data):
+    """Write data unless the file already holds it, keeping the mtime of unchanged outputs"""
+    if os.path.exists(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--proteomes', nargs='+',
+                        help="proteome FASTA files (default: 03_orthofinder/proteomes/*.fasta)")
+    parser.add_argument('--orthogroups', help="Orthogroups.txt (default: latest OrthoFinder results)")
+    parser.add_argument('--out-dir', default='03_alignments')
+    parser.add_argument('--og', nargs='+', help="only these orthogroups (default: all)")
+    parser.add_argument('--index', help=f"index file (default: {INDEX_FILE} next to the proteomes)")
+    args = parser.parse_args()
+
+    proteomes = args.proteomes or sorted(glob.glob('03_orthofinder/proteomes/*.fasta'))
+    index_file = args.index or os.path.join(os.path.dirname(proteomes[0]), INDEX_FILE)
+    orthogroups_file = args.orthogroups or sorted(
+        glob.glob('03_orthofinder/results/Results_*/Orthogroups/Orthogroups.txt'))[-1]
+
+    start = time.time()
+    index = FastaIndex(proteomes, index_file)
+    print(f"Indexed {len(index)} sequences in {len(proteomes)} proteomes")
+
+    counts = extract_orthogroups(index, read_orthogroups(orthogroups_file), args.out_dir, args.og)
+    for og, (n_accessions, n_sequences) in counts.items():
+        print(f"  {og}: {n_accessions} accessions, {n_sequences} sequences extracted")
+    print(f"✓ Extracted {len(counts)} orthogroups to {args.out_dir}/ ({time.time() - start:.2f}s)")
@@ -64,6 +64,10 @@ for og in ['OG0000000', 'OG0000001']:
         print(f"    Moderately conserved (0.7-0.9): {moderate} positions ({moderate/len(conservation)*100:.1f}%)")
         print(f"    Variable (<0.7): {variable} positions ({variable/len(conservation)*100:.1f}%)")
         print(f"    Mean conservation: {conservation.mean():.3f}")
+        if 'Class_Stability' in cons_data:
+            stable = int((cons_data['Class_Stability'] >= 0.9).sum())
+            print(f"    Class stable in >=90% of bootstrap replicates: {stable} positions "
+                  f"({stable/len(conservation)*100:.1f}%)")
 
 print("\n" + "="*70)
 print("Analysis Complete!")
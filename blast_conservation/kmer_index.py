@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+"""
+Reduced-alphabet k-mer inverted index over proteomes, a prefilter for homolog searches
+
+Sequences are recoded to a 10-letter reduced amino-acid alphabet
+(Murphy et al. 2000) and every distinct k-mer of a sequence is posted to
+an inverted index stored under .kmer_index/:
+
+    meta.json            k, proteome files (size, mtime) and segment list
+    sequences.tsv        sequence number, proteome, sequence ID, k-mer count
+    seg<N>.offsets.npy   CSR offsets, one entry per possible k-mer (+1)
+    seg<N>.ids.npy       sequence numbers of every posting list
+
+A query scores every indexed sequence by the number of distinct k-mers it
+shares with the query, by one bincount over the gathered posting lists,
+and returns a ranked shortlist for the alignment search
+(run_homolog_search.py). New or changed proteomes are added as a new
+segment; sequences of changed or removed proteomes are only masked, until
+--compact rewrites the index as a single segment.
+"""
+
+import argparse
+import glob
+import json
+import os
+import numpy as np
+
+INDEX_DIR = '.kmer_index'
+INDEX_VERSION = 1
+DEFAULT_K = 5
+
+# Murphy 10-letter reduced alphabet; other residues (X, B, Z, U, *) break k-mers
+REDUCED_ALPHABET = ['LVIM', 'C', 'A', 'G', 'ST', 'P', 'FYW', 'EDNQ', 'KR', 'H']
+
+_LOOKUP = np.full(256, 255, dtype=np.uint8)
+for _i, _group in enumerate(REDUCED_ALPHABET):
+    for _aa in _group:
+        _LOOKUP[ord(_aa)] = _LOOKUP[ord(_aa.lower())] = _i
+
+
+def read_sequences(fasta_file):
+    """[(sequence ID, sequence)] of a FASTA file"""
+    records = []
+    with open(fasta_file, 'r') as f:
+        for block in f.read().split('>')[1:]:
+            header, _, sequence = block.partition('\n')
+            if header.strip():
+                records.append((header.split()[0], sequence.replace('\n', '').strip()))
+    return records
+
+
+def proteome_name(fasta_file):
+    """Proteome label from a FASTA file name (Homo_sapiens.fasta -> Homo_sapiens)"""
+    return os.path.splitext(os.path.basename(fasta_file))[0]
+
+
+def sequence_kmers(sequence, k=DEFAULT_K):
+    """Sorted distinct reduced-alphabet k-mer codes of a sequence"""
+    codes = _LOOKUP[np.frombuffer(sequence.encode('ascii', 'replace'), dtype=np.uint8)]
+    if len(codes) < k:
+        return np.empty(0, dtype=np.int64)
+
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    valid = (windows != 255).all(axis=1)
+    powers = len(REDUCED_ALPHABET) ** np.arange(k - 1, -1, -1, dtype=np.int64)
+    return np.unique(windows[valid].astype(np.int64) @ powers)
+
+
+def build_segment(kmers, ids, k=DEFAULT_K):
+    """CSR (offsets, ids) of the postings (kmers[i], ids[i]), ids ascending per k-mer"""
+    order = np.lexsort((ids, kmers))
+    counts = np.bincount(kmers, minlength=len(REDUCED_ALPHABET) ** k)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, ids[order].astype(np.int32)
+
+
+class KmerIndex:
+    """Persistent k-mer inverted index in index_dir"""
+
+    def __init__(self, index_dir=INDEX_DIR, k=DEFAULT_K):
+        self.index_dir = index_dir
+        self.meta_file = os.path.join(index_dir, 'meta.json')
+        self.sequences_file = os.path.join(index_dir, 'sequences.tsv')
+
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r') as f:
+                self.meta = json.load(f)
+            if self.meta.get('version') != INDEX_VERSION:
+                raise ValueError(f"{index_dir} was built by another index version, remove it to rebuild")
+        else:
+            self.meta = {'version': INDEX_VERSION, 'k': k, 'proteomes': {},
+                         'segments': [], 'next_segment': 0}
+
+        self.k = self.meta['k']
+        self.proteomes, self.names, self.lengths = [], [], []
+        if os.path.exists(self.sequences_file):
+            with open(self.sequences_file, 'r') as f:
+                for line in f:
+                    _, proteome, name, length = line.rstrip('\n').split('\t')
+                    self.proteomes.append(proteome)
+                    self.names.append(name)
+                    self.lengths.append(int(length))
+        self._segments = None
+
+    def __len__(self):
+        return int(self.live().sum())
+
+    def live(self):
+        """Boolean mask of sequences of proteomes that are still indexed"""
+        indexed = {entry['name'] for entry in self.meta['proteomes'].values()}
+        return np.array([p in indexed for p in self.proteomes], dtype=bool)
+
+    def segments(self):
+        """Memory-mapped (offsets, ids) of every segment"""
+        if self._segments is None:
+            self._segments = [
+                (np.load(os.path.join(self.index_dir, f"{seg}.offsets.npy"), mmap_mode='r'),
+                 np.load(os.path.join(self.index_dir, f"{seg}.ids.npy"), mmap_mode='r'))
+                for seg in self.meta['segments']]
+        return self._segments
+
+    def _save_meta(self):
+        tmp = f"{self.meta_file}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp, self.meta_file)
+
+    def _add_segment(self, records):
+        """Index [(proteome, name, sequence)] as one new segment"""
+        kmer_sets = [sequence_kmers(sequence, self.k) for _, _, sequence in records]
+        lengths = [len(kmers) for kmers in kmer_sets]
+        ids = np.repeat(np.arange(len(self.names), len(self.names) + len(records)), lengths)
+        self._write_segment(*build_segment(np.concatenate(kmer_sets), ids, self.k))
+
+        with open(self.sequences_file, 'a') as f:
+            for (proteome, name, _), kmers in zip(records, kmer_sets):
+                f.write(f"{len(self.names)}\t{proteome}\t{name}\t{len(kmers)}\n")
+                self.proteomes.append(proteome)
+                self.names.append(name)
+                self.lengths.append(len(kmers))
+
+        self._segments = None
+
+    def _write_segment(self, offsets, ids):
+        seg = f"seg{self.meta['next_segment']}"
+        np.save(os.path.join(self.index_dir, f"{seg}.offsets.npy"), offsets)
+        np.save(os.path.join(self.index_dir, f"{seg}.ids.npy"), ids)
+        self.meta['segments'].append(seg)
+        self.meta['next_segment'] += 1
+
+    def update(self, fasta_files, remove_missing=False):
+        """Index new or changed proteomes, returns the number of sequences added
+
+        Proteomes whose size and mtime are unchanged are skipped. With
+        remove_missing, indexed proteomes not among fasta_files are dropped.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        indexed = self.meta['proteomes']
+        paths = {os.path.abspath(path): path for path in fasta_files}
+
+        if remove_missing:
+            for path in list(indexed):
+                if path not in paths:
+                    del indexed[path]
+
+        records = []
+        for path, given in paths.items():
+            stat = os.stat(path)
+            key = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            entry = indexed.get(path)
+            if entry and entry['size'] == key['size'] and entry['mtime_ns'] == key['mtime_ns']:
+                continue
+
+            # A changed proteome gets a fresh label (<name>#<n>), masking its
+            # old sequences
+            name = proteome_name(given)
+            taken = {e['name'] for p, e in indexed.items() if p != path} | set(self.proteomes)
+            label, n = name, 1
+            while label in taken:
+                n += 1
+                label = f"{name}#{n}"
+
+            indexed[path] = {'name': label, **key}
+            records.extend((label, seq_id, sequence) for seq_id, sequence in read_sequences(given))
+
+        if records:
+            self._add_segment(records)
+        self._save_meta()
+        return len(records)
+
+    def compact(self):
+        """Rewrite the live sequences as a single segment"""
+        live = self.live()
+        new_ids = np.cumsum(live) - 1
+
+        kmers, ids = [], []
+        for offsets, seg_ids in self.segments():
+            seg_ids = np.asarray(seg_ids)
+            seg_kmers = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+            keep = live[seg_ids]
+            kmers.append(seg_kmers[keep])
+            ids.append(new_ids[seg_ids[keep]])
+
+        old = self.meta['segments']
+        self.meta['segments'] = []
+        if kmers:
+            self._write_segment(*build_segment(np.concatenate(kmers), np.concatenate(ids), self.k))
+
+        kept = np.flatnonzero(live).tolist()
+        self.proteomes = [self.proteomes[i] for i in kept]
+        self.names = [self.names[i] for i in kept]
+        self.lengths = [self.lengths[i] for i in kept]
+        tmp = f"{self.sequences_file}.tmp"
+        with open(tmp, 'w') as f:
+            for i, row in enumerate(zip(self.proteomes, self.names, self.lengths)):
+                f.write(f"{i}\t{row[0]}\t{row[1]}\t{row[2]}\n")
+        os.replace(tmp, self.sequences_file)
+
+        self._save_meta()
+        self._segments = None
+        for seg in old:
+            for suffix in ('offsets.npy', 'ids.npy'):
+                os.remove(os.path.join(self.index_dir, f"{seg}.{suffix}"))
+
+    def scores(self, sequence):
+        """(shared k-mer counts per indexed sequence, number of query k-mers)"""
+        kmers = sequence_kmers(sequence, self.k)
+        shared = np.zeros(len(self.names), dtype=np.int64)
+        for offsets, ids in self.segments():
+            starts, ends = offsets[kmers], offsets[kmers + 1]
+            lengths = ends - starts
+            if not lengths.sum():
+                continue
+            # Gather all posting lists of the query k-mers at once
+            position = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+            position += np.arange(lengths.sum())
+            shared += np.bincount(ids[position], minlength=len(shared))
+        shared[~self.live()] = 0
+        return shared, len(kmers)
+
+    def query(self, sequence, top=50, min_shared=1):
+        """Ranked [(proteome, sequence ID, shared k-mers, score)] candidates
+
+        score is the shared k-mer count divided by the k-mer count of the
+        shorter of query and candidate.
+        """
+        shared, n_query = self.scores(sequence)
+        hits = np.flatnonzero(shared >= min_shared)
+        if not len(hits):
+            return []
+        lengths = np.asarray(self.lengths)[hits]
+        score = shared[hits] / np.maximum(np.minimum(lengths, n_query), 1)
+        order = np.lexsort((-score, -shared[hits]))[:top]
+        return [(self.proteomes[i].split('#')[0], self.names[i], int(shared[i]), float(score[j]))
+                for j, i in zip(order.tolist(), hits[order].tolist())]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--index-dir', default=os.path.join('03_orthofinder', INDEX_DIR))
+    parser.add_argument('--proteomes', nargs='*',
+                        help="proteome FASTA files to index (default: 03_orthofinder/proteomes/*.fasta)")
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help="k-mer length of a new index")
+    parser.add_argument('--remove-missing', action='store_true',
+                        help="drop indexed proteomes not given in --proteomes")
+    parser.add_argument('--compact', action='store_true', help="merge all segments into one")
+    parser.add_argument('--query', nargs='*', default=[], help="query FASTA files to rank candidates for")
+    parser.add_argument('--top', type=int, default=50)
+    args = parser.parse_args()
+
+    index = KmerIndex(args.index_dir, args.k)
+
+    if args.proteomes is not None or not args.query:
+        proteomes = args.proteomes or sorted(glob.glob('03_orthofinder/proteomes/*.fasta'))
+        n_added = index.update(proteomes, args.remove_missing)
+        print(f"Indexed {n_added} new sequences ({len(index)} total, k={index.k})")
+    if args.compact:
+        index.compact()
+        print(f"Compacted {args.index_dir}")
+
+    for query_file in args.query:
+        for seq_id, sequence in read_sequences(query_file):
+            print(f"\n{seq_id}")
+            print("proteome\tsequence_id\tshared_kmers\tscore")
+            for proteome, name, shared, score in index.query(sequence, args.top):
+                print(f"{proteome}\t{name}\t{shared}\t{score:.3f}")
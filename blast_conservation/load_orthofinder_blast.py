@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""
+Load OrthoFinder's pairwise Blast{i}_{j}.txt.gz files into a columnar hit store
+
+OrthoFinder keeps the DIAMOND hits between every pair of species in its
+WorkingDirectory, keyed by internal "<species>_<sequence>" IDs. All files
+are decompressed and parsed in a process pool; the IDs are translated to
+one global integer per sequence (species offset + sequence number, from
+SequenceIDs.txt) and every hit is written to flat binary columns under
+<WorkingDirectory>/.hit_store/:
+
+    query.i32 subject.i32           global sequence numbers
+    pident.f32 bitscore.f32         percent identity, bit score
+    log10_evalue.f32                log10 of the e-value (-inf for 0)
+    length.i32 mismatch.i32 ...     the remaining integer columns
+    sequences.tsv                   global number, species, accession
+    meta.json                       row ranges of every species pair, sources
+
+The columns are opened with np.memmap (load_hits), so orthology and
+paralogy analyses can be re-run on the DIAMOND results without running
+DIAMOND again; reciprocal_best_hits() is one such analysis.
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+STORE_DIR = '.hit_store'
+STORE_VERSION = 1
+
+# outfmt 6 column: (store column, dtype)
+_COLUMNS = [('query', np.int32), ('subject', np.int32), ('pident', np.float32),
+            ('length', np.int32), ('mismatch', np.int32), ('gapopen', np.int32),
+            ('qstart', np.int32), ('qend', np.int32), ('sstart', np.int32), ('send', np.int32),
+            ('log10_evalue', np.float32), ('bitscore', np.float32)]
+
+_SUFFIX = {np.int32: 'i32', np.float32: 'f32'}
+
+
+def _read_id_file(path):
+    """[(id, value)] of an OrthoFinder 'id: value' file, in file order"""
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            key, sep, value = line.rstrip('\n').partition(': ')
+            if sep:
+                entries.append((key, value))
+    return entries
+
+
+def sequence_map(work_dir):
+    """(species names, per-species offsets, accession of every global number)
+
+    Global number of OrthoFinder ID "<s>_<i>" is offsets[s] + i.
+    """
+    species = [re.sub(r'\.(fa|faa|fasta)$', '', name)
+               for _, name in _read_id_file(os.path.join(work_dir, 'SpeciesIDs.txt'))]
+
+    sequence_ids = _read_id_file(os.path.join(work_dir, 'SequenceIDs.txt'))
+    counts = np.zeros(len(species), dtype=np.int64)
+    for key, _ in sequence_ids:
+        s, i = map(int, key.split('_'))
+        counts[s] = max(counts[s], i + 1)
+
+    offsets = np.zeros(len(species) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    accessions = [''] * int(offsets[-1])
+    for key, value in sequence_ids:
+        s, i = map(int, key.split('_'))
+        accessions[offsets[s] + i] = value.split()[0]
+    return species, offsets, accessions
+
+
+def find_blast_files(work_dir):
+    """{(i, j): path} of every Blast{i}_{j}.txt.gz, ordered by species pair"""
+    files = {}
+    for path in glob.glob(os.path.join(work_dir, 'Blast*_*.txt.gz')):
+        match = re.fullmatch(r'Blast(\d+)_(\d+)\.txt\.gz', os.path.basename(path))
+        if match:
+            files[int(match.group(1)), int(match.group(2))] = path
+    return dict(sorted(files.items()))
+
+
+def _global_ids(ids, offsets):
+    """Global numbers of an array of "<s>_<i>" strings"""
+    parts = ids.str.split('_', n=1, expand=True).astype(np.int64)
+    return (offsets[parts[0].to_numpy()] + parts[1].to_numpy()).astype(np.int32)
+
+
+def parse_blast_file(path, offsets):
+    """Typed columns (see _COLUMNS) of one gzipped OrthoFinder BLAST file"""
+    try:
+        with gzip.open(path, 'rt') as f:
+            hits = pd.read_csv(f, sep='\t', header=None, usecols=range(12), dtype=str,
+                               quoting=3, keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in _COLUMNS}
+
+    columns = {'query': _global_ids(hits[0], offsets),
+               'subject': _global_ids(hits[1], offsets)}
+    with np.errstate(divide='ignore'):
+        columns['log10_evalue'] = np.log10(hits[10].astype(np.float64).to_numpy()).astype(np.float32)
+    for i, (name, dtype) in enumerate(_COLUMNS):
+        if name not in columns:
+            columns[name] = hits[i].astype(np.float64).to_numpy().astype(dtype)
+    return columns
+
+
+def _source_key(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def build_store(work_dir, store_dir=None, workers=4):
+    """Parse every BLAST file of a WorkingDirectory into the hit store, returns the hit count"""
+    store_dir = store_dir or os.path.join(work_dir, STORE_DIR)
+    species, offsets, accessions = sequence_map(work_dir)
+    files = find_blast_files(work_dir)
+
+    tmp = f"{store_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    handles = {name: open(os.path.join(tmp, f"{name}.{_SUFFIX[dtype]}"), 'wb')
+               for name, dtype in _COLUMNS}
+    pairs = []
+    n_hits = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = pool.map(parse_blast_file, files.values(), [offsets] * len(files))
+            for (i, j), columns in zip(files, parsed):
+                for name, _ in _COLUMNS:
+                    columns[name].tofile(handles[name])
+                n = len(columns['query'])
+                pairs.append({'query_species': i, 'subject_species': j,
+                              'start': n_hits, 'end': n_hits + n})
+                n_hits += n
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    with open(os.path.join(tmp, 'sequences.tsv'), 'w') as f:
+        for s, name in enumerate(species):
+            for number in range(offsets[s], offsets[s + 1]):
+                f.write(f"{number}\t{name}\t{accessions[number]}\n")
+
+    meta = {'version': STORE_VERSION, 'rows': n_hits, 'species': species,
+            'offsets': offsets.tolist(), 'pairs': pairs,
+            'columns': {name: _SUFFIX[dtype] for name, dtype in _COLUMNS},
+            'sources': {os.path.basename(path): _source_key(path) for path in files.values()}}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp, store_dir)
+    return n_hits
+
+
+def is_valid(work_dir, store_dir=None):
+    """True if the store matches the BLAST files of the WorkingDirectory"""
+    meta_file = os.path.join(store_dir or os.path.join(work_dir, STORE_DIR), 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+    with open(meta_file, 'r') as f:
+        meta = json.load(f)
+    sources = {os.path.basename(path): _source_key(path)
+               for path in find_blast_files(work_dir).values()}
+    return meta.get('version') == STORE_VERSION and meta['sources'] == sources
+
+
+def load_hits(store_dir):
+    """(meta, {column: memmap}) of a hit store"""
+    with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    columns = {}
+    for name, dtype in _COLUMNS:
+        path = os.path.join(store_dir, f"{name}.{_SUFFIX[dtype]}")
+        columns[name] = (np.memmap(path, dtype=dtype, mode='r') if meta['rows']
+                         else np.empty(0, dtype=dtype))
+    return meta, columns
+
+
+def pair_rows(meta, query_species, subject_species):
+    """Row slice of the hits of one species pair"""
+    for pair in meta['pairs']:
+        if pair['query_species'] == query_species and pair['subject_species'] == subject_species:
+            return slice(pair['start'], pair['end'])
+    return slice(0, 0)
+
+
+def best_hits(meta, columns, query_species, subject_species):
+    """{query: best subject by bitscore} for one species pair"""
+    rows = pair_rows(meta, query_species, subject_species)
+    query = np.asarray(columns['query'][rows])
+    subject = np.asarray(columns['subject'][rows])
+    order = np.lexsort((-columns['bitscore'][rows], query))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = query[order][1:] != query[order][:-1]
+    return dict(zip(query[order][first].tolist(), subject[order][first].tolist()))
+
+
+def reciprocal_best_hits(meta, columns, species_a, species_b):
+    """[(a, b)] global sequence numbers that are each other's best hit"""
+    forward = best_hits(meta, columns, species_a, species_b)
+    reverse = best_hits(meta, columns, species_b, species_a)
+    return [(a, b) for a, b in forward.items() if reverse.get(b) == a]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('work_dir', nargs='?',
+                        help="OrthoFinder WorkingDirectory (default: latest under 03_orthofinder/results)")
+    parser.add_argument('--store-dir', help=f"output directory (default: <work_dir>/{STORE_DIR})")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--rebuild', action='store_true', help="rebuild even if the store is up to date")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or sorted(glob.glob('03_orthofinder/results/Results_*/WorkingDirectory'))[-1]
+    store_dir = args.store_dir or os.path.join(work_dir, STORE_DIR)
+
+    if args.rebuild or not is_valid(work_dir, store_dir):
+        start = time.time()
+        n_hits = build_store(work_dir, store_dir, args.workers)
+        print(f"Loaded {n_hits} hits from {len(find_blast_files(work_dir))} files "
+              f"({time.time() - start:.1f}s)")
+    else:
+        print(f"Hit store is up to date: {store_dir}")
+
+    meta, columns = load_hits(store_dir)
+    print(f"Species: {len(meta['species'])}, sequences: {meta['offsets'][-1]}, hits: {meta['rows']}")
+    print(f"Results saved to {store_dir}")
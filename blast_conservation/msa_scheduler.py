@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""
+Core-aware scheduler for the alignment and tree jobs of every orthogroup
+
+For every orthogroup of Orthogroups.txt the sequences are extracted
+(fasta_index.py, one indexed pass for all orthogroups) and then queued:
+
+    <OG>_sequences.fasta -> MAFFT -> IQ-TREE    03_alignments/mafft/, 04_phylogeny/mafft_trees/
+                         -> PRANK -> IQ-TREE    03_alignments/prank/, 04_phylogeny/prank_trees/
+
+Jobs are packed onto the available cores: each job asks for a number of
+threads that grows with the size of its input (sequences x mean length),
+the largest ready job is started first and smaller jobs fill the cores it
+leaves free. Failed jobs are retried; the jobs depending on a job that
+keeps failing are skipped. Finished runs report throughput and core
+utilization, and every job is listed in 03_alignments/scheduler_report.tsv.
+
+The tool commands are shell templates ({input}, {output}, {prefix},
+{threads}) and can be replaced with --tool NAME=TEMPLATE, e.g. stand-in
+commands for testing without MAFFT, PRANK or IQ-TREE installed.
+"""
+
+import argparse
+import glob
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from fasta_index import FastaIndex, INDEX_FILE, extract_orthogroups, read_orthogroups
+
+TOOLS = {
+    'mafft': 'mafft --auto --thread {threads} {input} > {output}',
+    'prank': 'prank -d={input} -o={prefix} -once -quiet && mv {prefix}.best.fas {output}',
+    'iqtree': 'iqtree -s {input} -pre {prefix} -m TEST -bb 1000 -alrt 1000 -nt {threads} -redo -quiet',
+}
+
+# Tools that only run on one thread
+SINGLE_THREADED = {'prank'}
+
+# Residues (sequences x mean length) of input per thread
+RESIDUES_PER_THREAD = 20000
+
+# IQ-TREE needs at least this many sequences
+MIN_TREE_SEQUENCES = 4
+
+
+class Job:
+    """One tool run on one orthogroup"""
+
+    def __init__(self, name, tool, input_file, output, prefix, cost, threads, depends=()):
+        self.name = name
+        self.tool = tool
+        self.input_file = input_file
+        self.output = output
+        self.prefix = prefix
+        self.cost = cost
+        self.threads = threads
+        self.depends = list(depends)
+        self.attempts = 0
+        self.status = 'queued'
+        self.seconds = 0.0
+
+    def command(self, templates):
+        return templates[self.tool].format(input=self.input_file, output=self.output,
+                                           prefix=self.prefix, threads=self.threads)
+
+
+def fasta_size(fasta_file):
+    """(number of sequences, total residues) of a FASTA file"""
+    n_sequences = residues = 0
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                n_sequences += 1
+            else:
+                residues += len(line.strip())
+    return n_sequences, residues
+
+
+def threads_for(tool, cost, max_threads):
+    """Threads a job asks for, from its input size"""
+    if tool in SINGLE_THREADED:
+        return 1
+    return max(1, min(max_threads, round(cost / RESIDUES_PER_THREAD)))
+
+
+def plan_jobs(sequence_files, max_threads, aligners=('mafft', 'prank'), trees=True):
+    """Alignment jobs (and tree jobs when trees is set) of every orthogroup sequence file"""
+    jobs = []
+    for sequence_file in sequence_files:
+        og = os.path.basename(sequence_file).replace('_sequences.fasta', '')
+        n_sequences, residues = fasta_size(sequence_file)
+        if n_sequences < 2:
+            continue
+
+        # Input size: sequences x mean length
+        cost = residues
+        for aligner in aligners:
+            alignment = os.path.join('03_alignments', aligner, f"{og}_{aligner}.fasta")
+            align = Job(f"{og}:{aligner}", aligner, sequence_file, alignment,
+                        os.path.join('03_alignments', aligner, f"{og}_{aligner}"),
+                        cost, threads_for(aligner, cost, max_threads))
+            jobs.append(align)
+
+            if trees and n_sequences >= MIN_TREE_SEQUENCES:
+                prefix = os.path.join('04_phylogeny', f"{aligner}_trees", f"{og}_{aligner}")
+                jobs.append(Job(f"{og}:{aligner}:iqtree", 'iqtree', alignment,
+                                f"{prefix}.treefile", prefix, cost,
+                                threads_for('iqtree', cost, max_threads), depends=[align]))
+    return jobs
+
+
+def run_jobs(jobs, templates, cores, retries=2, force=False, log=print):
+    """Run the jobs on at most `cores` threads at a time, returns the wall time"""
+    pending = list(jobs)
+    running = {}
+    free = cores
+    start = time.time()
+
+    def launch(job):
+        job.attempts += 1
+        job.status = 'running'
+        for path in (job.output, job.prefix):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # A stale output must not pass for the result of this attempt
+        if os.path.exists(job.output):
+            os.remove(job.output)
+        began = time.time()
+        result = subprocess.run(job.command(templates), shell=True,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        ok = result.returncode == 0 and os.path.exists(job.output)
+        return ok, time.time() - began, result.stderr.decode(errors='replace').strip()
+
+    with ThreadPoolExecutor(max_workers=cores) as pool:
+        while pending or running:
+            # Skip jobs whose dependencies failed, and up-to-date outputs
+            for job in list(pending):
+                if any(dep.status in ('failed', 'skipped') for dep in job.depends):
+                    job.status = 'skipped'
+                    pending.remove(job)
+                elif (not force and os.path.exists(job.output)
+                      and all(dep.status == 'up to date' for dep in job.depends)
+                      and os.path.getmtime(job.output) >= os.path.getmtime(job.input_file)):
+                    job.status = 'up to date'
+                    pending.remove(job)
+
+            # Largest ready job first, smaller ones backfill the free cores
+            ready = [job for job in pending
+                     if all(dep.status in ('done', 'up to date') for dep in job.depends)]
+            for job in sorted(ready, key=lambda job: -job.cost):
+                threads = min(job.threads, cores)
+                if threads <= free:
+                    job.threads = threads
+                    free -= threads
+                    pending.remove(job)
+                    running[pool.submit(launch, job)] = job
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                free += job.threads
+                ok, seconds, error = future.result()
+                job.seconds += seconds
+                if ok:
+                    job.status = 'done'
+                    log(f"  ✓ {job.name} ({job.threads} threads, {seconds:.1f}s)")
+                elif job.attempts <= retries:
+                    job.status = 'queued'
+                    pending.append(job)
+                    log(f"  ↻ {job.name} failed (attempt {job.attempts}), retrying")
+                else:
+                    job.status = 'failed'
+                    log(f"  ✗ {job.name} failed after {job.attempts} attempts: {error[-200:]}")
+
+    return time.time() - start
+
+
+def write_report(jobs, report_file):
+    """One line per job: name, tool, threads, attempts, seconds, status"""
+    os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+    with open(report_file, 'w') as f:
+        f.write('job\ttool\tthreads\tattempts\tseconds\tstatus\n')
+        for job in jobs:
+            f.write(f"{job.name}\t{job.tool}\t{job.threads}\t{job.attempts}\t"
+                    f"{job.seconds:.2f}\t{job.status}\n")
+
+
+def throughput_summary(jobs, wall, cores):
+    """Lines summarizing jobs per status, jobs per minute and core utilization"""
+    statuses = {}
+    for job in jobs:
+        statuses[job.status] = statuses.get(job.status, 0) + 1
+    ran = [job for job in jobs if job.attempts]
+    busy = sum(job.threads * job.seconds for job in ran)
+    lines = ['Jobs: ' + ', '.join(f"{n} {status}" for status, n in sorted(statuses.items())),
+             f"Wall time: {wall:.1f}s"]
+    if ran and wall > 0:
+        lines.append(f"Throughput: {60 * len(ran) / wall:.1f} jobs/min")
+        lines.append(f"Core utilization: {100 * busy / (cores * wall):.0f}% of {cores} cores")
+    return lines
+
+
+def parse_tool(value):
+    name, sep, template = value.partition('=')
+    if not sep or name not in TOOLS:
+        raise argparse.ArgumentTypeError(f"expected NAME=TEMPLATE with NAME in {', '.join(TOOLS)}")
+    return name, template
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orthogroups', help="Orthogroups.txt (default: latest OrthoFinder results)")
+    parser.add_argument('--proteomes', nargs='+',
+                        help="proteome FASTA files (default: 03_orthofinder/proteomes/*.fasta)")
+    parser.add_argument('--og', nargs='+', help="only these orthogroups (default: all)")
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-threads', type=int, help="threads of the largest job (default: --cores)")
+    parser.add_argument('--aligners', nargs='+', default=['mafft', 'prank'], choices=['mafft', 'prank'])
+    parser.add_argument('--no-trees', dest='trees', action='store_false',
+                        help="only align, without the IQ-TREE jobs")
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--force', action='store_true', help="rerun jobs with up-to-date outputs")
+    parser.add_argument('--tool', type=parse_tool, action='append', default=[],
+                        help="override a tool command, e.g. --tool 'mafft=cp {input} {output}'")
+    parser.add_argument('--report', default='03_alignments/scheduler_report.tsv')
+    args = parser.parse_args()
+
+    templates = dict(TOOLS, **dict(args.tool))
+    proteomes = args.proteomes or sorted(glob.glob('03_orthofinder/proteomes/*.fasta'))
+    orthogroups_file = args.orthogroups or sorted(
+        glob.glob('03_orthofinder/results/Results_*/Orthogroups/Orthogroups.txt'))[-1]
+
+    print("Extracting orthogroup sequences...")
+    index = FastaIndex(proteomes, os.path.join(os.path.dirname(proteomes[0]), INDEX_FILE))
+    counts = extract_orthogroups(index, read_orthogroups(orthogroups_file), '03_alignments', args.og)
+    print(f"  ✓ {len(counts)} orthogroups")
+
+    sequence_files = [os.path.join('03_alignments', f"{og}_sequences.fasta") for og in counts]
+    jobs = plan_jobs(sequence_files, args.max_threads or args.cores, args.aligners, args.trees)
+    print(f"Scheduling {len(jobs)} jobs on {args.cores} cores...")
+
+    wall = run_jobs(jobs, templates, args.cores, args.retries, args.force)
+    write_report(jobs, args.report)
+
+    for line in throughput_summary(jobs, wall, args.cores):
+        print(line)
+    print(f"Report saved to {args.report}")
@@ -1,93 +1,342 @@
 #!/usr/bin/env python3
 
-import sys
-from collections import defaultdict
-
-def parse_hmmer_domtblout(domtbl_file):
-    """Parse HMMER domtblout format"""
-    
-    domains = defaultdict(list)
-    
+"""
+Streaming parser of hmmscan --domtblout output with domain overlap resolution
+
+hmmscan writes all domain hits of a query sequence on consecutive lines, so
+the table is read one sequence at a time and memory stays bounded by the
+hits of a single sequence, whatever the size of the file. For every
+sequence:
+
+1. Domain hits are filtered by per-domain thresholds (i-Evalue --domE,
+   domain score --domT) and per-sequence thresholds (full-sequence E-value
+   --E, score --T).
+2. Hits of competing Pfam families that overlap are resolved to the
+   non-overlapping set with the highest total domain score (weighted
+   interval scheduling on the alignment or envelope coordinates;
+   --max-overlap residues of overlap are tolerated).
+
+Output, next to every <OG>_domains.txt:
+
+    <OG>_parsed.json               {sequence: [{domain, evalue, score, start, end,
+                                   description}]}, the selected hits in file order
+                                   (read by extract_domains_fixed.py), written
+                                   one sequence per line
+    .domain_store/<OG>/            typed binary columns of every hit passing the
+                                   thresholds, written in chunks:
+        sequence.i32 family.i32    row of sequences.tsv / families.tsv
+        log10_*evalue.f32          full-sequence, conditional and independent E-values
+        *score.f32 *bias.f32       full-sequence and domain bit scores and biases
+        hmm_from.i32 ... env_to.i32   model, alignment and envelope coordinates
+        acc.f32 selected.u8        posterior accuracy, kept by overlap resolution
+        meta.json                  rows, thresholds, column list
+
+load_domains() opens the columns with np.memmap.
+"""
+
+import argparse
+import bisect
+import glob
+import json
+import os
+import shutil
+import time
+from collections import Counter, deque
+import numpy as np
+
+STORE_DIR = '.domain_store'
+STORE_VERSION = 1
+
+DOMAIN_EVALUE = 1e-3
+CHUNK_ROWS = 100_000
+
+# Queries remembered to catch non-consecutive hits of the same sequence
+RECENT_QUERIES = 4096
+
+# Store column: (dtype, key of the parsed hit)
+_COLUMNS = [('sequence', np.int32, None), ('family', np.int32, None),
+            ('log10_evalue', np.float32, 'evalue'), ('score', np.float32, 'score'),
+            ('bias', np.float32, 'bias'), ('domain_number', np.int32, 'domain_number'),
+            ('domain_count', np.int32, 'domain_count'), ('log10_c_evalue', np.float32, 'c_evalue'),
+            ('log10_i_evalue', np.float32, 'i_evalue'), ('domain_score', np.float32, 'domain_score'),
+            ('domain_bias', np.float32, 'domain_bias'), ('hmm_from', np.int32, 'hmm_from'),
+            ('hmm_to', np.int32, 'hmm_to'), ('ali_from', np.int32, 'start'), ('ali_to', np.int32, 'end'),
+            ('env_from', np.int32, 'env_start'), ('env_to', np.int32, 'env_end'),
+            ('acc', np.float32, 'acc'), ('selected', np.uint8, None)]
+
+_SUFFIX = {np.int32: 'i32', np.float32: 'f32', np.uint8: 'u8'}
+
+
+def parse_line(line):
+    """Domain hit of one domtblout line, None for comments and short lines"""
+    if line.startswith('#'):
+        return None
+    parts = line.split()
+    if len(parts) < 23:
+        return None
+    return {
+        'domain': parts[0],
+        'accession': parts[1],
+        'model_length': int(parts[2]),
+        'query': parts[3],
+        'query_length': int(parts[5]),
+        'evalue': float(parts[6]),
+        'score': float(parts[7]),
+        'bias': float(parts[8]),
+        'domain_number': int(parts[9]),
+        'domain_count': int(parts[10]),
+        'c_evalue': float(parts[11]),
+        'i_evalue': float(parts[12]),
+        'domain_score': float(parts[13]),
+        'domain_bias': float(parts[14]),
+        'hmm_from': int(parts[15]),
+        'hmm_to': int(parts[16]),
+        'start': int(parts[17]),
+        'end': int(parts[18]),
+        'env_start': int(parts[19]),
+        'env_end': int(parts[20]),
+        'acc': float(parts[21]),
+        'description': ' '.join(parts[22:]),
+    }
+
+
+def iter_sequences(domtbl_file):
+    """(query name, [hits]) for every query sequence, streamed from the file
+
+    A query that reappears within the last RECENT_QUERIES sequences raises
+    a ValueError; only that window of names is kept, not every name.
+    """
+    recent, recent_set = deque(), set()
+    query, hits = None, []
     with open(domtbl_file, 'r') as f:
         for line in f:
-            if line.startswith('#'):
-                continue
-            
-            parts = line.split()
-            if len(parts) < 23:
+            hit = parse_line(line)
+            if hit is None:
                 continue
-            
-            target_name = parts[0]  # Pfam domain
-            query_name = parts[3]   # Sequence ID
-            evalue = float(parts[6])
-            score = float(parts[7])
-            
-            # Domain coordinates
-            ali_from = int(parts[17])
-            ali_to = int(parts[18])
-            
-            # Description (rest of line)
-            desc = ' '.join(parts[22:])
-            
-            domains[query_name].append({
-                'domain': target_name,
-                'evalue': evalue,
-                'score': score,
-                'start': ali_from,
-                'end': ali_to,
-                'description': desc
-            })
-    
-    return domains
-
-def print_domain_summary(domains, orthogroup):
+            if hit['query'] != query:
+                if hits:
+                    yield query, hits
+                query, hits = hit['query'], []
+                if query in recent_set:
+                    raise ValueError(f"{domtbl_file}: hits of {query} are not consecutive "
+                                     "(expected hmmscan --domtblout output)")
+                recent.append(query)
+                recent_set.add(query)
+                if len(recent) > RECENT_QUERIES:
+                    recent_set.discard(recent.popleft())
+            hits.append(hit)
+    if hits:
+        yield query, hits
+
+
+def passes_thresholds(hit, dom_evalue=DOMAIN_EVALUE, dom_score=None, seq_evalue=None, seq_score=None):
+    """True if a hit passes the per-domain and per-sequence thresholds (None = no threshold)"""
+    return ((dom_evalue is None or hit['i_evalue'] <= dom_evalue)
+            and (dom_score is None or hit['domain_score'] >= dom_score)
+            and (seq_evalue is None or hit['evalue'] <= seq_evalue)
+            and (seq_score is None or hit['score'] >= seq_score))
+
+
+def resolve_overlaps(hits, coordinates='ali', max_overlap=0):
+    """Indices (in input order) of the non-overlapping hits with the highest total domain score
+
+    Weighted interval scheduling: hits sorted by end, best[j] = max(best[j - 1],
+    score[j] + best[p(j)]) with p(j) the number of hits ending before hit j
+    starts. A hit may run up to max_overlap residues into the next one (its
+    end is moved back by max_overlap before comparing); nested hits always
+    compete.
+    """
+    if len(hits) < 2:
+        return list(range(len(hits)))
+    start_key, end_key = ('start', 'end') if coordinates == 'ali' else ('env_start', 'env_end')
+    # Few hits per sequence: plain lists are faster than NumPy here
+    order = sorted(range(len(hits)), key=lambda i: (hits[i][end_key], hits[i][start_key]))
+    ends = [hits[i][end_key] - max_overlap for i in order]
+    # Hits compatible with j come before it in end order, so p(j) <= j
+    previous = [min(bisect.bisect_left(ends, hits[i][start_key]), j) for j, i in enumerate(order)]
+    scores = [hits[i]['domain_score'] for i in order]
+
+    best = [0.0] * (len(hits) + 1)
+    for j in range(len(hits)):
+        best[j + 1] = max(best[j], scores[j] + best[previous[j]])
+
+    selected = []
+    j = len(hits)
+    while j > 0:
+        if scores[j - 1] + best[previous[j - 1]] > best[j - 1]:
+            selected.append(order[j - 1])
+            j = previous[j - 1]
+        else:
+            j -= 1
+    return sorted(selected)
+
+
+def _log10(values):
+    with np.errstate(divide='ignore'):
+        return np.log10(np.asarray(values, dtype=np.float64)).astype(np.float32)
+
+
+def _json_entry(query, hits):
+    """'"query": [...]' member of the parsed JSON, one line per sequence"""
+    return f"{json.dumps(query)}: {json.dumps(hits)}"
+
+
+def parse_hmmer_domtblout(domtbl_file, json_file=None, store_dir=None, dom_evalue=DOMAIN_EVALUE,
+                          dom_score=None, seq_evalue=None, seq_score=None, resolve=True,
+                          coordinates='ali', max_overlap=0):
+    """Stream a domtblout file into the parsed JSON and/or the column store, returns a summary
+
+    Summary: {'sequences': sequences with selected hits, 'hits': hits read,
+    'passing': hits passing the thresholds, 'selected': hits kept,
+    'domain_counts': Counter of the selected families}.
+    """
+    summary = {'sequences': 0, 'hits': 0, 'passing': 0, 'selected': 0, 'domain_counts': Counter()}
+    families = {}
+
+    json_out = tmp_store = None
+    handles = {}
+    rows = []
+    keys = [key for _, _, key in _COLUMNS if key is not None]
+    sequences_out = families_out = None
+
+    def flush():
+        # rows: (sequence, family, selected, *keys)
+        columns = dict(zip(['sequence', 'family', 'selected'] + keys, zip(*rows))) if rows else {}
+        for name, dtype, key in _COLUMNS:
+            values = columns.get(key or name, ())
+            values = _log10(values) if name.startswith('log10_') else np.asarray(values, dtype=dtype)
+            values.tofile(handles[name])
+        rows.clear()
+
+    try:
+        if json_file:
+            json_out = open(f"{json_file}.tmp-{os.getpid()}", 'w')
+            json_out.write('{')
+        if store_dir:
+            tmp_store = f"{store_dir.rstrip(os.sep)}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_store, ignore_errors=True)
+            os.makedirs(tmp_store)
+            handles = {name: open(os.path.join(tmp_store, f"{name}.{_SUFFIX[dtype]}"), 'wb')
+                       for name, dtype, _ in _COLUMNS}
+            sequences_out = open(os.path.join(tmp_store, 'sequences.tsv'), 'w')
+            families_out = open(os.path.join(tmp_store, 'families.tsv'), 'w')
+
+        n_stored = 0
+        for number, (query, hits) in enumerate(iter_sequences(domtbl_file)):
+            summary['hits'] += len(hits)
+            query_length = hits[0]['query_length']
+            hits = [hit for hit in hits if passes_thresholds(hit, dom_evalue, dom_score, seq_evalue, seq_score)]
+            summary['passing'] += len(hits)
+            selected = set(resolve_overlaps(hits, coordinates, max_overlap) if resolve else range(len(hits)))
+            if selected:
+                summary['sequences'] += 1
+                summary['selected'] += len(selected)
+                summary['domain_counts'].update(hits[i]['domain'] for i in selected)
+
+            if json_out and selected:
+                entry = [{key: hits[i][key] for key in ('domain', 'evalue', 'score', 'start', 'end', 'description')}
+                         for i in sorted(selected)]
+                json_out.write(('\n' if summary['sequences'] == 1 else ',\n') + _json_entry(query, entry))
+
+            if store_dir:
+                sequences_out.write(f"{number}\t{query}\t{query_length}\n")
+                for i, hit in enumerate(hits):
+                    if hit['domain'] not in families:
+                        families[hit['domain']] = len(families)
+                        families_out.write(f"{families[hit['domain']]}\t{hit['domain']}\t{hit['accession']}\t"
+                                           f"{hit['model_length']}\t{hit['description']}\n")
+                    rows.append((number, families[hit['domain']], i in selected, *[hit[key] for key in keys]))
+                n_stored += len(hits)
+                if len(rows) >= CHUNK_ROWS:
+                    flush()
+
+        if store_dir:
+            flush()
+        if json_out:
+            json_out.write('\n}' if summary['sequences'] else '}')
+    finally:
+        for handle in list(handles.values()) + [sequences_out, families_out]:
+            if handle:
+                handle.close()
+        if json_out:
+            json_out.close()
+
+    if json_file:
+        os.replace(f"{json_file}.tmp-{os.getpid()}", json_file)
+
+    if store_dir:
+        meta = {'version': STORE_VERSION, 'rows': n_stored, 'source': os.path.abspath(domtbl_file),
+                'thresholds': {'domE': dom_evalue, 'domT': dom_score, 'E': seq_evalue, 'T': seq_score},
+                'resolve': resolve, 'coordinates': coordinates, 'max_overlap': max_overlap,
+                'columns': {name: _SUFFIX[dtype] for name, dtype, _ in _COLUMNS}}
+        with open(os.path.join(tmp_store, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(store_dir, ignore_errors=True)
+        os.replace(tmp_store, store_dir)
+    return summary
+
+
+def load_domains(store_dir):
+    """(meta, {column: memmap}) of a domain store"""
+    with open(os.path.join(store_dir, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    columns = {}
+    for name, dtype, _ in _COLUMNS:
+        path = os.path.join(store_dir, f"{name}.{_SUFFIX[dtype]}")
+        columns[name] = (np.memmap(path, dtype=dtype, mode='r') if meta['rows']
+                         else np.empty(0, dtype=dtype))
+    return meta, columns
+
+
+def print_domain_summary(summary, orthogroup):
     """Print summary of domains found"""
-    
+
     print(f"\n{'='*70}")
     print(f"Domain Summary for {orthogroup}")
     print('='*70)
     print("")
-    
-    # Count unique domains
-    all_domains = set()
-    for seq_domains in domains.values():
-        for d in seq_domains:
-            all_domains.add(d['domain'])
-    
-    print(f"Total sequences with domains: {len(domains)}")
-    print(f"Unique domain types found: {len(all_domains)}")
+
+    domain_counts = summary['domain_counts']
+    print(f"Total sequences with domains: {summary['sequences']}")
+    print(f"Unique domain types found: {len(domain_counts)}")
+    print(f"Domain hits: {summary['hits']} read, {summary['passing']} passing thresholds, "
+          f"{summary['selected']} after overlap resolution")
     print("")
-    
-    # Domain frequency
-    domain_counts = defaultdict(int)
-    for seq_domains in domains.values():
-        for d in seq_domains:
-            domain_counts[d['domain']] += 1
-    
+
     print("Most common domains:")
     for domain, count in sorted(domain_counts.items(), key=lambda x: -x[1])[:10]:
         print(f"  {domain}: {count} sequences")
-    
-    print("")
 
-# Parse both orthogroups
-print("\nParsing HMMER results...")
-
-og0_domains = parse_hmmer_domtblout('05_domains/hmmer/OG0000000_domains.txt')
-print_domain_summary(og0_domains, "OG0000000 (MYOD1/MYF5)")
-
-og1_domains = parse_hmmer_domtblout('05_domains/hmmer/OG0000001_domains.txt')
-print_domain_summary(og1_domains, "OG0000001 (MYOG)")
-
-# Save parsed results
-import json
+    print("")
 
-with open('05_domains/hmmer/OG0000000_parsed.json', 'w') as f:
-    json.dump(og0_domains, f, indent=2)
 
-with open('05_domains/hmmer/OG0000001_parsed.json', 'w') as f:
-    json.dump(og1_domains, f, indent=2)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('domtblout', nargs='*', help="hmmscan --domtblout files "
+                                                     "(default: 05_domains/hmmer/*_domains.txt)")
+    parser.add_argument('--domE', type=float, default=DOMAIN_EVALUE, help="largest domain i-Evalue")
+    parser.add_argument('--domT', type=float, help="smallest domain score")
+    parser.add_argument('--E', type=float, help="largest full-sequence E-value")
+    parser.add_argument('--T', type=float, help="smallest full-sequence score")
+    parser.add_argument('--coordinates', choices=['ali', 'env'], default='ali',
+                        help="coordinates compared for overlaps")
+    parser.add_argument('--max-overlap', type=int, default=0, help="residues of overlap tolerated")
+    parser.add_argument('--keep-overlaps', action='store_true', help="keep every hit passing the thresholds")
+    parser.add_argument('--no-store', action='store_true', help="write only the parsed JSON")
+    args = parser.parse_args()
 
-print("\n✓ Parsed domain data saved to JSON files")
-print("")
+    print("\nParsing HMMER results...")
+    files = args.domtblout or sorted(glob.glob('05_domains/hmmer/*_domains.txt'))
+    for domtbl_file in files:
+        start = time.time()
+        base = os.path.basename(domtbl_file).replace('_domains.txt', '')
+        out_dir = os.path.dirname(domtbl_file)
+        summary = parse_hmmer_domtblout(
+            domtbl_file, os.path.join(out_dir, f"{base}_parsed.json"),
+            None if args.no_store else os.path.join(out_dir, STORE_DIR, base),
+            args.domE, args.domT, args.E, args.T, not args.keep_overlaps, args.coordinates, args.max_overlap)
+        print_domain_summary(summary, base)
+        print(f"  ✓ {domtbl_file} ({time.time() - start:.1f}s)")
 
+    print("\n✓ Parsed domain data saved to JSON files")
+    print("")
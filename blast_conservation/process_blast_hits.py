@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+Single-pass processing of BLAST tabular (outfmt 6) homolog searches
+
+Reads the 18-column layout written by run_phase2a_full.sh (raw or with
+the annotated header) once, in chunks, and produces everything the old
+awk/sort/cut chain did:
+
+    <prefix>_filtered.tsv        hits passing coverage/identity filters
+    <prefix>_unique_species.tsv  best hit (bitscore) per query and species
+    top100_accessions.txt        subject IDs of the first N unique hits
+    statistics/<prefix>_blast_summary.txt
+
+Original lines are copied byte for byte; only the columns that are
+filtered or ranked on are parsed into typed arrays. Memory is bounded by
+the chunk size plus one best hit per (query, species).
+"""
+
+import argparse
+import heapq
+import io
+import itertools
+import os
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['query_id', 'subject_id', 'percent_identity', 'alignment_length', 'mismatches',
+           'gap_opens', 'query_start', 'query_end', 'subject_start', 'subject_end', 'evalue',
+           'bitscore', 'query_coverage', 'tax_id', 'species_name', 'blast_name', 'kingdom',
+           'description']
+HEADER = '\t'.join(COLUMNS) + '\n'
+
+# Identity histogram bins, as reported by run_phase2a_full.sh
+IDENTITY_BINS = [('>90%', lambda x: x > 90),
+                 ('70-90%', lambda x: (x >= 70) & (x <= 90)),
+                 ('50-70%', lambda x: (x >= 50) & (x < 70)),
+                 ('25-50%', lambda x: (x >= 25) & (x < 50))]
+
+CHUNK_LINES = 200_000
+
+
+def read_hit_chunks(blast_file, chunk_lines=CHUNK_LINES):
+    """Yield (lines, typed DataFrame) chunks of a BLAST table, skipping the header"""
+    with open(blast_file, 'r') as f:
+        first = True
+        while True:
+            lines = list(itertools.islice(f, chunk_lines))
+            if not lines:
+                break
+            if first and lines[0].startswith('query_id\t'):
+                lines = lines[1:]
+            first = False
+
+            lines = [line if line.endswith('\n') else line + '\n'
+                     for line in lines if line.strip()]
+            if not lines:
+                continue
+
+            frame = pd.read_csv(io.StringIO(''.join(lines)), sep='\t', header=None,
+                                names=COLUMNS, usecols=range(len(COLUMNS)),
+                                dtype=str, keep_default_na=False, quoting=3)
+            for column in ('percent_identity', 'bitscore', 'query_coverage'):
+                frame[column] = pd.to_numeric(frame[column], errors='coerce')
+            yield lines, frame
+
+
+class BestHits:
+    """Best line per key by bitscore; ties go to the smaller line, like sort(1)"""
+
+    def __init__(self):
+        self.best = {}
+
+    def update(self, keys, bitscores, lines):
+        chunk = pd.DataFrame({'key': keys, 'bitscore': bitscores, 'line': lines})
+        chunk = chunk.sort_values(['bitscore', 'line'], ascending=[False, True])
+        chunk = chunk.drop_duplicates('key')
+
+        for key, bitscore, line in chunk.itertuples(index=False):
+            current = self.best.get(key)
+            if current is None or (-bitscore, line) < (-current[0], current[1]):
+                self.best[key] = (bitscore, line)
+
+    def lines(self):
+        """Best lines sorted by key (query, then species)"""
+        return [self.best[key][1] for key in sorted(self.best)]
+
+
+def process_blast_hits(blast_file, out_dir, prefix='MYOD1_homologs', min_coverage=30,
+                       min_identity=25, top_n=100, species_column='species_name',
+                       n_top_hits=10, chunk_lines=CHUNK_LINES):
+    """Run the whole Phase 2A post-processing in one pass; returns a stats dict"""
+    os.makedirs(os.path.join(out_dir, 'statistics'), exist_ok=True)
+    filtered_file = os.path.join(out_dir, f"{prefix}_filtered.tsv")
+    unique_file = os.path.join(out_dir, f"{prefix}_unique_species.tsv")
+    accessions_file = os.path.join(out_dir, f"top{top_n}_accessions.txt")
+    stats_file = os.path.join(out_dir, 'statistics', f"{prefix}_blast_summary.txt")
+
+    stats = {'total': 0, 'filtered': 0, 'identity': dict.fromkeys([label for label, _ in IDENTITY_BINS], 0)}
+    best = BestHits()
+    top_hits = []
+
+    with open(filtered_file, 'w') as out:
+        out.write(HEADER)
+        for lines, frame in read_hit_chunks(blast_file, chunk_lines):
+            identity = frame['percent_identity'].to_numpy()
+            bitscore = frame['bitscore'].to_numpy()
+            coverage = frame['query_coverage'].to_numpy()
+            offset = stats['total']
+            stats['total'] += len(lines)
+
+            # Top hits by bitscore over all hits, earlier lines first on ties
+            for i in np.argsort(-bitscore, kind='stable')[:n_top_hits]:
+                entry = (bitscore[i], -(offset + i), frame['species_name'].iat[i], identity[i])
+                if len(top_hits) < n_top_hits:
+                    heapq.heappush(top_hits, entry)
+                else:
+                    heapq.heappushpop(top_hits, entry)
+
+            keep = np.flatnonzero((coverage >= min_coverage) & (identity >= min_identity))
+            if len(keep) == 0:
+                continue
+            stats['filtered'] += len(keep)
+            out.writelines(lines[i] for i in keep)
+
+            kept_identity = identity[keep]
+            for label, in_bin in IDENTITY_BINS:
+                stats['identity'][label] += int(in_bin(kept_identity).sum())
+
+            keys = list(zip(frame['query_id'].to_numpy()[keep],
+                            frame[species_column].to_numpy()[keep]))
+            best.update(keys, bitscore[keep], [lines[i] for i in keep])
+
+    unique_lines = best.lines()
+    with open(unique_file, 'w') as out:
+        out.writelines(unique_lines)
+
+    with open(accessions_file, 'w') as out:
+        out.writelines(line.split('\t', 2)[1] + '\n' for line in unique_lines[:top_n])
+
+    stats['unique'] = len(unique_lines)
+    stats['top_hits'] = [(species, ident, score)
+                         for score, _, species, ident in sorted(top_hits, reverse=True)]
+
+    with open(stats_file, 'w') as f:
+        f.write("BLAST Homolog Search Summary\n")
+        f.write("============================\n\n")
+        f.write(f"Input: {os.path.basename(blast_file)}\n")
+        f.write(f"Filters: query coverage >= {min_coverage}%, identity >= {min_identity}%\n\n")
+        f.write(f"Total hits: {stats['total']}\n")
+        f.write(f"Filtered hits: {stats['filtered']}\n")
+        f.write(f"Unique species (best hit per {species_column}): {stats['unique']}\n\n")
+        f.write("Identity distribution (filtered hits):\n")
+        for label, count in stats['identity'].items():
+            f.write(f"  {label}: {count}\n")
+        f.write(f"\nTop {n_top_hits} hits:\n")
+        f.write("Species\tIdentity%\tBitScore\n")
+        for species, ident, score in stats['top_hits']:
+            f.write(f"{species}\t{ident:g}\t{score:g}\n")
+
+    stats['files'] = [filtered_file, unique_file, accessions_file, stats_file]
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('blast_file', nargs='?', default='02_blast_results/MYOD1_homologs_annotated.tsv')
+    parser.add_argument('--out-dir', default='02_blast_results')
+    parser.add_argument('--prefix', default='MYOD1_homologs')
+    parser.add_argument('--min-coverage', type=float, default=30)
+    parser.add_argument('--min-identity', type=float, default=25)
+    parser.add_argument('--top-n', type=int, default=100, help="accessions written to topN_accessions.txt")
+    parser.add_argument('--species-column', default='species_name', choices=COLUMNS,
+                        help="column defining a species for the best-hit selection")
+    args = parser.parse_args()
+
+    stats = process_blast_hits(args.blast_file, args.out_dir, args.prefix, args.min_coverage,
+                               args.min_identity, args.top_n, args.species_column)
+
+    print(f"Total hits found: {stats['total']}")
+    print(f"Filtered hits: {stats['filtered']}")
+    print(f"Unique species: {stats['unique']}")
+    print("")
+    print("Top 10 hits:")
+    print("Species\tIdentity%\tBitScore")
+    for species, ident, score in stats['top_hits']:
+        print(f"{species}\t{ident:g}\t{score:g}")
+    print("")
+    print("Identity distribution:")
+    for label, count in stats['identity'].items():
+        print(f"  {label}: {count}")
+    print("")
+    for path in stats['files']:
+        print(f"✓ {path}")
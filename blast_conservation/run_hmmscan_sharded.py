@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+Sharded parallel hmmscan and hmmbuild for the Phase 5 domain search
+
+hmmscan gains little from more than a few threads, so instead of one
+multi-threaded hmmscan per orthogroup file, every file is split into
+contiguous shards of about the same number of residues and many
+single-threaded hmmscan processes run at once, largest shard first:
+
+    04_orthogroups/<OG>.fasta -> shards -> hmmscan --domtblout (pool of --workers)
+                              -> 05_domains/hmmer/<OG>_domains.txt   shards merged in input order
+                                 05_domains/hmmer/<OG>.log
+
+Shards are contiguous, so concatenating their tables in shard order keeps
+the query order of the input file (the header is taken from the first
+shard). The custom profiles of 03_alignments/*.aln are built the same way,
+one hmmbuild per alignment on the same pool. Every shard and build is
+timed in 05_domains/hmmer/hmmscan_report.tsv.
+
+The commands are templates ({input}, {output}, {log}, {hmm_db}, {threads})
+and can be replaced with --tool NAME=TEMPLATE; --stub swaps in a stand-in
+scanner and builder (one full-length 'Stub' domain per sequence) for
+testing without HMMER or Pfam.
+"""
+
+import argparse
+import glob
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from run_homolog_search import read_fasta_records
+
+TOOLS = {
+    'hmmscan': 'hmmscan --cpu {threads} --domtblout {output} {hmm_db} {input} > {log}',
+    'hmmbuild': 'hmmbuild --cpu {threads} {output} {input} > {log}',
+}
+
+_SCRIPT = shlex.quote(os.path.abspath(__file__))
+_PYTHON = shlex.quote(sys.executable)
+STUB_TOOLS = {
+    'hmmscan': f"{_PYTHON} {_SCRIPT} --stub-hmmscan {{input}} {{output}} > {{log}}",
+    'hmmbuild': f"{_PYTHON} {_SCRIPT} --stub-hmmbuild {{input}} {{output}} > {{log}}",
+}
+
+# Shards per worker when --shard-residues is not given, so that the last
+# shards to finish are small
+SHARDS_PER_WORKER = 4
+
+
+def record_residues(record):
+    """Residues of one FASTA record text"""
+    return sum(len(line.strip()) for line in record.split('\n')[1:])
+
+
+def shard_by_residues(records, max_residues):
+    """Split records into contiguous shards of about equal residues, none much above max_residues"""
+    residues = [record_residues(text) for _, text in records]
+    total = sum(residues)
+    n_shards = max(1, min(len(records), -(-total // max(1, max_residues))))
+    target = total / n_shards
+
+    shards, shard, filled = [], [], 0
+    for record, size in zip(records, residues):
+        # Close the shard when this record is better placed in the next one
+        if shard and len(shards) < n_shards - 1 and filled + size / 2 > target * (len(shards) + 1):
+            shards.append(shard)
+            shard = []
+        shard.append(record)
+        filled += size
+    shards.append(shard)
+    return shards
+
+
+def _run(command):
+    """Run one command, returns (ok, seconds, error)"""
+    began = time.time()
+    result = subprocess.run(command, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return result.returncode == 0, time.time() - began, result.stderr.decode(errors='replace').strip()
+
+
+def _run_task(task):
+    ok, seconds, error = _run(task['command'])
+    return ok and os.path.exists(task['output']), seconds, error
+
+
+def merge_domtblout(shard_outputs, output_file, query_file):
+    """Concatenate shard domtblout tables in order: one header, all hits, one footer"""
+    footer = []
+    with open(f"{output_file}.tmp-{os.getpid()}", 'w') as out:
+        for i, path in enumerate(shard_outputs):
+            in_header = True
+            with open(path, 'r') as f:
+                for line in f:
+                    if not line.startswith('#'):
+                        in_header = False
+                        out.write(line)
+                    elif in_header:
+                        if i == 0:
+                            out.write(line)
+                        in_header = not line.startswith('#-')
+                    elif i == 0:
+                        footer.append(line)
+        for line in footer:
+            if line.startswith('# Query file:'):
+                line = f"# Query file:      {query_file} ({len(shard_outputs)} shards)\n"
+            out.write(line)
+    os.replace(f"{output_file}.tmp-{os.getpid()}", output_file)
+
+
+def merge_logs(shard_logs, log_file):
+    with open(log_file, 'w') as out:
+        for path in shard_logs:
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    out.write(f.read())
+
+
+def plan_scans(query_files, out_dir, tmp_dir, templates, hmm_db, threads, max_residues):
+    """{query file: [shard tasks]} of every query FASTA"""
+    plans = {}
+    for query_file in query_files:
+        base = os.path.splitext(os.path.basename(query_file))[0]
+        records = read_fasta_records([query_file])
+        tasks = []
+        for i, shard in enumerate(shard_by_residues(records, max_residues) if records else []):
+            shard_file = os.path.join(tmp_dir, f"{base}.shard{i}.fasta")
+            with open(shard_file, 'w') as f:
+                f.write(''.join(text for _, text in shard))
+            output = os.path.join(tmp_dir, f"{base}.shard{i}.domtblout")
+            log = os.path.join(tmp_dir, f"{base}.shard{i}.log")
+            command = templates['hmmscan'].format(
+                input=shlex.quote(shard_file), output=shlex.quote(output), log=shlex.quote(log),
+                hmm_db=shlex.quote(hmm_db), threads=threads)
+            tasks.append({'name': f"{base}:shard{i}", 'tool': 'hmmscan', 'command': command,
+                          'output': output, 'log': log, 'sequences': len(shard),
+                          'residues': sum(record_residues(text) for _, text in shard)})
+        plans[query_file] = (os.path.join(out_dir, f"{base}_domains.txt"), os.path.join(out_dir, f"{base}.log"),
+                             tasks)
+    return plans
+
+
+def plan_builds(alignment_files, profile_dir, templates, threads):
+    """hmmbuild task of every alignment"""
+    tasks = []
+    for alignment in alignment_files:
+        base = os.path.splitext(os.path.basename(alignment))[0]
+        output = os.path.join(profile_dir, f"{base}.hmm")
+        log = os.path.join(profile_dir, f"{base}.log")
+        records = read_fasta_records([alignment])
+        # Cost for the largest-first order: residues, or bytes for non-FASTA alignments
+        residues = sum(record_residues(text) for _, text in records) or os.path.getsize(alignment)
+        command = templates['hmmbuild'].format(input=shlex.quote(alignment), output=shlex.quote(output),
+                                               log=shlex.quote(log), hmm_db='', threads=threads)
+        tasks.append({'name': f"{base}:hmmbuild", 'tool': 'hmmbuild', 'command': command, 'output': output,
+                      'log': log, 'sequences': len(records), 'residues': residues})
+    return tasks
+
+
+def run_tasks(tasks, workers, log=print):
+    """Run the tasks on a process pool, largest first; fills in status and seconds"""
+    order = sorted(tasks, key=lambda task: -task['residues'])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task, (ok, seconds, error) in zip(order, pool.map(_run_task, order)):
+            task['status'] = 'done' if ok else 'failed'
+            task['seconds'] = seconds
+            if ok:
+                log(f"  ✓ {task['name']} ({task['sequences']} sequences, {seconds:.1f}s)")
+            else:
+                log(f"  ✗ {task['name']} failed: {error[-200:]}")
+
+
+def write_report(tasks, report_file, threads):
+    """One line per shard or build: name, tool, sequences, residues, threads, seconds, status"""
+    os.makedirs(os.path.dirname(report_file) or '.', exist_ok=True)
+    with open(report_file, 'w') as f:
+        f.write('task\ttool\tsequences\tresidues\tthreads\tseconds\tstatus\n')
+        for task in tasks:
+            f.write(f"{task['name']}\t{task['tool']}\t{task['sequences']}\t{task['residues']}\t"
+                    f"{threads}\t{task.get('seconds', 0.0):.2f}\t{task.get('status', 'skipped')}\n")
+
+
+def run_sharded(query_files, alignment_files, hmm_db, out_dir='05_domains/hmmer',
+                profile_dir='05_domains/custom_profiles', workers=None, threads=1, shard_residues=None,
+                templates=TOOLS, report_file=None, log=print):
+    """Scan every query file and build every profile, returns (scan failures, build failures)"""
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    if alignment_files:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    if shard_residues is None:
+        total = sum(record_residues(text) for _, text in read_fasta_records(query_files))
+        shard_residues = max(1, -(-total // (workers * SHARDS_PER_WORKER)))
+
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix='.hmmscan_') as tmp:
+        plans = plan_scans(query_files, out_dir, tmp, templates, hmm_db, threads, shard_residues)
+        scans = [task for _, _, tasks in plans.values() for task in tasks]
+        builds = plan_builds(alignment_files, profile_dir, templates, threads)
+        log(f"{len(scans)} hmmscan shards of {len(plans)} files, {len(builds)} hmmbuild jobs, "
+            f"{workers} workers")
+        run_tasks(scans + builds, workers, log)
+
+        scan_failures = 0
+        for query_file, (output, log_file, tasks) in plans.items():
+            if tasks and all(task['status'] == 'done' for task in tasks):
+                merge_domtblout([task['output'] for task in tasks], output, query_file)
+                merge_logs([task['log'] for task in tasks], log_file)
+            elif tasks:
+                scan_failures += 1
+                log(f"  ✗ {query_file}: not merged, {sum(t['status'] == 'failed' for t in tasks)} shards failed")
+
+    if report_file:
+        write_report(scans + builds, report_file, threads)
+    return scan_failures, sum(task['status'] == 'failed' for task in builds)
+
+
+def stub_hmmscan(query_file, output_file):
+    """Stand-in for hmmscan: one full-length 'Stub' domain per sequence, in domtblout layout"""
+    records = read_fasta_records([query_file])
+    with open(output_file, 'w') as f:
+        f.write("# target name accession tlen query name accession qlen E-value score bias "
+                "# of c-Evalue i-Evalue score bias from to from to from to acc description\n")
+        f.write("#------------------- ----------\n")
+        for seq_id, text in records:
+            length = record_residues(text)
+            f.write(f"Stub PF00000.0 {length} {seq_id} - {length} 1e-10 50.0 0.0 1 1 "
+                    f"1e-14 1e-10 50.0 0.0 1 {length} 1 {length} 1 {length} 1.00 Stub domain\n")
+        f.write("#\n# Program:         stub_hmmscan\n"
+                f"# Query file:      {query_file}\n# [ok]\n")
+
+
+def stub_hmmbuild(alignment_file, output_file):
+    """Stand-in for hmmbuild: a profile file naming the alignment"""
+    with open(output_file, 'w') as f:
+        f.write(f"HMMER3/f [stub]\nNAME  {os.path.splitext(os.path.basename(alignment_file))[0]}\n"
+                f"NSEQ  {len(read_fasta_records([alignment_file]))}\n//\n")
+
+
+def parse_tool(value):
+    name, sep, template = value.partition('=')
+    if not sep or name not in TOOLS:
+        raise argparse.ArgumentTypeError(f"expected NAME=TEMPLATE with NAME in {', '.join(TOOLS)}")
+    return name, template
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('queries', nargs='*', help="FASTA files to scan (default: 04_orthogroups/*.fasta)")
+    parser.add_argument('--hmm-db', default='05_domains/pfam_database/Pfam-A.hmm')
+    parser.add_argument('--alignments', nargs='*',
+                        help="alignments to build profiles from (default: 03_alignments/*.aln)")
+    parser.add_argument('--out-dir', default='05_domains/hmmer')
+    parser.add_argument('--profile-dir', default='05_domains/custom_profiles')
+    parser.add_argument('--workers', type=int, help="processes at once (default: all cores)")
+    parser.add_argument('--threads', type=int, default=1, help="--cpu of every hmmscan/hmmbuild")
+    parser.add_argument('--shard-residues', type=int,
+                        help=f"residues per shard (default: total / ({SHARDS_PER_WORKER} x workers))")
+    parser.add_argument('--tool', type=parse_tool, action='append', default=[],
+                        help="override a command, e.g. --tool 'hmmscan=hmmscan --cut_ga --cpu {threads} "
+                             "--domtblout {output} {hmm_db} {input} > {log}'")
+    parser.add_argument('--stub', action='store_true', help="use the stand-in scanner and builder")
+    parser.add_argument('--report', default='05_domains/hmmer/hmmscan_report.tsv')
+    parser.add_argument('--stub-hmmscan', nargs=2, metavar=('QUERY', 'OUTPUT'), help=argparse.SUPPRESS)
+    parser.add_argument('--stub-hmmbuild', nargs=2, metavar=('ALIGNMENT', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stub_hmmscan:
+        stub_hmmscan(*args.stub_hmmscan)
+        sys.exit(0)
+    if args.stub_hmmbuild:
+        stub_hmmbuild(*args.stub_hmmbuild)
+        sys.exit(0)
+
+    templates = dict(STUB_TOOLS if args.stub else TOOLS, **dict(args.tool))
+    queries = args.queries or sorted(glob.glob('04_orthogroups/*.fasta'))
+    alignments = sorted(glob.glob('03_alignments/*.aln')) if args.alignments is None else args.alignments
+    # Unmatched shell globs arrive as literal patterns
+    for path in [path for path in queries + alignments if not os.path.exists(path)]:
+        print(f"⚠ File not found: {path}")
+    queries = [path for path in queries if os.path.exists(path)]
+    alignments = [path for path in alignments if os.path.exists(path)]
+
+    start = time.time()
+    scan_failures, build_failures = run_sharded(
+        queries, alignments, args.hmm_db, args.out_dir, args.profile_dir, args.workers, args.threads,
+        args.shard_residues, templates, args.report)
+
+    print(f"✓ {len(queries) - scan_failures} of {len(queries)} files scanned, "
+          f"{len(alignments) - build_failures} of {len(alignments)} profiles built ({time.time() - start:.1f}s)")
+    print(f"Report saved to {args.report}")
+    if scan_failures:
+        sys.exit(1)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+
+"""
+Sharded local homolog search for a set of query proteins (MYOD1, MYF5, MYOG, MYF6, ...)
+
+Runs blastp against local BLAST databases or DIAMOND databases (.dmnd, e.g.
+the diamondDBSpecies*.dmnd files OrthoFinder builds) instead of the remote
+refseq_protein search of run_phase2a_full.sh. The queries are split into
+shards and every (shard, database) pair is searched by one worker of a
+process pool. The hits are merged into the 18-column annotated layout of
+02_blast_results/MYOD1_homologs_annotated.tsv, ready for
+process_blast_hits.py.
+
+blastp reports the taxonomy of every subject (staxids, sscinames,
+sblastnames, sskingdoms), so multi-species databases keep one species per
+hit. DIAMOND databases are per species (OrthoFinder builds one per
+proteome) and their hits are labelled with the species of the database.
+
+The search command can be replaced (--search-cmd) by any program that
+writes the requested columns, e.g. a stand-in for a tiny test database.
+--check runs the default BLAST and DIAMOND command lines against a
+stand-in database through a stand-in search that parses their arguments
+the way blastp and diamond do.
+"""
+
+import argparse
+import glob
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from process_blast_hits import HEADER
+
+# Columns requested from the search tool. blastp returns all 18 annotated
+# columns; for DIAMOND the taxonomy columns (tax_id, species_name,
+# blast_name, kingdom) come from the database label
+BLAST_FIELDS = ('qseqid sseqid pident length mismatch gapopen qstart qend '
+                'sstart send evalue bitscore qcovs staxids sscinames sblastnames sskingdoms stitle')
+DIAMOND_FIELDS = ('qseqid sseqid pident length mismatch gapopen qstart qend '
+                  'sstart send evalue bitscore qcovhsp stitle')
+
+BLAST_CMD = ('blastp -query {query} -db {db} -out {out} -outfmt {outfmt} '
+             '-evalue {evalue} -max_target_seqs {max_targets} -num_threads {threads}')
+DIAMOND_CMD = ('diamond blastp --query {query} --db {db} --out {out} --outfmt 6 {fields} '
+               '--evalue {evalue} --max-target-seqs {max_targets} --threads {threads} --quiet')
+
+
+def read_fasta_records(fasta_files):
+    """[(id, record text)] of every sequence in the given FASTA files, in order"""
+    records = []
+    for path in fasta_files:
+        with open(path, 'r') as f:
+            text = f.read()
+        for block in text.split('>')[1:]:
+            header = block.split('\n', 1)[0].strip()
+            if header:
+                records.append((header.split()[0], '>' + block.rstrip('\n') + '\n'))
+    return records
+
+
+def shard_records(records, n_shards):
+    """Split records into at most n_shards contiguous, evenly sized shards"""
+    n_shards = max(1, min(n_shards, len(records)))
+    size, extra = divmod(len(records), n_shards)
+    shards, start = [], 0
+    for i in range(n_shards):
+        end = start + size + (i < extra)
+        shards.append(records[start:end])
+        start = end
+    return shards
+
+
+def load_species_table(species_file):
+    """{species name: (tax_id, common name)} from species_list.txt"""
+    table = {}
+    if not species_file or not os.path.exists(species_file):
+        return table
+    with open(species_file, 'r') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            parts = line.rstrip('\n').split('\t')
+            table[parts[0].replace('_', ' ')] = (parts[1] if len(parts) > 1 else 'N/A',
+                                                  parts[2] if len(parts) > 2 else 'N/A')
+    return table
+
+
+def _read_id_file(path):
+    """{id: value} from an OrthoFinder 'id: value' file"""
+    ids = {}
+    with open(path, 'r') as f:
+        for line in f:
+            key, sep, value = line.rstrip('\n').partition(': ')
+            if sep:
+                ids[key] = value
+    return ids
+
+
+def describe_database(db):
+    """(engine, species, sequence id map or None) of a database path
+
+    OrthoFinder DIAMOND databases (diamondDBSpecies<N>.dmnd) are named
+    through SpeciesIDs.txt and their renamed subjects (<N>_<i>) mapped back
+    through SequenceIDs.txt of the same working directory.
+    """
+    engine = 'diamond' if db.endswith('.dmnd') else 'blastp'
+    name = os.path.basename(db)
+    match = re.fullmatch(r'diamondDBSpecies(\d+)\.dmnd', name)
+
+    if match:
+        for work_dir in (os.path.dirname(db), os.path.dirname(os.path.dirname(db))):
+            species_ids = os.path.join(work_dir, 'SpeciesIDs.txt')
+            if os.path.exists(species_ids):
+                species_file = _read_id_file(species_ids).get(match.group(1), name)
+                sequence_ids = os.path.join(work_dir, 'SequenceIDs.txt')
+                seq_ids = _read_id_file(sequence_ids) if os.path.exists(sequence_ids) else None
+                species = re.sub(r'\.(fa|faa|fasta)$', '', species_file)
+                return engine, species.replace('_', ' '), seq_ids
+
+    species = re.sub(r'\.(dmnd|fa|faa|fasta|pal|psq)$', '', name)
+    return engine, species.replace('_', ' '), None
+
+
+def search_command(template, engine, query, db, out, evalue, max_targets, threads):
+    """Argument list of one search, from a command template"""
+    if template is None:
+        template = DIAMOND_CMD if engine == 'diamond' else BLAST_CMD
+    values = {'query': query, 'db': db, 'out': out, 'evalue': evalue,
+              'max_targets': max_targets, 'threads': threads, 'outfmt': '6 ' + BLAST_FIELDS}
+    values = {k: shlex.quote(str(v)) for k, v in values.items()}
+    # DIAMOND takes every output field as its own argument after '6'
+    values['fields'] = DIAMOND_FIELDS
+    return shlex.split(template.format(**values))
+
+
+def run_search(command, out):
+    """Run one search and return its hits as lists of 18 fields
+
+    Rows with the taxonomy columns (blastp) are kept as they are; rows with
+    the 14 DIAMOND columns get empty taxonomy fields before the title.
+    """
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    hits = []
+    with open(out, 'r') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 18:
+                hits.append(fields[:18])
+            elif len(fields) >= 13:
+                hits.append(fields[:13] + [''] * 4 + (fields + [''])[13:14])
+    return hits
+
+
+def annotate_hits(hits, species, species_table, seq_ids=None):
+    """Annotated 18-column lines for the hits of one database
+
+    Hits without taxonomy from the search tool (DIAMOND) are labelled with
+    the species of the database and its tax ID from species_table.
+    """
+    tax_id = species_table.get(species, ('N/A', 'N/A'))[0]
+    lines = []
+    for fields in hits:
+        subject, title = fields[1], fields[17]
+        if seq_ids is not None and subject in seq_ids:
+            original = seq_ids[subject]
+            if title in ('', subject):
+                title = original
+            subject = original.split()[0]
+        if title.split(' ', 1)[0] == subject:
+            title = title.partition(' ')[2]
+        if fields[13]:
+            taxonomy = [value or 'N/A' for value in fields[13:17]]
+        else:
+            taxonomy = [tax_id, species, 'N/A', 'N/A']
+        lines.append(fields[:1] + [subject] + fields[2:13] + taxonomy + [title or 'N/A'])
+    return lines
+
+
+def merge_hits(rows, query_order):
+    """Hits grouped by query (input order), best bitscore and e-value first"""
+    rank = {query: i for i, query in enumerate(query_order)}
+
+    def sort_key(row):
+        return (rank.get(row[0], len(rank)), -float(row[11]), float(row[10]))
+
+    return sorted(rows, key=sort_key)
+
+
+def _search_task(command, out, species, species_table, seq_ids):
+    return annotate_hits(run_search(command, out), species, species_table, seq_ids)
+
+
+def run_homolog_search(query_files, databases, output_file, workers=4, shards=None,
+                       threads=None, evalue=1e-5, max_targets=5000, search_cmd=None,
+                       species_table=None):
+    """Search every query against every database and write the annotated table
+
+    Returns the number of hits written.
+    """
+    records = read_fasta_records(query_files)
+    if not records:
+        raise ValueError(f"No query sequences in {', '.join(query_files)}")
+
+    shard_list = shard_records(records, shards or workers)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    species_table = species_table or {}
+
+    out_dir = os.path.dirname(output_file) or '.'
+    os.makedirs(out_dir, exist_ok=True)
+
+    rows = []
+    with tempfile.TemporaryDirectory(dir=out_dir, prefix='.search_') as tmp:
+        tasks = []
+        for i, shard in enumerate(shard_list):
+            query = os.path.join(tmp, f"shard{i}.fasta")
+            with open(query, 'w') as f:
+                f.write(''.join(text for _, text in shard))
+            for j, db in enumerate(databases):
+                engine, species, seq_ids = describe_database(db)
+                out = os.path.join(tmp, f"shard{i}_db{j}.tsv")
+                command = search_command(search_cmd, engine, query, db, out,
+                                         evalue, max_targets, threads)
+                tasks.append((command, out, species, species_table, seq_ids))
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Results are collected in task order so ties merge deterministically
+            for hits in pool.map(_search_task, *zip(*tasks)):
+                rows.extend(hits)
+
+    rows = merge_hits(rows, [query_id for query_id, _ in records])
+
+    with open(output_file, 'w') as out:
+        out.write(HEADER)
+        out.writelines('\t'.join(row) + '\n' for row in rows)
+
+    return len(rows)
+
+
+def stub_search(argv):
+    """Stand-in for 'blastp ...' or 'diamond blastp ...' against a FASTA file as database
+
+    Parses the options the way the real program does, so a wrongly quoted
+    command line fails here too, and reports every ungapped query/subject
+    pair as one hit. Subject taxonomy comes from UniProt-style OS= and OX=
+    header fields, as blastp takes it from a taxonomy-aware database.
+    """
+    if argv[:2] == ['diamond', 'blastp']:
+        parser = argparse.ArgumentParser(prog='diamond blastp')
+        for option in ('--query', '--db', '--out', '--evalue', '--max-target-seqs', '--threads'):
+            parser.add_argument(option, required=option in ('--query', '--db', '--out'))
+        parser.add_argument('--outfmt', nargs='+', required=True)
+        parser.add_argument('--quiet', action='store_true')
+        args = parser.parse_args(argv[2:])
+        outfmt, known = args.outfmt, DIAMOND_FIELDS.split()
+    elif argv[:1] == ['blastp']:
+        parser = argparse.ArgumentParser(prog='blastp', prefix_chars='-')
+        for option in ('-query', '-db', '-out', '-outfmt', '-evalue', '-max_target_seqs', '-num_threads'):
+            parser.add_argument(option, required=option in ('-query', '-db', '-out', '-outfmt'))
+        args = parser.parse_args(argv[1:])
+        outfmt, known = args.outfmt.split(), BLAST_FIELDS.split()
+    else:
+        raise SystemExit(f"stub search: unknown program {' '.join(argv[:2])}")
+
+    fields = outfmt[1:]
+    if outfmt[0] != '6' or not fields or any(field not in known for field in fields):
+        raise SystemExit(f"stub search: invalid output format {' '.join(outfmt)!r}")
+
+    subjects = read_fasta_records([args.db])
+    with open(args.out, 'w') as out:
+        for query_id, query_text in read_fasta_records([args.query]):
+            query_seq = ''.join(query_text.splitlines()[1:])
+            for subject_id, subject_text in subjects:
+                subject_seq = ''.join(subject_text.splitlines()[1:])
+                title = subject_text.split('\n', 1)[0][1:]
+                scientific = re.search(r'OS=(.+?)(?: OX=|$)', title)
+                taxid = re.search(r'OX=(\d+)', title)
+                length = min(len(query_seq), len(subject_seq))
+                matches = sum(a == b for a, b in zip(query_seq, subject_seq))
+                row = {'qseqid': query_id, 'sseqid': subject_id,
+                       'pident': f"{100.0 * matches / max(length, 1):.3f}",
+                       'length': length, 'mismatch': length - matches, 'gapopen': 0,
+                       'qstart': 1, 'qend': length, 'sstart': 1, 'send': length,
+                       'evalue': '1e-50', 'bitscore': f"{2.0 * matches:.1f}",
+                       'qcovs': round(100 * length / max(len(query_seq), 1)),
+                       'qcovhsp': round(100 * length / max(len(query_seq), 1)),
+                       'staxids': taxid.group(1) if taxid else 0,
+                       'sscinames': scientific.group(1) if scientific else 'N/A',
+                       'sblastnames': 'N/A', 'sskingdoms': 'Eukaryota' if taxid else 'N/A',
+                       'stitle': title}
+                out.write('\t'.join(str(row[field]) for field in fields) + '\n')
+
+
+def check_search_commands(workers=2):
+    """Run the default BLAST and DIAMOND command lines against a stand-in database
+
+    The BLAST database holds two species, whose hits must keep their own
+    species; the DIAMOND database is labelled by its file name. Returns the
+    number of hits found per engine; raises if a command is rejected or a
+    hit does not come back in the annotated layout.
+    """
+    stub = f"{shlex.quote(sys.executable)} {shlex.quote(os.path.abspath(__file__))} --stub-search "
+    sequences = {'MYOD1_check': 'MELLSPPLRDVDLTAPDGSLCSFATTDDFYDDPCFDSPDLRFFEDLDPRLMHVGALLKPEEHSHFPAAVHPAPGAREDEH',
+                 'MYF5_check': 'MDVMDGCQFSPSEYFYDGSCIPSPEGEFGDEFVPRVAAFGAHKAELQGSDEDEHVRAPTGHHQAGHCLMWACKACKRKSTTMDRRKAATMRERRRLKKVNQAFETLKRCTT'}
+    counts = {}
+    with tempfile.TemporaryDirectory(prefix='.search_check_') as tmp:
+        query = os.path.join(tmp, 'query.fasta')
+        with open(query, 'w') as f:
+            f.write(''.join(f">{name} check query\n{seq}\n" for name, seq in sequences.items()))
+        subject_species = {'MYOD1_check': ('Homo sapiens', '9606'),
+                           'MYF5_check': ('Mus musculus', '10090')}
+        for engine, db, template in (('blastp', 'vertebrate_proteins', BLAST_CMD),
+                                     ('diamond', 'Homo_sapiens.dmnd', DIAMOND_CMD)):
+            db = os.path.join(tmp, db)
+            with open(db, 'w') as f:
+                for name, seq in sequences.items():
+                    scientific, taxid = subject_species[name]
+                    f.write(f">{name}_hit {name} subject OS={scientific} OX={taxid}\n{seq}\n")
+            output = os.path.join(tmp, f"{engine}_annotated.tsv")
+            counts[engine] = run_homolog_search([query], [db], output, workers=workers,
+                                                search_cmd=stub + template)
+            with open(output, 'r') as f:
+                rows = [line.rstrip('\n').split('\t') for line in f.readlines()[1:]]
+            if engine == 'blastp':
+                expected = [subject_species[row[1][:-len('_hit')]][::-1] for row in rows]
+            else:
+                expected = [('N/A', 'Homo sapiens')] * len(rows)
+            if (counts[engine] != len(sequences) ** 2 or any(len(row) != 18 for row in rows)
+                    or [tuple(row[13:15]) for row in rows] != expected):
+                raise RuntimeError(f"{engine}: unexpected hits in {output}")
+    return counts
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--stub-search']:
+        stub_search(sys.argv[2:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('queries', nargs='*', default=sorted(glob.glob('01_sequences/query/*.fasta')),
+                        help="query FASTA files (default: 01_sequences/query/*.fasta)")
+    parser.add_argument('--db', nargs='+',
+                        help="BLAST database prefixes or DIAMOND .dmnd files")
+    parser.add_argument('--output', default='02_blast_results/MRF_homologs_annotated.tsv')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--shards', type=int, help="query shards (default: --workers)")
+    parser.add_argument('--threads', type=int, help="threads per search (default: cores / workers)")
+    parser.add_argument('--evalue', type=float, default=1e-5)
+    parser.add_argument('--max-targets', type=int, default=5000)
+    parser.add_argument('--species-list', default='03_orthofinder/species_list.txt',
+                        help="species table with taxonomy IDs (default: 03_orthofinder/species_list.txt)")
+    parser.add_argument('--search-cmd',
+                        help="search command template with {query} {db} {out} {evalue} "
+                             "{max_targets} {threads} {fields} {outfmt} placeholders")
+    parser.add_argument('--check', action='store_true',
+                        help="run the BLAST and DIAMOND command lines against a stand-in database and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        for engine, n_hits in check_search_commands().items():
+            print(f"✓ {engine}: {n_hits} hits from the stand-in database")
+        sys.exit(0)
+    if not args.db:
+        parser.error("--db is required")
+
+    print(f"Queries: {len(read_fasta_records(args.queries))} sequences, "
+          f"databases: {len(args.db)}, workers: {args.workers}")
+    start = time.time()
+
+    n_hits = run_homolog_search(args.queries, args.db, args.output, args.workers, args.shards,
+                                args.threads, args.evalue, args.max_targets, args.search_cmd,
+                                load_species_table(args.species_list))
+
+    print(f"Total hits found: {n_hits} ({time.time() - start:.1f}s)")
+    print(f"Results saved to {args.output}")
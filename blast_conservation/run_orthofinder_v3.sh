@@ -5,7 +5,7 @@ echo "Phase 2C: OrthoFinder v3.1.0 + DIAMOND"
 echo "========================================"
 echo ""
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 # Verify tools
 echo "Checking tools..."
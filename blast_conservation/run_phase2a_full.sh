@@ -5,7 +5,7 @@ echo "Phase 2A: Full BLAST Search"
 echo "========================================"
 echo ""
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 # Run full BLAST with 5000 targets
 echo "Running comprehensive BLAST search..."
@@ -44,41 +44,15 @@ HEADER
     echo "✓ Annotated file created"
     echo ""
     
-    # Filter high-quality hits (coverage ≥30%, identity ≥25%)
-    echo "Filtering high-quality hits..."
-    awk -F'\t' 'NR==1 || ($13 >= 30 && $3 >= 25)' 02_blast_results/MYOD1_homologs_annotated.tsv > 02_blast_results/MYOD1_homologs_filtered.tsv
-    
-    FILTERED=$(( $(wc -l < 02_blast_results/MYOD1_homologs_filtered.tsv) - 1 ))
-    echo "Filtered hits: $FILTERED"
-    echo ""
-    
-    # Get unique species (best hit per species)
-    echo "Selecting best hit per species..."
-    tail -n +2 02_blast_results/MYOD1_homologs_filtered.tsv | \
-        sort -t$'\t' -k15,15 -k12,12rn | \
-        awk -F'\t' '!seen[$15]++' > 02_blast_results/MYOD1_homologs_unique_species.tsv
-    
-    UNIQUE=$(wc -l < 02_blast_results/MYOD1_homologs_unique_species.tsv)
-    echo "Unique species: $UNIQUE"
-    echo ""
-    
-    # Top 10 hits
-    echo "Top 10 hits:"
-    echo "Species	Identity%	BitScore"
-    sort -k12 -rn 02_blast_results/MYOD1_homologs_raw.tsv | head -n 10 | cut -f15,3,12
-    echo ""
-    
-    # Identity distribution
-    echo "Identity distribution:"
-    echo "  >90%: $(awk -F'\t' '$3 > 90' 02_blast_results/MYOD1_homologs_filtered.tsv | wc -l)"
-    echo "  70-90%: $(awk -F'\t' '$3 >= 70 && $3 <= 90' 02_blast_results/MYOD1_homologs_filtered.tsv | wc -l)"
-    echo "  50-70%: $(awk -F'\t' '$3 >= 50 && $3 < 70' 02_blast_results/MYOD1_homologs_filtered.tsv | wc -l)"
-    echo "  25-50%: $(awk -F'\t' '$3 >= 25 && $3 < 50' 02_blast_results/MYOD1_homologs_filtered.tsv | wc -l)"
-    echo ""
-    
-    # Get accession list for sequence download
-    echo "Creating accession list for top 100 hits..."
-    cut -f2 02_blast_results/MYOD1_homologs_unique_species.tsv | head -n 100 > 02_blast_results/top100_accessions.txt
+    # Filter (coverage ≥30%, identity ≥25%), best hit per species, identity
+    # distribution and accession list in a single pass
+    echo "Processing hits (filter, best hit per species, statistics)..."
+    python3 process_blast_hits.py 02_blast_results/MYOD1_homologs_annotated.tsv \
+        --out-dir 02_blast_results \
+        --prefix MYOD1_homologs \
+        --min-coverage 30 \
+        --min-identity 25 \
+        --top-n 100
     echo "✓ Accession list created"
     echo ""
     
@@ -91,6 +65,7 @@ HEADER
     echo "  - MYOD1_homologs_filtered.tsv (quality filtered)"
     echo "  - MYOD1_homologs_unique_species.tsv (best per species)"
     echo "  - top100_accessions.txt (for sequence retrieval)"
+    echo "  - statistics/MYOD1_homologs_blast_summary.txt"
     echo ""
     
 else
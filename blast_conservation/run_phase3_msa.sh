@@ -5,7 +5,7 @@ echo "Phase 3: Multiple Sequence Alignment"
 echo "========================================"
 echo ""
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 # Create directories
 mkdir -p 03_alignments
@@ -28,64 +28,12 @@ echo "Step 1: Extracting Orthogroup Sequences"
 echo "========================================"
 echo ""
 
-# Parse orthogroups and extract sequences
-echo "Extracting OG0000000 (MYOD1 + MYF5 group)..."
-
-# Get accessions from OG0000000
-grep "^OG0000000:" 03_orthofinder/results/Results_Nov06/Orthogroups/Orthogroups.txt | \
-    sed 's/OG0000000: //' | \
-    tr ' ' '\n' > 03_alignments/OG0000000_accessions.txt
-
-OG0_COUNT=$(wc -l < 03_alignments/OG0000000_accessions.txt)
-echo "  Found $OG0_COUNT sequences"
-
-# Extract sequences for OG0000000
-> 03_alignments/OG0000000_sequences.fasta
-
-for acc in $(cat 03_alignments/OG0000000_accessions.txt); do
-    # Search in all proteome files
-    for fasta in 03_orthofinder/proteomes/*.fasta; do
-        if grep -q "^>$acc" "$fasta"; then
-            # Extract sequence
-            awk -v acc="$acc" '
-                BEGIN { found=0 }
-                /^>/ { if ($0 ~ "^>"acc) found=1; else found=0 }
-                found { print }
-            ' "$fasta" >> 03_alignments/OG0000000_sequences.fasta
-        fi
-    done
-done
-
-SEQ0_COUNT=$(grep -c "^>" 03_alignments/OG0000000_sequences.fasta)
-echo "  ✓ Extracted $SEQ0_COUNT sequences to OG0000000_sequences.fasta"
-echo ""
-
-# Extract OG0000001 (MYOG group)
-echo "Extracting OG0000001 (MYOG group)..."
-
-grep "^OG0000001:" 03_orthofinder/results/Results_Nov06/Orthogroups/Orthogroups.txt | \
-    sed 's/OG0000001: //' | \
-    tr ' ' '\n' > 03_alignments/OG0000001_accessions.txt
-
-OG1_COUNT=$(wc -l < 03_alignments/OG0000001_accessions.txt)
-echo "  Found $OG1_COUNT sequences"
-
-> 03_alignments/OG0000001_sequences.fasta
-
-for acc in $(cat 03_alignments/OG0000001_accessions.txt); do
-    for fasta in 03_orthofinder/proteomes/*.fasta; do
-        if grep -q "^>$acc" "$fasta"; then
-            awk -v acc="$acc" '
-                BEGIN { found=0 }
-                /^>/ { if ($0 ~ "^>"acc) found=1; else found=0 }
-                found { print }
-            ' "$fasta" >> 03_alignments/OG0000001_sequences.fasta
-        fi
-    done
-done
-
-SEQ1_COUNT=$(grep -c "^>" 03_alignments/OG0000001_sequences.fasta)
-echo "  ✓ Extracted $SEQ1_COUNT sequences to OG0000001_sequences.fasta"
+# Extract the sequences of every orthogroup in Orthogroups.txt in one pass,
+# using the byte-offset index of the proteomes (built once, then reused)
+python3 fasta_index.py \
+    --proteomes 03_orthofinder/proteomes/*.fasta \
+    --orthogroups 03_orthofinder/results/Results_Nov06/Orthogroups/Orthogroups.txt \
+    --out-dir 03_alignments
 echo ""
 
 echo "========================================"
@@ -5,7 +5,7 @@ echo "Phase 4: Phylogenetic Tree Construction"
 echo "========================================"
 echo ""
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 # Check for IQ-TREE
 echo "Checking for required tools..."
@@ -73,20 +73,16 @@ cd ../../
 echo -e "${GREEN}Running HMMER domain search...${NC}"
 mkdir -p 05_domains/hmmer 05_domains/custom_profiles
 
-# Example: Run hmmscan on orthogroups (adjust filenames as needed)
-for ogfile in 04_orthogroups/*.fasta; do
-    base=$(basename "$ogfile" .fasta)
-    echo -e "${YELLOW}Analyzing ${base}...${NC}"
-    hmmscan --cpu 4 --domtblout 05_domains/hmmer/${base}_domains.txt \
-        05_domains/pfam_database/Pfam-A.hmm "$ogfile" > 05_domains/hmmer/${base}.log
-done
-
-# ---- Build custom HMM profiles ----
-echo -e "${YELLOW}Building custom HMM profiles...${NC}"
-for aln in 03_alignments/*.aln; do
-    base=$(basename "$aln" .aln)
-    hmmbuild 05_domains/custom_profiles/${base}.hmm "$aln" || echo -e "${RED}✗ Failed to build HMM for ${base}${NC}"
-done
+# hmmscan on orthogroups, sharded by residues over all cores (one thread per
+# process); the custom HMM profiles of 03_alignments/*.aln are built on the
+# same pool. Shard timings: 05_domains/hmmer/hmmscan_report.tsv
+python3 run_hmmscan_sharded.py 04_orthogroups/*.fasta \
+    --hmm-db 05_domains/pfam_database/Pfam-A.hmm \
+    --alignments 03_alignments/*.aln
+
+# ---- Parse domain hits (thresholds, overlap resolution) ----
+echo -e "${YELLOW}Parsing HMMER domain tables...${NC}"
+python3 parse_hmmer.py || echo -e "${RED}⚠ Domain table parsing encountered an error${NC}"
 
 # ---- Run conservation analysis ----
 echo -e "${YELLOW}Running domain conservation analysis...${NC}"
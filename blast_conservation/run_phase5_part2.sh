@@ -5,7 +5,7 @@ echo "Phase 5 Part 2: Domain Visualization"
 echo "========================================"
 echo ""
 
-cd ~/PGB/MYOD1_project
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project}"
 
 # Install visualization packages
 echo "Installing visualization packages..."
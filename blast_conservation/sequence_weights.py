@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+Sequence weights that correct conservation scores for redundant homologs
+
+    henikoff   position-based weights (Henikoff & Henikoff 1994): every column
+               gives 1 / (r * n) to a sequence, r being the number of distinct
+               residues in the column and n the number of sequences sharing
+               the residue of that sequence; gaps give nothing
+    identity   1 / size of the identity cluster of a sequence: the number of
+               sequences (itself included) with at least --identity identical
+               residues over the columns where both have a residue
+
+Both are computed on the uint8 matrix of alignment_matrix.py and scaled to
+sum to the number of sequences, so weighted counts stay on the scale of
+plain counts. Weights are cached with the alignment (.alignment_cache/) and
+recomputed only when the FASTA file changes; identity weights are cached
+with the effective number of sequences.
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+from alignment_matrix import GAP, N_SYMBOLS, cache_file, flat_codes, load_alignment, pair_one_hot, source_key
+
+METHODS = ('henikoff', 'identity')
+IDENTITY_THRESHOLD = 0.8
+
+# Rows compared at a time by identity_neighbours
+_BLOCK = 512
+
+
+def henikoff_weights(codes):
+    """Position-based weights of the rows of a code matrix"""
+    n_columns = codes.shape[1]
+    flat = flat_codes(codes)
+    counts = np.bincount(flat.ravel(), minlength=n_columns * N_SYMBOLS)
+    distinct = (counts.reshape(n_columns, N_SYMBOLS)[:, 1:] > 0).sum(axis=1)
+
+    # 1 / (distinct residues in the column * sequences sharing the residue)
+    with np.errstate(divide='ignore'):
+        share = 1.0 / (distinct[None, :] * counts[flat])
+    share[codes == GAP] = 0.0
+    return _scale(share.sum(axis=1))
+
+
+def identity_neighbours(codes, threshold=IDENTITY_THRESHOLD):
+    """Number of sequences at >= threshold identity to every sequence (itself included)"""
+    n_sequences = len(codes)
+    residue = codes != GAP
+
+    # One-hot matrix over the (column, residue) pairs that occur, so that
+    # identical residues of two sequences are one dot product
+    one_hot, _ = pair_one_hot(codes, residue)
+    residue = residue.astype(np.float32)
+
+    neighbours = np.zeros(n_sequences, dtype=np.int64)
+    for start in range(0, n_sequences, _BLOCK):
+        block = slice(start, start + _BLOCK)
+        identical = one_hot[block] @ one_hot.T
+        aligned = residue[block] @ residue.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            identity = np.where(aligned > 0, identical / aligned, 0.0)
+        # A sequence always counts itself, even if it is all gaps
+        rows = np.arange(identity.shape[0])
+        identity[rows, rows + start] = 1.0
+        neighbours[block] = (identity >= threshold).sum(axis=1)
+    return neighbours
+
+
+def identity_weights(codes, threshold=IDENTITY_THRESHOLD):
+    """1 / size of the identity cluster of every sequence"""
+    return _scale(1.0 / identity_neighbours(codes, threshold))
+
+
+def effective_sequences(codes, threshold=IDENTITY_THRESHOLD):
+    """Effective number of sequences: sum of the unscaled identity weights"""
+    return float((1.0 / identity_neighbours(codes, threshold)).sum())
+
+
+def _scale(weights):
+    total = weights.sum()
+    return weights * (len(weights) / total) if total > 0 else np.ones(len(weights))
+
+
+def sequence_weights(codes, method='henikoff', threshold=IDENTITY_THRESHOLD):
+    """Weights of one of METHODS (None gives equal weights)"""
+    if method is None:
+        return np.ones(len(codes))
+    if method == 'henikoff':
+        return henikoff_weights(codes)
+    if method == 'identity':
+        return identity_weights(codes, threshold)
+    raise ValueError(f"Unknown weighting: {method} (expected one of {', '.join(METHODS)})")
+
+
+def _load_cached(fasta_file, method, threshold, cache_dir, alignment):
+    """Cache entry {weights, ...} of one weighting method, computed if missing or stale"""
+    suffix = f"{method}.npz" if method == 'henikoff' else f"{method}{threshold:g}.npz"
+    path = cache_file(fasta_file, suffix, cache_dir)
+    source = source_key(fasta_file)
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            if np.array_equal(cached['source'], source) and (method != 'identity' or 'effective' in cached):
+                return dict(cached)
+
+    alignment = alignment or load_alignment(fasta_file, cache_dir)
+    if method == 'identity':
+        inverse = 1.0 / identity_neighbours(alignment.codes, threshold)
+        entry = {'weights': _scale(inverse), 'effective': np.float64(inverse.sum())}
+    else:
+        entry = {'weights': sequence_weights(alignment.codes, method, threshold)}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp, source=source, **entry)
+    os.replace(tmp, path)
+    return entry
+
+
+def load_weights(fasta_file, method='henikoff', threshold=IDENTITY_THRESHOLD, cache_dir=None, alignment=None):
+    """Cached sequence weights of an aligned FASTA file, in alignment row order"""
+    if method is None:
+        alignment = alignment or load_alignment(fasta_file, cache_dir)
+        return np.ones(len(alignment))
+    return _load_cached(fasta_file, method, threshold, cache_dir, alignment)['weights']
+
+
+def load_effective_sequences(fasta_file, threshold=IDENTITY_THRESHOLD, cache_dir=None, alignment=None):
+    """Cached effective_sequences() of an aligned FASTA file (stored with the identity weights)"""
+    return float(_load_cached(fasta_file, 'identity', threshold, cache_dir, alignment)['effective'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('alignments', nargs='+', help="aligned FASTA files")
+    parser.add_argument('--method', choices=METHODS, default='henikoff')
+    parser.add_argument('--identity', type=float, default=IDENTITY_THRESHOLD,
+                        help="identity threshold of the identity clusters")
+    parser.add_argument('--out', help="write 'id<TAB>weight' lines of the (single) alignment here")
+    args = parser.parse_args()
+
+    for fasta_file in args.alignments:
+        start = time.time()
+        alignment = load_alignment(fasta_file)
+        weights = load_weights(fasta_file, args.method, args.identity, alignment=alignment)
+        print(f"  ✓ {fasta_file}: {len(weights)} sequences, weights {weights.min():.3f}-{weights.max():.3f} "
+              f"({time.time() - start:.2f}s)")
+        if args.out:
+            with open(args.out, 'w') as f:
+                for seq_id, weight in zip(alignment.ids, weights):
+                    f.write(f"{seq_id}\t{weight:.6f}\n")
+            print(f"Results saved to {args.out}")
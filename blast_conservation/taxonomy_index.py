@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+"""
+Offline taxonomy index built from an NCBI taxdump (nodes.dmp, names.dmp, merged.dmp)
+
+The taxonomy is stored as flat arrays indexed by tax ID in one .npz file:
+
+    parent       parent tax ID of every node (0 for unused IDs)
+    clade        precomputed clade code of every node (see CLADES)
+    name_bytes   scientific names, lower case, sorted and UTF-8 encoded
+                 back to back in one byte buffer
+    name_offsets start of every name in name_bytes, plus the end
+    name_taxids  tax ID of every name
+
+Clades are resolved for all nodes at build time by pointer jumping over the
+parent table, so classifying a tax ID is a single array lookup and
+classifying thousands of BLAST hits (staxids, including ';'-joined lists)
+is one vectorized call. Names are looked up through a hash table over the
+name buffer (built on first use), many names in one vectorized call.
+"""
+
+import argparse
+import contextlib
+import os
+import tarfile
+import numpy as np
+import pandas as pd
+
+INDEX_FILE = 'taxonomy_index.npz'
+
+CLADES = ['Other', 'Mammal', 'Bird', 'Reptile', 'Amphibian', 'Fish']
+
+CLADE_COLORS = {'Mammal': '#4169E1',     # Royal Blue
+                'Fish': '#228B22',       # Forest Green
+                'Amphibian': '#FF8C00',  # Dark Orange
+                'Bird': '#DC143C',       # Crimson
+                'Reptile': '#8B4513',    # Saddle Brown
+                'Other': '#808080'}      # Gray
+
+# Multiplier of the polynomial hash of name bytes (see _hash_names)
+_NAME_HASH_BASE = np.uint64(0x100000001B3)
+
+# Root tax IDs of every clade; the nearest labelled ancestor wins
+CLADE_ROOTS = {
+    40674: 'Mammal',       # Mammalia
+    8782: 'Bird',          # Aves
+    8504: 'Reptile',       # Lepidosauria
+    8459: 'Reptile',       # Testudines
+    1294634: 'Reptile',    # Crocodylia
+    8292: 'Amphibian',     # Amphibia
+    7898: 'Fish',          # Actinopterygii
+    7777: 'Fish',          # Chondrichthyes
+    1476529: 'Fish',       # Cyclostomata
+    7878: 'Fish',          # Dipnomorpha
+    118072: 'Fish',        # Actinistia
+}
+
+
+@contextlib.contextmanager
+def _open_dump(taxdump, name):
+    """Open <name> from a taxdump directory or taxdump.tar.gz"""
+    if os.path.isdir(taxdump):
+        with open(os.path.join(taxdump, name), 'rb') as f:
+            yield f
+        return
+    with tarfile.open(taxdump, 'r:*') as archive:
+        with archive.extractfile(name) as f:
+            yield f
+
+
+def _read_dump(taxdump, name, columns):
+    """Selected columns of a '\\t|\\t' separated dump file"""
+    with _open_dump(taxdump, name) as f:
+        return pd.read_csv(f, sep='\t', header=None, usecols=columns, quoting=3,
+                           dtype=str, keep_default_na=False)
+
+
+def _encode(strings):
+    """Strings UTF-8 encoded back to back in one byte buffer, plus their offsets"""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(key) for key in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _segment_positions(lengths):
+    """Position of every byte inside its segment, for segments of the given lengths"""
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+def _hash_names(buffer, offsets):
+    """64-bit polynomial hash of every name of a (buffer, offsets) pair"""
+    lengths = np.diff(offsets)
+    terms = (buffer.astype(np.uint64) + np.uint64(1)) \
+        * _NAME_HASH_BASE ** _segment_positions(lengths).astype(np.uint64)
+    hashes = np.zeros(len(lengths), dtype=np.uint64)
+    nonempty = lengths > 0
+    if nonempty.any():
+        hashes[nonempty] = np.add.reduceat(terms, offsets[:-1][nonempty])
+    return hashes
+
+
+def build_index(taxdump, index_file=INDEX_FILE):
+    """Build the index from a taxdump directory or archive, returns the node count"""
+    nodes = _read_dump(taxdump, 'nodes.dmp', [0, 2])
+    taxids = nodes[0].to_numpy(dtype=np.int64)
+    parents = nodes[2].to_numpy(dtype=np.int64)
+
+    size = int(taxids.max()) + 1
+    parent = np.zeros(size, dtype=np.int32)
+    parent[taxids] = parents
+
+    try:
+        merged = _read_dump(taxdump, 'merged.dmp', [0, 2])
+        old, new = merged[0].to_numpy(dtype=np.int64), merged[2].to_numpy(dtype=np.int64)
+        keep = (old < size) & (new < size)
+        # A merged ID behaves as a child of the ID it was merged into
+        parent[old[keep]] = new[keep]
+    except (FileNotFoundError, KeyError):
+        pass
+
+    clade = np.zeros(size, dtype=np.uint8)
+    for taxid, name in CLADE_ROOTS.items():
+        if taxid < size:
+            clade[taxid] = CLADES.index(name)
+
+    # Pointer jumping: after round i every node carries the label of its
+    # nearest labelled ancestor within 2**i steps
+    ancestor = parent.copy()
+    while True:
+        clade = np.where(clade == 0, clade[ancestor], clade)
+        next_ancestor = ancestor[ancestor]
+        if np.array_equal(next_ancestor, ancestor):
+            break
+        ancestor = next_ancestor
+
+    names = _read_dump(taxdump, 'names.dmp', [0, 2, 6])
+    names = names[names[6] == 'scientific name']
+    name_keys = names[2].str.lower().to_numpy(dtype=object)
+    # Code point order of the strings is byte order of their UTF-8 encoding
+    order = np.argsort(name_keys, kind='stable')
+    name_bytes, offsets = _encode(name_keys[order].tolist())
+
+    np.savez(index_file, parent=parent, clade=clade,
+             name_bytes=name_bytes, name_offsets=offsets, name_taxids=names[0].to_numpy(dtype=np.int32)[order])
+    return len(taxids)
+
+
+class TaxonomyIndex:
+    """Array-backed taxonomy lookups (see build_index)"""
+
+    def __init__(self, index_file=INDEX_FILE):
+        with np.load(index_file) as data:
+            self.parent = data['parent']
+            self.clade = data['clade']
+            if 'name_bytes' not in data:
+                raise ValueError(f"{index_file} was built by an older version, rebuild it")
+            self.name_bytes = data['name_bytes']
+            self.name_offsets = data['name_offsets']
+            self.name_taxids = data['name_taxids']
+        self._name_table = None
+
+    def lineage(self, taxid):
+        """Tax IDs from taxid up to the root"""
+        lineage = [int(taxid)]
+        while 0 < lineage[-1] < len(self.parent) and self.parent[lineage[-1]] not in (0, lineage[-1]):
+            lineage.append(int(self.parent[lineage[-1]]))
+        return lineage
+
+    def clades(self, taxids):
+        """Clade names of tax IDs (ints or BLAST staxids strings such as '9606;61853')
+
+        The first ID of a ';'-joined list is used; unknown IDs are 'Other'.
+        """
+        values = pd.Series(np.asarray(taxids).ravel())
+        if values.dtype == object or pd.api.types.is_string_dtype(values):
+            values = pd.to_numeric(values.astype(str).str.split(';').str[0], errors='coerce')
+        ids = np.array(values.fillna(0), dtype=np.int64)
+        ids[(ids < 0) | (ids >= len(self.clade))] = 0
+        return np.array(CLADES, dtype=object)[self.clade[ids]]
+
+    def taxid(self, name):
+        """Tax ID of a scientific name, or of its longest leading words
+
+        Underscores count as spaces, so 'Homo_sapiens_MYOD1' resolves to
+        Homo sapiens and 'Danio' to the genus. Returns 0 when unknown.
+        """
+        return int(self.taxids([name])[0])
+
+    def taxids(self, names):
+        """Tax IDs of many names in one call (see taxid), 0 where unknown"""
+        rows, keys = [], []
+        for row, name in enumerate(names):
+            words = name.replace('_', ' ').lower().split()
+            for n in range(len(words), 0, -1):
+                rows.append(row)
+                keys.append(' '.join(words[:n]))
+
+        result = np.zeros(len(names), dtype=np.int64)
+        positions = self._find_names(keys)
+        found = np.flatnonzero(positions >= 0)
+        # Candidates of a name are contiguous, longest first: keep the first hit
+        hit_rows, first = np.unique(np.asarray(rows, dtype=np.int64)[found], return_index=True)
+        result[hit_rows] = self.name_taxids[positions[found[first]]]
+        return result
+
+    def _find_names(self, keys):
+        """Position of the first name equal to every key, -1 where there is none
+
+        Names are matched on their hash through a pandas hash index and
+        compared byte by byte; the few names whose hash collides with a
+        different name are looked up in a dict instead.
+        """
+        if self._name_table is None:
+            self._name_table = self._build_name_table()
+        table, first, collided = self._name_table
+
+        buffer, offsets = _encode(keys)
+        slot = table.get_indexer(_hash_names(buffer, offsets))
+        positions = np.where(slot >= 0, first[slot], -1)
+
+        lengths = np.diff(offsets)
+        hits = np.flatnonzero(positions >= 0)
+        hits = hits[np.diff(self.name_offsets)[positions[hits]] == lengths[hits]]
+        within = _segment_positions(lengths[hits])
+        stored = self.name_bytes[np.repeat(self.name_offsets[positions[hits]], lengths[hits]) + within]
+        query = buffer[np.repeat(offsets[:-1][hits], lengths[hits]) + within]
+        same = np.ones(len(hits), dtype=bool)
+        same[np.repeat(np.arange(len(hits)), lengths[hits])[stored != query]] = False
+
+        matched = np.full(len(keys), -1, dtype=np.int64)
+        matched[hits[same]] = positions[hits[same]]
+        if collided:
+            for i in np.flatnonzero(matched < 0).tolist():
+                matched[i] = collided.get(keys[i].encode('utf-8'), -1)
+        return matched
+
+    def _build_name_table(self):
+        """(hash index, position of the first name of every hash, collided names)"""
+        hashes = _hash_names(self.name_bytes, self.name_offsets)
+        repeated = pd.Index(hashes).duplicated()
+        first = np.flatnonzero(~repeated)
+        table = pd.Index(hashes[first])
+
+        # Repeated hashes are mostly repeated names; keep the ones that are not
+        collided = {}
+        repeated = np.flatnonzero(repeated)
+        owners = first[table.get_indexer(hashes[repeated])]
+        for i, owner in zip(repeated.tolist(), owners.tolist()):
+            name = self._name(i)
+            if name != self._name(owner):
+                collided.setdefault(name, i)
+        return table, first, collided
+
+    def _name(self, i):
+        return self.name_bytes[self.name_offsets[i]:self.name_offsets[i + 1]].tobytes()
+
+    def clade_of(self, name_or_taxid):
+        """Clade name of one species name or tax ID"""
+        if isinstance(name_or_taxid, str) and not name_or_taxid.split(';')[0].isdigit():
+            name_or_taxid = self.taxid(name_or_taxid)
+        return self.clades([name_or_taxid])[0]
+
+
+def load_taxonomy(index_file=INDEX_FILE):
+    """The taxonomy index, or None if it has not been built"""
+    if os.path.exists(index_file):
+        return TaxonomyIndex(index_file)
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('taxdump', help="taxdump directory or taxdump.tar.gz")
+    parser.add_argument('--index', default=INDEX_FILE)
+    args = parser.parse_args()
+
+    n_nodes = build_index(args.taxdump, args.index)
+    print(f"Indexed {n_nodes} taxonomy nodes")
+    print(f"Results saved to {args.index}")
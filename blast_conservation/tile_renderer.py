@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""
+Level-of-detail tile pyramid for alignment heatmaps too large for one figure
+
+The encoded alignment (alignment_matrix.py) is rendered one pixel per cell
+into 256 x 256 PNG tiles, then halved in both directions level after level
+until it fits in a single tile:
+
+    <out_dir>/<level>/<tile row>_<tile column>.png    level 0 = full resolution
+    <out_dir>/overview.png                            first level within --overview px
+    <out_dir>/tiles.json                              levels, shapes, tile size, mode
+
+Two modes:
+
+    conservation   column conservation score where a sequence has the consensus
+                   residue, 0 elsewhere (as create_final_heatmaps.py), mean pooling,
+                   RdYlGn colormap
+    residues       residue classes (hydrophobic, charged, polar, ...), majority pooling
+
+Only one level is held in memory at a time and tiles are written straight
+to PNG, so a 10,000 x 2,000 alignment never becomes a matplotlib figure.
+read_region() assembles any window of any level back from the tiles.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.image as mpimg
+from matplotlib import colormaps
+
+from alignment_matrix import GAP, SYMBOLS, encode, load_alignment
+from conservation_scores import column_scores
+
+TILE_SIZE = 256
+OVERVIEW_SIZE = 1024
+
+# Heatmap figures (create_final_heatmaps.py, visualize_domains_fixed.py):
+# rows above which y labels get sparse, and above which the figure shows
+# the matrix mean-pooled to MAX_FIGURE_ROWS with the full resolution in a
+# tile pyramid next to it
+MAX_LABELLED_ROWS = 60
+MAX_FIGURE_ROWS = 1000
+
+# Residue class colours (RGB) for the residues mode
+RESIDUE_CLASSES = {
+    'AILMFWV': (0.50, 0.63, 0.94),  # hydrophobic
+    'KR': (0.94, 0.08, 0.08),       # positive
+    'DE': (0.75, 0.28, 0.75),       # negative
+    'NQST': (0.08, 0.80, 0.08),     # polar
+    'C': (0.94, 0.50, 0.50),
+    'G': (0.94, 0.56, 0.25),
+    'P': (0.75, 0.75, 0.00),
+    'HY': (0.08, 0.64, 0.64),       # aromatic
+}
+GAP_COLOR = (1.0, 1.0, 1.0)
+OTHER_COLOR = (0.6, 0.6, 0.6)
+
+# Code of the cells majority_pool() adds past the edge of odd-sized levels
+_PADDING = 255
+
+
+def residue_palette():
+    """N_SYMBOLS x 3 uint8 colours of the residue codes"""
+    palette = np.array([OTHER_COLOR] * len(SYMBOLS))
+    palette[GAP] = GAP_COLOR
+    for residues, color in RESIDUE_CLASSES.items():
+        for residue in residues:
+            palette[SYMBOLS.index(residue)] = color
+    return (palette * 255).round().astype(np.uint8)
+
+
+def conservation_matrix(alignment, conservation_file=None):
+    """float32 cells: score of the column where the residue is the consensus, else 0"""
+    if conservation_file:
+        cons_data = pd.read_csv(conservation_file, sep='\t')
+    else:
+        cons_data = column_scores(alignment.counts, alignment.consensus())
+    scores = cons_data['Conservation_Score'].to_numpy(dtype=np.float32)
+    consensus = encode([''.join(cons_data['Residue'].astype(str))])[0]
+    matches = (alignment.codes == consensus[None, :]) & (alignment.codes != GAP)
+    return np.where(matches, scores[None, :], np.float32(0))
+
+
+def mean_pool(values):
+    """Halve both dimensions by averaging 2 x 2 blocks (cells past the edge are ignored)"""
+    rows, cols = values.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = values
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    with np.errstate(invalid='ignore'):
+        return np.nanmean(blocks, axis=(1, 3)).astype(np.float32)
+
+
+def majority_pool(codes):
+    """Halve both dimensions keeping the most common code of each 2 x 2 block
+
+    Ties go to residues over gaps, then to the first cell of the block.
+    """
+    rows, cols = codes.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), _PADDING, dtype=np.uint8)
+    padded[:rows, :cols] = codes
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    cells = blocks.transpose(0, 2, 1, 3).reshape(padded.shape[0] // 2, padded.shape[1] // 2, 4)
+
+    votes = (cells[..., :, None] == cells[..., None, :]).sum(axis=-1) + 0.5 * (cells != GAP)
+    # Padding cells past the edge are never chosen
+    votes[cells == _PADDING] = -1
+    return np.take_along_axis(cells, votes.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+
+
+def pool_to(values, max_rows, max_cols, pool=mean_pool):
+    """Pool a matrix until it fits in max_rows x max_cols"""
+    while values.shape[0] > max_rows or values.shape[1] > max_cols:
+        values = pool(values)
+    return values
+
+
+class TileRenderer:
+    """Colours and pools one mode (see module docstring)"""
+
+    def __init__(self, mode, cmap='RdYlGn'):
+        if mode not in ('conservation', 'residues'):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.mode = mode
+        self.cmap = colormaps[cmap]
+        self.palette = residue_palette()
+
+    def pool(self, level):
+        return mean_pool(level) if self.mode == 'conservation' else majority_pool(level)
+
+    def colorize(self, level):
+        """rows x cols x 3 uint8 image of a level"""
+        if self.mode == 'residues':
+            return self.palette[level]
+        rgba = self.cmap(np.clip(np.nan_to_num(level, nan=0.0), 0, 1), bytes=True)
+        return rgba[..., :3]
+
+
+def write_tiles(level_values, level, out_dir, renderer, tile_size=TILE_SIZE, workers=4):
+    """Write the tiles of one level, returns (tile rows, tile columns)"""
+    level_dir = os.path.join(out_dir, str(level))
+    os.makedirs(level_dir, exist_ok=True)
+    rows, cols = level_values.shape
+    n_tile_rows, n_tile_cols = -(-rows // tile_size), -(-cols // tile_size)
+
+    def write(tile):
+        tile_row, tile_col = tile
+        block = level_values[tile_row * tile_size:(tile_row + 1) * tile_size,
+                             tile_col * tile_size:(tile_col + 1) * tile_size]
+        mpimg.imsave(os.path.join(level_dir, f"{tile_row}_{tile_col}.png"), renderer.colorize(block))
+
+    # PNG compression releases the GIL, so threads encode tiles in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write, itertools.product(range(n_tile_rows), range(n_tile_cols))))
+    return n_tile_rows, n_tile_cols
+
+
+def build_pyramid(values, out_dir, mode, tile_size=TILE_SIZE, overview_size=OVERVIEW_SIZE,
+                  source=None, workers=4):
+    """Write every level of the pyramid and the overview, returns the tiles.json metadata"""
+    renderer = TileRenderer(mode)
+    os.makedirs(out_dir, exist_ok=True)
+    levels = []
+    overview = None
+    level = 0
+    while True:
+        tile_rows, tile_cols = write_tiles(values, level, out_dir, renderer, tile_size, workers)
+        levels.append({'level': level, 'rows': int(values.shape[0]), 'columns': int(values.shape[1]),
+                       'cells_per_pixel': 2 ** level, 'tile_rows': tile_rows, 'tile_columns': tile_cols})
+        if overview is None and max(values.shape) <= overview_size:
+            overview = level
+            mpimg.imsave(os.path.join(out_dir, 'overview.png'), renderer.colorize(values))
+        if max(values.shape) <= tile_size:
+            break
+        values = renderer.pool(values)
+        level += 1
+
+    meta = {'mode': mode, 'tile_size': tile_size, 'overview_level': overview,
+            'levels': levels, 'source': source}
+    with open(os.path.join(out_dir, 'tiles.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_region(tile_dir, level, rows, cols):
+    """rows x cols x 3 uint8 image of a window (two slices) of one level, from its tiles"""
+    with open(os.path.join(tile_dir, 'tiles.json'), 'r') as f:
+        meta = json.load(f)
+    info = meta['levels'][level]
+    size = meta['tile_size']
+    rows = range(*rows.indices(info['rows']))
+    cols = range(*cols.indices(info['columns']))
+    image = np.zeros((len(rows), len(cols), 3), dtype=np.uint8)
+    if not len(rows) or not len(cols):
+        return image
+
+    for tile_row in range(rows[0] // size, rows[-1] // size + 1):
+        for tile_col in range(cols[0] // size, cols[-1] // size + 1):
+            tile = mpimg.imread(os.path.join(tile_dir, str(level), f"{tile_row}_{tile_col}.png"))
+            tile = (tile[..., :3] * 255).round().astype(np.uint8) if tile.dtype != np.uint8 else tile[..., :3]
+            r0, c0 = tile_row * size, tile_col * size
+            r_from, r_to = max(rows[0], r0), min(rows[-1] + 1, r0 + tile.shape[0])
+            c_from, c_to = max(cols[0], c0), min(cols[-1] + 1, c0 + tile.shape[1])
+            image[r_from - rows[0]:r_to - rows[0], c_from - cols[0]:c_to - cols[0]] = \
+                tile[r_from - r0:r_to - r0, c_from - c0:c_to - c0]
+    return image
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('alignment', help="aligned FASTA file")
+    parser.add_argument('--out-dir', help="tile directory (default: <alignment>_tiles next to it)")
+    parser.add_argument('--mode', choices=['conservation', 'residues'], default='conservation')
+    parser.add_argument('--conservation', help="conservation table of the alignment "
+                                               "(default: unweighted scores computed here)")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--workers', type=int, default=4, help="threads writing tiles")
+    parser.add_argument('--overview', type=int, default=OVERVIEW_SIZE,
+                        help="largest side of the overview image (px)")
+    parser.add_argument('--export', nargs=5, metavar=('LEVEL', 'ROW0', 'ROW1', 'COL0', 'COL1'), type=int,
+                        help="also write this window of a level to <out_dir>/export.png")
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or os.path.splitext(args.alignment)[0] + '_tiles'
+    start = time.time()
+    alignment = load_alignment(args.alignment)
+    values = (conservation_matrix(alignment, args.conservation) if args.mode == 'conservation'
+              else alignment.codes)
+
+    meta = build_pyramid(values, out_dir, args.mode, args.tile_size, args.overview,
+                         os.path.abspath(args.alignment), args.workers)
+    n_tiles = sum(level['tile_rows'] * level['tile_columns'] for level in meta['levels'])
+    print(f"✓ {len(alignment)} sequences x {alignment.length} columns: {len(meta['levels'])} levels, "
+          f"{n_tiles} tiles ({time.time() - start:.1f}s)")
+
+    if args.export:
+        level, row0, row1, col0, col1 = args.export
+        export_file = os.path.join(out_dir, 'export.png')
+        mpimg.imsave(export_file, read_region(out_dir, level, slice(row0, row1), slice(col0, col1)))
+        print(f"✓ Exported level {level} rows {row0}-{row1}, columns {col0}-{col1}")
+    print(f"Results saved to {out_dir}")
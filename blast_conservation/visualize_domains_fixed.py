@@ -12,11 +12,13 @@ from matplotlib.patches import Rectangle, FancyBboxPatch
 import seaborn as sns
 import pandas as pd
 import numpy as np
-from Bio import AlignIO, SeqIO
-from collections import Counter
+from Bio import SeqIO
 import json
 import os
 
+from alignment_matrix import AMINO_ACIDS, GAP, load_alignment
+from tile_renderer import MAX_FIGURE_ROWS, MAX_LABELLED_ROWS, build_pyramid, pool_to
+
 # Set style
 sns.set_style("whitegrid")
 plt.rcParams['figure.dpi'] = 300
@@ -61,6 +63,38 @@ def get_species_name(accession_id):
 # 1. DOMAIN ARCHITECTURE DIAGRAM
 # ============================================================================
 
+# Human MRFs drawn in the architecture diagram: (name, orthogroup, accession)
+ARCHITECTURE_PROTEINS = [('MYOD1', 'OG0000000', 'NP_002469.2'),
+                         ('MYF5', 'OG0000000', 'NP_005584.2'),
+                         ('MYOG', 'OG0000001', 'NP_002470.2')]
+
+DOMAIN_COLORS = {'TAD': '#FF6B6B', 'Basic': '#4ECDC4', 'HLH': '#45B7D1'}
+DOMAIN_LABELS = {'TAD': 'TAD (Transactivation)', 'Basic': 'Basic (DNA binding)',
+                 'HLH': 'HLH (Helix-Loop-Helix)'}
+EXTRA_COLORS = ['#F7B267', '#A29BFE', '#55EFC4', '#FD79A8', '#B2BEC3']
+
+def load_derived_architecture(segmentation_dir='05_domains/segmentation', aligner='mafft'):
+    """Domain layout of the human MRFs from domain_segmentation.py, None if not run"""
+    proteins = {}
+    for name, og, accession in ARCHITECTURE_PROTEINS:
+        domain_file = os.path.join(segmentation_dir, f"{og}_{aligner}_domains.json")
+        if not os.path.exists(domain_file):
+            return None
+        with open(domain_file, 'r') as f:
+            layout = json.load(f).get(accession)
+        if layout is None:
+            return None
+        proteins[name] = layout
+    
+    # Colour every block by its name
+    names = sorted({d['name'] for info in proteins.values() for d in info['domains']})
+    extra = iter(EXTRA_COLORS * len(names))
+    colors = {n: DOMAIN_COLORS.get(n) or next(extra) for n in names}
+    for info in proteins.values():
+        for domain in info['domains']:
+            domain['color'] = colors[domain['name']]
+    return proteins
+
 def create_domain_architecture(output_file):
     """Create beautiful domain architecture diagram"""
     
@@ -69,33 +103,38 @@ def create_domain_architecture(output_file):
     fig, axes = plt.subplots(3, 1, figsize=(14, 10))
     fig.suptitle('MRF Family Domain Architecture', fontsize=18, fontweight='bold')
     
-    # Define domain architecture for each protein
-    proteins = {
-        'MYOD1': {
-            'length': 320,
-            'domains': [
-                {'name': 'TAD', 'start': 1, 'end': 80, 'color': '#FF6B6B'},
-                {'name': 'Basic', 'start': 100, 'end': 125, 'color': '#4ECDC4'},
-                {'name': 'HLH', 'start': 126, 'end': 180, 'color': '#45B7D1'}
-            ]
-        },
-        'MYF5': {
-            'length': 255,
-            'domains': [
-                {'name': 'TAD', 'start': 1, 'end': 60, 'color': '#FF6B6B'},
-                {'name': 'Basic', 'start': 80, 'end': 105, 'color': '#4ECDC4'},
-                {'name': 'HLH', 'start': 106, 'end': 160, 'color': '#45B7D1'}
-            ]
-        },
-        'MYOG': {
-            'length': 224,
-            'domains': [
-                {'name': 'TAD', 'start': 1, 'end': 50, 'color': '#FF6B6B'},
-                {'name': 'Basic', 'start': 70, 'end': 95, 'color': '#4ECDC4'},
-                {'name': 'HLH', 'start': 96, 'end': 150, 'color': '#45B7D1'}
-            ]
+    # Domain architecture derived from the full-length alignments if available,
+    # otherwise the literature layout
+    proteins = load_derived_architecture()
+    if proteins:
+        print("  Using conserved blocks from 05_domains/segmentation")
+    else:
+        proteins = {
+            'MYOD1': {
+                'length': 320,
+                'domains': [
+                    {'name': 'TAD', 'start': 1, 'end': 80, 'color': '#FF6B6B'},
+                    {'name': 'Basic', 'start': 100, 'end': 125, 'color': '#4ECDC4'},
+                    {'name': 'HLH', 'start': 126, 'end': 180, 'color': '#45B7D1'}
+                ]
+            },
+            'MYF5': {
+                'length': 255,
+                'domains': [
+                    {'name': 'TAD', 'start': 1, 'end': 60, 'color': '#FF6B6B'},
+                    {'name': 'Basic', 'start': 80, 'end': 105, 'color': '#4ECDC4'},
+                    {'name': 'HLH', 'start': 106, 'end': 160, 'color': '#45B7D1'}
+                ]
+            },
+            'MYOG': {
+                'length': 224,
+                'domains': [
+                    {'name': 'TAD', 'start': 1, 'end': 50, 'color': '#FF6B6B'},
+                    {'name': 'Basic', 'start': 70, 'end': 95, 'color': '#4ECDC4'},
+                    {'name': 'HLH', 'start': 96, 'end': 150, 'color': '#45B7D1'}
+                ]
+            }
         }
-    }
     
     for idx, (protein, info) in enumerate(proteins.items()):
         ax = axes[idx]
@@ -138,12 +177,15 @@ def create_domain_architecture(output_file):
         ax.axis('off')
     
     # Legend
+    legend_colors = {}
+    for info in proteins.values():
+        for domain in info['domains']:
+            legend_colors.setdefault(domain['name'], domain['color'])
     legend_elements = [
-        mpatches.Patch(facecolor='#FF6B6B', edgecolor='black', label='TAD (Transactivation)'),
-        mpatches.Patch(facecolor='#4ECDC4', edgecolor='black', label='Basic (DNA binding)'),
-        mpatches.Patch(facecolor='#45B7D1', edgecolor='black', label='HLH (Helix-Loop-Helix)')
+        mpatches.Patch(facecolor=color, edgecolor='black', label=DOMAIN_LABELS.get(name, name))
+        for name, color in legend_colors.items()
     ]
-    fig.legend(handles=legend_elements, loc='lower center', ncol=3,
+    fig.legend(handles=legend_elements, loc='lower center', ncol=min(len(legend_elements), 5),
               fontsize=11, frameon=True, fancybox=True)
     
     plt.tight_layout(rect=[0, 0.05, 1, 0.96])
@@ -168,18 +210,17 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
     cons_data = pd.read_csv(conservation_file, sep='\t')
     
     # Load alignment
-    alignment = AlignIO.read(alignment_file, 'fasta')
+    alignment = load_alignment(alignment_file)
     n_seqs = len(alignment)
-    aln_len = alignment.get_alignment_length()
+    aln_len = alignment.length
     
-    # Create matrix for heatmap (first 20 sequences)
-    n_display = min(20, n_seqs)
-    matrix = np.zeros((n_display, aln_len))
+    # Display every sequence of the orthogroup
+    n_display = n_seqs
     
     # Get species names for labels
     species_labels = []
     for i in range(n_display):
-        original_id = alignment[i].id
+        original_id = alignment.ids[i]
         species_name = get_species_name(original_id)
         
         # Truncate long names
@@ -188,18 +229,14 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
         
         species_labels.append(species_name)
     
-    # Fill matrix
-    for i in range(n_display):
-        for j in range(aln_len):
-            aa = alignment[i, j]
-            if aa != '-':
-                matrix[i, j] = cons_data.iloc[j]['Conservation_Score']
-            else:
-                matrix[i, j] = 0
+    # Fill matrix: column score where the sequence has a residue, 0 for gaps
+    scores = cons_data['Conservation_Score'].values[:aln_len]
+    matrix = np.where(alignment.codes != GAP, scores[None, :], 0.0).astype(np.float32)
     
-    # Create figure
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 10), 
-                                    gridspec_kw={'height_ratios': [1, 4]})
+    # Create figure, taller for large orthogroups
+    heatmap_height = 8 if n_display <= 20 else min(8 + 0.12 * (n_display - 20), 18)
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 2 + heatmap_height),
+                                    gridspec_kw={'height_ratios': [2, heatmap_height]})
     
     # Top panel: Conservation line plot
     positions = cons_data['Position'].values
@@ -216,16 +253,28 @@ def create_conservation_heatmap(conservation_file, alignment_file, output_file,
     ax1.set_title(title, fontsize=14, fontweight='bold', pad=10)
     ax1.grid(True, alpha=0.3)
     
-    # Bottom panel: Heatmap with species names
-    sns.heatmap(matrix, cmap='RdYlGn', vmin=0, vmax=1, 
-                cbar_kws={'label': 'Conservation Score'},
-                ax=ax2, xticklabels=50, yticklabels=species_labels)
+    # Bottom panel: heatmap, one rasterized image whatever the number of rows
+    if n_display > MAX_FIGURE_ROWS:
+        tile_dir = os.path.splitext(output_file)[0] + '_tiles'
+        build_pyramid(matrix, tile_dir, 'conservation', source=os.path.abspath(alignment_file))
+        print(f"  ✓ Full-resolution tiles: {tile_dir}/")
+        matrix = pool_to(matrix, MAX_FIGURE_ROWS, aln_len)
+    im = ax2.imshow(matrix, aspect='auto', cmap='RdYlGn', interpolation='nearest',
+                    vmin=0, vmax=1, rasterized=True,
+                    extent=(-0.5, aln_len - 0.5, n_display - 0.5, -0.5))
+    
+    # Species names, sparse for large orthogroups
+    step = 1 if n_display <= MAX_LABELLED_ROWS else int(np.ceil(n_display / MAX_LABELLED_ROWS))
+    ax2.set_yticks(range(0, n_display, step))
+    ax2.set_yticklabels(species_labels[::step], fontsize=9 if step == 1 else 7)
+    ax2.set_xticks(range(0, aln_len, 50))
+    ax2.grid(False)
     
     ax2.set_xlabel('Position', fontsize=11, fontweight='bold')
-    ax2.set_ylabel('Species (top 20)', fontsize=11, fontweight='bold')
+    ax2.set_ylabel(f'Species (all {n_display})', fontsize=11, fontweight='bold')
     
-    # Adjust y-axis labels
-    ax2.set_yticklabels(ax2.get_yticklabels(), fontsize=9)
+    cbar = plt.colorbar(im, ax=ax2, orientation='vertical', pad=0.02)
+    cbar.set_label('Conservation Score')
     
     plt.tight_layout()
     plt.savefig(output_file, bbox_inches='tight', dpi=300)
@@ -265,26 +314,11 @@ def create_sequence_logo(alignment_file, output_file, title):
         import logomaker
         
         # Load alignment
-        alignment = AlignIO.read(alignment_file, 'fasta')
-        
-        # Convert to position frequency matrix
-        aln_len = alignment.get_alignment_length()
-        aa_freq = []
-        
-        for pos in range(aln_len):
-            column = [str(alignment[i, pos]) for i in range(len(alignment))]
-            column = [aa for aa in column if aa != '-']
-            
-            if column:
-                counts = Counter(column)
-                total = len(column)
-                freq = {aa: counts.get(aa, 0) / total for aa in 'ACDEFGHIKLMNPQRSTVWY'}
-                aa_freq.append(freq)
-            else:
-                aa_freq.append({aa: 0 for aa in 'ACDEFGHIKLMNPQRSTVWY'})
+        alignment = load_alignment(alignment_file)
+        aln_len = alignment.length
         
-        # Create dataframe
-        df = pd.DataFrame(aa_freq)
+        # Position frequency matrix from the column counts
+        df = pd.DataFrame(alignment.frequencies(), columns=list(AMINO_ACIDS))
         
         # Create logo
         fig, ax = plt.subplots(figsize=(max(12, aln_len * 0.15), 4))
@@ -452,7 +486,7 @@ def identify_functional_sites(conservation_file, alignment_file, output_file, ti
     
     # Load data
     cons_data = pd.read_csv(conservation_file, sep='\t')
-    alignment = AlignIO.read(alignment_file, 'fasta')
+    alignment = load_alignment(alignment_file)
     
     # Identify highly conserved positions (putative functional sites)
     functional_sites = cons_data[cons_data['Conservation_Score'] > 0.9]
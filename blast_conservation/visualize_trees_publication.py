@@ -12,6 +12,8 @@ from ete3 import Tree, TreeStyle, NodeStyle, TextFace, faces
 import sys
 import os
 
+from taxonomy_index import CLADE_COLORS, load_taxonomy
+
 # Load accession to species mapping
 def load_name_mapping(mapping_file):
     """Load accession ID to species name mapping"""
@@ -27,12 +29,19 @@ def load_name_mapping(mapping_file):
 # Load mapping
 name_mapping = load_name_mapping('04_phylogeny/accession_to_species.txt')
 
+# Offline NCBI taxonomy (taxonomy_index.py), when it has been built
+taxonomy = load_taxonomy()
+
 def get_species_info(accession):
     """Get species name and taxonomic group from accession"""
     species_name = name_mapping.get(accession, accession)
     
     # Determine taxonomic group and color
-    if 'Homo_sapiens' in species_name or 'Mus_musculus' in species_name or \
+    clade = taxonomy.clade_of(species_name) if taxonomy is not None else 'Other'
+    if clade != 'Other':
+        taxon_color = CLADE_COLORS[clade]
+        taxon_group = clade
+    elif 'Homo_sapiens' in species_name or 'Mus_musculus' in species_name or \
        'Bos_taurus' in species_name or 'Canis_lupus' in species_name:
         taxon_color = '#4169E1'  # Royal Blue - Mammals
         taxon_group = 'Mammal'
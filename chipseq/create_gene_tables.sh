@@ -4,7 +4,7 @@
 # Create Gene Enrichment Tables for Presentation
 ###############################################################################
 
-cd ~/PGB/MYOD1_project/chipseq
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project/chipseq}"
 
 echo "=========================================="
 echo "Creating Gene Analysis Tables"
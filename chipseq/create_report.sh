@@ -1,5 +1,7 @@
 #!/bin/bash
 
+CHIPSEQ_DIR="${PIPELINE_WORKDIR:-/home/naidurev/PGB/MYOD1_project/chipseq}"
+
 # Check dependencies
 command -v python3 >/dev/null 2>&1 || { echo "Python3 required"; exit 1; }
 
@@ -10,7 +12,7 @@ pip3 install python-docx Pillow pdf2image --break-system-packages
 sudo apt-get update && sudo apt-get install -y poppler-utils
 
 # Create the report generation script
-cat > /home/naidurev/PGB/MYOD1_project/chipseq/generate_chipseq_report.py << 'PYTHON_SCRIPT'
+cat > "$CHIPSEQ_DIR/generate_chipseq_report.py" << 'PYTHON_SCRIPT'
 #!/usr/bin/env python3
 """
 ChIP-seq Report Generator
@@ -28,7 +30,7 @@ from pdf2image import convert_from_path
 import subprocess
 
 # Base directory
-BASE_DIR = "/home/naidurev/PGB/MYOD1_project/chipseq"
+BASE_DIR = os.environ.get("PIPELINE_WORKDIR", "/home/naidurev/PGB/MYOD1_project/chipseq")
 IMAGES_DIR = f"{BASE_DIR}/presentation_chipseq_minimal"
 RESULTS_DIR = BASE_DIR
 
@@ -636,13 +638,13 @@ if __name__ == "__main__":
 PYTHON_SCRIPT
 
 # Make the script executable
-chmod +x /home/naidurev/PGB/MYOD1_project/chipseq/generate_chipseq_report.py
+chmod +x "$CHIPSEQ_DIR/generate_chipseq_report.py"
 
 # Run the script
 echo ""
 echo "Running report generator..."
 echo ""
-cd /home/naidurev/PGB/MYOD1_project/chipseq
+cd "$CHIPSEQ_DIR"
 python3 generate_chipseq_report.py
 
 echo ""
@@ -650,7 +652,7 @@ echo "════════════════════════
 echo "  Report Generated!"
 echo "════════════════════════════════════════════════════════════"
 echo ""
-echo "Output: /home/naidurev/PGB/MYOD1_project/chipseq/MYOD1_ChIPseq_Report.docx"
+echo "Output: $CHIPSEQ_DIR/MYOD1_ChIPseq_Report.docx"
 echo ""
 echo "You can now:"
 echo "  1. Open with LibreOffice: libreoffice MYOD1_ChIPseq_Report.docx"
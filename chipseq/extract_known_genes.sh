@@ -4,7 +4,7 @@
 # Extract Gene Symbols from GO Enrichment (Alternative Method)
 ###############################################################################
 
-cd ~/PGB/MYOD1_project/chipseq
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project/chipseq}"
 
 echo "=========================================="
 echo "Extracting Gene Symbols (Alternative)"
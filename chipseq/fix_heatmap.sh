@@ -4,7 +4,7 @@
 # Fix and Convert Peak Heatmap to PNG
 ###############################################################################
 
-cd ~/PGB/MYOD1_project/chipseq
+cd "${PIPELINE_WORKDIR:-$HOME/PGB/MYOD1_project/chipseq}"
 
 echo "=========================================="
 echo "Converting Peak Heatmap to PNG"
@@ -15,7 +15,7 @@ from pdf2image import convert_from_path
 import subprocess
 
 # Base directory
-BASE_DIR = "/home/naidurev/PGB/MYOD1_project/chipseq"
+BASE_DIR = os.environ.get("PIPELINE_WORKDIR", "/home/naidurev/PGB/MYOD1_project/chipseq")
 IMAGES_DIR = f"{BASE_DIR}/presentation_chipseq_minimal"
 RESULTS_DIR = BASE_DIR
 
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Per-gene dN/dS summaries across transcript and orthologue rows
+
+A gene usually appears on several rows of a BioMart export (one per
+transcript/orthologue pair). This collapses them to one row per Ensembl
+gene with the count, median, mean, min and max ratio and the fraction of
+rows where dN or dS was zero and had to be substituted, using a single
+hash group-by over the cached export columns (or over the parsed export
+when the cache is not used).
+"""
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from mart_cache import load_mart_columns
+from process_mart_export import dn_ds_ratio, parse_mart_chunks
+from process_mart_export_bHLH import load_gene_sets, species_name
+
+SUMMARY_COLUMNS = ['count', 'median', 'mean', 'min', 'max', 'zero_fraction']
+
+
+def gene_summary(genes, codes, dn, ds, gene_set=None):
+    """DataFrame indexed by gene with one summary row per gene
+
+    genes are the distinct gene codes, codes the per-row index into them.
+    With a gene_set only rows of genes in the set are aggregated.
+    """
+    codes = np.asarray(codes)
+    dn = np.asarray(dn)
+    ds = np.asarray(ds)
+
+    if gene_set is not None:
+        rows = np.flatnonzero(pd.Index(genes).isin(gene_set)[codes])
+        codes, dn, ds = codes[rows], dn[rows], ds[rows]
+
+    frame = pd.DataFrame({
+        'gene': pd.Categorical.from_codes(codes, genes),
+        'ratio': dn_ds_ratio(dn, ds),
+        'zero_substituted': (dn == 0.0) | (ds == 0.0),
+    })
+
+    grouped = frame.groupby('gene', observed=True, sort=False)
+    summary = grouped['ratio'].agg(['count', 'median', 'mean', 'min', 'max'])
+    summary['zero_fraction'] = grouped['zero_substituted'].mean()
+    summary.index = summary.index.astype(str)
+    summary.index.name = 'gene'
+    return summary[SUMMARY_COLUMNS]
+
+
+def summary_output_file(out_dir, family, species):
+    """02_dn_ds_values/<dir>/<family>_dn_ds_gene_summary_<species>.txt"""
+    subdir = family if family == 'full_genome' else f"{family}_TFs"
+    return os.path.join(out_dir, subdir, f"{family}_dn_ds_gene_summary_{species}.txt")
+
+
+def write_summary(summary, output_file):
+    """Tab-separated summary with a header, ratios to five decimals"""
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    summary.to_csv(output_file, sep='\t', float_format='%.5f')
+
+
+def parse_mart_columns(mart_file):
+    """(genes, codes, dn, ds) of an export like load_mart_columns, parsed without the cache"""
+    chunks = list(parse_mart_chunks(mart_file))
+    if not chunks:
+        return np.empty(0, dtype=str), np.empty(0, dtype=np.int32), np.empty(0), np.empty(0)
+
+    code = pd.api.types.union_categoricals([chunk['code'].array for chunk in chunks])
+    return (np.asarray(code.categories, dtype=str), code.codes,
+            np.concatenate([chunk['dn'].to_numpy() for chunk in chunks]),
+            np.concatenate([chunk['ds'].to_numpy() for chunk in chunks]))
+
+
+def summarize_species(mart_file, species, gene_sets, out_dir, cache=True):
+    """Write the full-genome and per-family gene summaries of one export
+
+    Returns {family: (genes summarized, output file)}.
+    """
+    if cache:
+        genes, codes, dn, ds = load_mart_columns(mart_file)
+    else:
+        genes, codes, dn, ds = parse_mart_columns(mart_file)
+
+    written = {}
+    for family, gene_set in {'full_genome': None, **gene_sets}.items():
+        summary = gene_summary(genes, codes, dn, ds, gene_set)
+        output_file = summary_output_file(out_dir, family, species)
+        write_summary(summary, output_file)
+        written[family] = (len(summary), output_file)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('mart_file', nargs='?', default='mart_export_mouse.txt')
+    parser.add_argument('--gene-sets', nargs='*', default=['bHLH_ensembl_codes.txt'],
+                        help="gene-set files, one family per file (default: bHLH_ensembl_codes.txt)")
+    parser.add_argument('--species', help="species label for output names (default: from mart file name)")
+    parser.add_argument('--out-dir', default='02_dn_ds_values')
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="parse the export instead of using .mart_cache/")
+    args = parser.parse_args()
+
+    species = args.species or species_name(args.mart_file)
+    written = summarize_species(args.mart_file, species, load_gene_sets(args.gene_sets), args.out_dir,
+                                args.cache)
+
+    for family, (n_genes, output_file) in written.items():
+        print(f"✓ {family}: {n_genes} genes -> {output_file}")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""
+Permutation and bootstrap tests of gene-family vs genome-wide dN/dS
+
+For every species and gene family (02_dn_ds_values/<family>_TFs/) the
+per-gene log10(dN/dS) of the family is compared with the rest of the
+genome (02_dn_ds_values/full_genome/). Differences in median and mean
+get two-sided label-permutation p-values and percentile bootstrap
+confidence intervals; Cliff's delta is reported as a rank effect size.
+
+Permutations and bootstrap replicates are computed in batches of NumPy
+operations and the batches are spread over a process pool.
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+N_PERMUTATIONS = 100_000
+N_BOOTSTRAP = 10_000
+BATCH_SIZE = 256
+
+STAT_NAMES = ['median', 'mean']
+
+
+def load_gene_values(path):
+    """Series of one dN/dS value per gene (the per-gene median)
+
+    Accepts *_dn_ds_gene_summary_*.txt files (median column) and the
+    two-column *_dn_ds_values_*.txt files, whose rows are collapsed to
+    their per-gene median.
+    """
+    if '_gene_summary_' in os.path.basename(path):
+        summary = pd.read_csv(path, sep='\t', index_col='gene')
+        return summary['median']
+
+    values = pd.read_csv(path, sep='\t', header=None, names=['gene', 'dnds'])
+    return values.groupby('gene', sort=False)['dnds'].median()
+
+
+def find_comparisons(values_dir):
+    """[(species, family, family file, full-genome file)] found under values_dir
+
+    Per-gene summaries are preferred over raw value files when both exist.
+    """
+    genome_files = {}
+    for kind in ('values', 'gene_summary'):
+        for path in glob.glob(os.path.join(values_dir, 'full_genome', f'full_genome_dn_ds_{kind}_*.txt')):
+            species = re.search(rf'_dn_ds_{kind}_(.+)\.txt$', path).group(1)
+            genome_files[species] = path
+
+    comparisons = {}
+    for kind in ('values', 'gene_summary'):
+        pattern = os.path.join(values_dir, '*_TFs', f'*_dn_ds_{kind}_*.txt')
+        for path in sorted(glob.glob(pattern)):
+            match = re.search(rf'([^/]+)_dn_ds_{kind}_(.+)\.txt$', path)
+            family, species = match.group(1), match.group(2)
+            if species in genome_files:
+                comparisons[(species, family)] = (path, genome_files[species])
+
+    return [(species, family, *files) for (species, family), files in sorted(comparisons.items())]
+
+
+def _medians_of_sorted(values, lo, hi):
+    return 0.5 * (values[..., lo] + values[..., hi])
+
+
+def _sample_ranks(rng, size, n_total, k):
+    """size sorted rows of k distinct ranks drawn from range(n_total)
+
+    Small subsets are drawn with replacement and rows holding a repeat are
+    redrawn (cheap while k**2 is below ~2 * n_total); larger subsets take
+    the k smallest of n_total random keys.
+    """
+    if k * (k - 1) > 2 * n_total:
+        ranks = np.argpartition(rng.random((size, n_total)), k - 1, axis=1)[:, :k]
+        ranks.sort(axis=1)
+        return ranks
+
+    ranks = np.sort(rng.integers(0, n_total, (size, k)), axis=1)
+    redraw = np.flatnonzero((np.diff(ranks, axis=1) == 0).any(axis=1))
+    while len(redraw):
+        ranks[redraw] = np.sort(rng.integers(0, n_total, (len(redraw), k)), axis=1)
+        redraw = redraw[(np.diff(ranks[redraw], axis=1) == 0).any(axis=1)]
+    return ranks
+
+
+def _permutation_block(pooled, n_a, observed, n, seed):
+    """Count permutations at least as extreme as observed (one pool task)
+
+    pooled is sorted. A random n_a-subset of ranks is drawn per permutation;
+    the complement's median is located from the subset ranks alone, so no
+    per-permutation sort of the background is needed.
+    """
+    rng = np.random.default_rng(seed)
+    n_total = len(pooled)
+    n_b = n_total - n_a
+    total = pooled.sum()
+    offsets = np.arange(n_a)
+    b_lo, b_hi = (n_b - 1) // 2, n_b // 2
+
+    extreme = np.zeros(len(STAT_NAMES), dtype=np.int64)
+    for start in range(0, n, BATCH_SIZE):
+        size = min(BATCH_SIZE, n - start)
+        ranks = _sample_ranks(rng, size, n_total, n_a)
+        a_values = pooled[ranks]
+
+        # Rank of the j-th background element: j + #{i : ranks_i - i <= j}
+        gaps = ranks - offsets
+        b_lo_rank = b_lo + (gaps <= b_lo).sum(axis=1)
+        b_hi_rank = b_hi + (gaps <= b_hi).sum(axis=1)
+
+        sum_a = a_values.sum(axis=1)
+        diff = np.empty((len(STAT_NAMES), size))
+        diff[0] = (_medians_of_sorted(a_values, (n_a - 1) // 2, n_a // 2)
+                   - 0.5 * (pooled[b_lo_rank] + pooled[b_hi_rank]))
+        diff[1] = sum_a / n_a - (total - sum_a) / n_b
+
+        extreme += (np.abs(diff) >= np.abs(observed)[:, None] - 1e-12).sum(axis=1)
+
+    return extreme
+
+
+def _resampled_median(rng, values, size):
+    """Medians of size bootstrap resamples of sorted values
+
+    Resample indices are floor(n * U) for uniform U, so the k-th smallest
+    resampled index is floor(n * U_(k)) with U_(k) ~ Beta(k, n + 1 - k);
+    given U_(k) = u, U_(k+1) = u + (1 - u) * Beta(1, n - k). The middle order
+    statistics are therefore drawn directly, without materializing resamples.
+    """
+    n = len(values)
+    lo, hi = (n - 1) // 2, n // 2
+    u_lo = rng.beta(lo + 1, n - lo, size)
+    u_hi = u_lo if hi == lo else u_lo + (1 - u_lo) * rng.beta(1, n - hi, size)
+    idx_lo = np.minimum((n * u_lo).astype(np.int64), n - 1)
+    idx_hi = np.minimum((n * u_hi).astype(np.int64), n - 1)
+    return 0.5 * (values[idx_lo] + values[idx_hi])
+
+
+def _bootstrap_block(a_sorted, b_sorted, n, seed):
+    """Bootstrap replicates of the median and mean differences (one pool task)"""
+    rng = np.random.default_rng(seed)
+
+    diffs = np.empty((len(STAT_NAMES), n))
+    diffs[0] = _resampled_median(rng, a_sorted, n) - _resampled_median(rng, b_sorted, n)
+
+    for start in range(0, n, BATCH_SIZE):
+        size = min(BATCH_SIZE, n - start)
+        means = [values[rng.integers(0, len(values), (size, len(values)), dtype=np.int32)].mean(axis=1)
+                 for values in (a_sorted, b_sorted)]
+        diffs[1, start:start + size] = means[0] - means[1]
+
+    return diffs
+
+
+def cliffs_delta(a, b_sorted):
+    """Cliff's delta of a vs b: P(a > b) - P(a < b)"""
+    below = np.searchsorted(b_sorted, a, side='left')
+    above = len(b_sorted) - np.searchsorted(b_sorted, a, side='right')
+    return (below.sum() - above.sum()) / (len(a) * len(b_sorted))
+
+
+def _split(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (i < extra) for i in range(parts) if base + (i < extra)]
+
+
+def compare_groups(family_values, background_values, pool, n_perm=N_PERMUTATIONS,
+                   n_boot=N_BOOTSTRAP, seed=0, n_tasks=1, confidence=0.95):
+    """Test one family against its background; returns a dict of results
+
+    Returns None when either group has no values, as there is nothing to
+    compare.
+    """
+    if len(family_values) == 0 or len(background_values) == 0:
+        return None
+
+    a = np.sort(np.log10(family_values))
+    b = np.sort(np.log10(background_values))
+    pooled = np.sort(np.concatenate([a, b]))
+
+    observed = np.array([np.median(a) - np.median(b), a.mean() - b.mean()])
+
+    seeds = np.random.SeedSequence(seed).spawn(2 * n_tasks)
+    perm_jobs = [pool.submit(_permutation_block, pooled, len(a), observed, n, s)
+                 for n, s in zip(_split(n_perm, n_tasks), seeds[:n_tasks])]
+    boot_jobs = [pool.submit(_bootstrap_block, a, b, n, s)
+                 for n, s in zip(_split(n_boot, n_tasks), seeds[n_tasks:])]
+
+    extreme = sum(job.result() for job in perm_jobs)
+    boot = np.concatenate([job.result() for job in boot_jobs], axis=1)
+    tail = 100 * (1 - confidence) / 2
+
+    result = {'n_family': len(a), 'n_background': len(b),
+              'median_log10_family': np.median(a), 'median_log10_background': np.median(b)}
+    for i, stat in enumerate(STAT_NAMES):
+        low, high = np.percentile(boot[i], [tail, 100 - tail])
+        result[f'diff_{stat}'] = observed[i]
+        result[f'diff_{stat}_ci_low'] = low
+        result[f'diff_{stat}_ci_high'] = high
+        result[f'p_{stat}'] = (1 + extreme[i]) / (1 + n_perm)
+    result['cliffs_delta'] = cliffs_delta(a, b)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--values-dir', default='02_dn_ds_values')
+    parser.add_argument('--output', default='03_statistics/dn_ds_family_tests.tsv')
+    parser.add_argument('--permutations', type=int, default=N_PERMUTATIONS)
+    parser.add_argument('--bootstrap', type=int, default=N_BOOTSTRAP)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print("="*70)
+    print("dN/dS Gene Family vs Genome Tests")
+    print("="*70)
+    print("")
+
+    comparisons = find_comparisons(args.values_dir)
+    if not comparisons:
+        print(f"⚠ No family/full-genome file pairs found in {args.values_dir}")
+        raise SystemExit(1)
+
+    n_tasks = args.workers or os.cpu_count() or 1
+    rows = []
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for species, family, family_file, genome_file in comparisons:
+            family_values = load_gene_values(family_file)
+            genome_values = load_gene_values(genome_file)
+
+            family_values = family_values[family_values > 0]
+            background = genome_values[(genome_values > 0) & ~genome_values.index.isin(family_values.index)]
+
+            result = compare_groups(family_values.to_numpy(), background.to_numpy(), pool,
+                                    args.permutations, args.bootstrap, args.seed, n_tasks)
+            if result is None:
+                print(f"⚠ {family} vs genome ({species}): skipped, "
+                      f"{len(family_values)} family and {len(background)} background genes with dN/dS > 0")
+                continue
+            rows.append({'species': species, 'family': family, **result})
+
+            print(f"✓ {family} vs genome ({species}): "
+                  f"Δmedian={result['diff_median']:.3f} (p={result['p_median']:.2g}), "
+                  f"Δmean={result['diff_mean']:.3f} (p={result['p_mean']:.2g}), "
+                  f"Cliff's δ={result['cliffs_delta']:.3f}")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    pd.DataFrame(rows).to_csv(args.output, sep='\t', index=False, float_format='%.6g')
+
+    print("")
+    print(f"✓ {len(rows)} comparisons in {time.time() - start:.1f}s "
+          f"({args.permutations} permutations, {args.bootstrap} bootstrap replicates each)")
+    print(f"Results saved to {args.output}")
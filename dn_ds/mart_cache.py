@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+Binary columnar cache for parsed BioMart exports
+
+The gene code, dN and dS columns of an export are parsed once and stored
+as flat binary arrays under .mart_cache/<export name>/ next to the export:
+
+    genes.npy   distinct gene codes (fixed-width unicode)
+    codes.i32   per-row index into genes.npy
+    dn.f64      per-row dN
+    ds.f64      per-row dS
+    meta.json   file size, mtime and SHA-256 of the export, row count
+
+The per-row arrays are opened with np.memmap, so later runs skip parsing.
+A cache entry is used when the export size and mtime match; if only the
+mtime differs, the content hash decides.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+from process_mart_export import CHUNK_SIZE, parse_mart_chunks
+
+CACHE_DIR = '.mart_cache'
+CACHE_VERSION = 1
+
+_COLUMNS = {'codes': ('codes.i32', np.int32),
+            'dn': ('dn.f64', np.float64),
+            'ds': ('ds.f64', np.float64)}
+
+
+def cache_path(mart_file):
+    """.mart_cache/<export name>/ in the directory of the export"""
+    directory, name = os.path.split(os.path.abspath(mart_file))
+    return os.path.join(directory, CACHE_DIR, name)
+
+
+def file_digest(path, block_size=8 << 20):
+    """SHA-256 hex digest of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_key(mart_file):
+    stat = os.stat(mart_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_valid(mart_file):
+    """True if the cache entry of an export matches the export on disk"""
+    meta_file = os.path.join(cache_path(mart_file), 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+
+    with open(meta_file, 'r') as f:
+        meta = json.load(f)
+
+    key = _file_key(mart_file)
+    if meta.get('version') != CACHE_VERSION or meta['size'] != key['size']:
+        return False
+    if meta['mtime_ns'] == key['mtime_ns']:
+        return True
+
+    # Touched but maybe unchanged: compare content and refresh the mtime
+    if meta['sha256'] != file_digest(mart_file):
+        return False
+    meta['mtime_ns'] = key['mtime_ns']
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f, indent=2)
+    return True
+
+
+def build_cache(mart_file, chunksize=CHUNK_SIZE):
+    """Parse an export once and write its cache entry, returns the row count"""
+    target = cache_path(mart_file)
+    tmp = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    key = _file_key(mart_file)
+    gene_ids = {}
+    n_rows = 0
+
+    handles = {name: open(os.path.join(tmp, fname), 'wb') for name, (fname, _) in _COLUMNS.items()}
+    try:
+        for chunk in parse_mart_chunks(mart_file, chunksize):
+            categories = chunk['code'].cat.categories
+            ids = np.array([gene_ids.setdefault(g, len(gene_ids)) for g in categories],
+                           dtype=np.int32)
+            codes = ids[chunk['code'].cat.codes.to_numpy()]
+
+            codes.tofile(handles['codes'])
+            chunk['dn'].to_numpy(dtype=np.float64).tofile(handles['dn'])
+            chunk['ds'].to_numpy(dtype=np.float64).tofile(handles['ds'])
+            n_rows += len(chunk)
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    np.save(os.path.join(tmp, 'genes.npy'), np.array(list(gene_ids), dtype=str))
+
+    meta = {'version': CACHE_VERSION, 'source': os.path.basename(mart_file),
+            'sha256': file_digest(mart_file), 'rows': n_rows,
+            'genes': len(gene_ids), **key}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return n_rows
+
+
+def load_mart_columns(mart_file, chunksize=CHUNK_SIZE):
+    """Memory-mapped (genes, codes, dn, ds) of an export, building the cache if stale"""
+    if not is_valid(mart_file):
+        build_cache(mart_file, chunksize)
+
+    target = cache_path(mart_file)
+    with open(os.path.join(target, 'meta.json'), 'r') as f:
+        n_rows = json.load(f)['rows']
+
+    genes = np.load(os.path.join(target, 'genes.npy'))
+    columns = []
+    for fname, dtype in _COLUMNS.values():
+        if n_rows:
+            columns.append(np.memmap(os.path.join(target, fname), dtype=dtype,
+                                     mode='r', shape=(n_rows,)))
+        else:
+            columns.append(np.empty(0, dtype=dtype))
+
+    return (genes, *columns)
+
+
+def read_cached_chunks(mart_file, chunksize=CHUNK_SIZE):
+    """Yield the same chunks as parse_mart_chunks, served from the cache"""
+    genes, codes, dn, ds = load_mart_columns(mart_file, chunksize)
+    rows = max(1, chunksize // 32)
+
+    for start in range(0, len(codes), rows):
+        stop = start + rows
+        yield pd.DataFrame({
+            'code': pd.Categorical.from_codes(codes[start:stop], genes),
+            'dn': np.asarray(dn[start:stop]),
+            'ds': np.asarray(ds[start:stop]),
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('mart_files', nargs='+')
+    parser.add_argument('--rebuild', action='store_true', help="ignore existing cache entries")
+    args = parser.parse_args()
+
+    for mart_file in args.mart_files:
+        if not args.rebuild and is_valid(mart_file):
+            print(f"✓ {mart_file}: cache up to date")
+            continue
+        n_rows = build_cache(mart_file)
+        print(f"✓ {mart_file}: cached {n_rows} rows in {cache_path(mart_file)}")
@@ -1,54 +1,122 @@
+#!/usr/bin/env python3
+
+"""
+Compute dN/dS ratios for gene families (bHLH, homeobox, ...) from a BioMart export
+
+Every gene-set file (e.g. bHLH_ensembl_codes.txt) is loaded into a hashed
+set and the export is read once; each chunk is split across all families
+at the same time, so adding a family does not add another pass over the
+export. Outputs go to 02_dn_ds_values/<family>_TFs/.
+"""
+
+import argparse
+import os
 import re
+import numpy as np
+
+from process_mart_export import CHUNK_SIZE, UniqueRatioWriter, dn_ds_ratio, read_mart_chunks
+
+
+def family_name(gene_set_file):
+    """Family name from a gene-set file name (bHLH_ensembl_codes.txt -> bHLH)"""
+    name = os.path.basename(gene_set_file)
+    return re.sub(r'(_ensembl_codes)?\.txt$', '', name)
+
+
+def species_name(mart_file):
+    """Species from a mart export file name (mart_export_mouse.txt -> mouse)"""
+    name = os.path.basename(mart_file)
+    match = re.fullmatch(r'mart_export_(.+)\.txt', name)
+    return match.group(1) if match else os.path.splitext(name)[0]
+
+
+def load_gene_sets(gene_set_files):
+    """Read Ensembl codes of every gene-set file into {family: set(codes)}"""
+    gene_sets = {}
+    for path in gene_set_files:
+        with open(path, 'r') as f:
+            codes = set(re.findall(r'ENSG\d+', f.read()))
+        gene_sets.setdefault(family_name(path), set()).update(codes)
+    return gene_sets
+
+
+def family_output_file(out_dir, family, species):
+    """02_dn_ds_values/<family>_TFs/<family>_dn_ds_values_<species>.txt"""
+    return os.path.join(out_dir, f"{family}_TFs", f"{family}_dn_ds_values_{species}.txt")
+
+
+def split_by_family(chunk, gene_sets):
+    """Yield (family, row indices) for the rows of a chunk in each gene set
+
+    Membership is resolved once per distinct gene code of the chunk and
+    then broadcast to its rows through the categorical codes. A gene set
+    of None selects every row (the full genome).
+    """
+    categories = chunk['code'].cat.categories
+    row_codes = chunk['code'].cat.codes.to_numpy()
+
+    for family, codes in gene_sets.items():
+        if codes is None:
+            yield family, slice(None)
+            continue
 
-# Read bHLH Ensembl codes
-with open('bHLH_ensembl_codes.txt', 'r') as file:
-    lines = file.readlines()
-    bHLH_ensembl_codes = []
-    for line in lines:
-        match = re.search(r'ENSG\d+', line)
-        if match:
-            bHLH_ensembl_codes.append(match.group())
+        in_family = categories.isin(codes)
+        if in_family.any():
+            yield family, np.flatnonzero(in_family[row_codes])
 
-print(len(bHLH_ensembl_codes))
 
-filtered_lines = []
+def process_gene_families(mart_file, gene_sets, output_files, chunksize=CHUNK_SIZE, cache=True):
+    """Write the unique dN/dS values of every gene family in one pass
 
-# Process mart export file
-with open('mart_export_mouse.txt', 'r') as mart_file:
-    for line in mart_file:
-        parts = line.strip().split('\t')
-        if len(parts) < 4:
-            continue  # skip malformed lines
+    output_files maps each family to its output path. Returns the number
+    of rows written per family.
+    """
+    handles = {}
+    writers = {}
+    try:
+        for family, path in output_files.items():
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            handles[family] = open(path, 'w')
+            writers[family] = UniqueRatioWriter(handles[family])
 
-        code = parts[0]
-        if code in bHLH_ensembl_codes:
-            try:
-                dn = float(parts[2])
-                ds = float(parts[3])
+        for chunk in read_mart_chunks(mart_file, chunksize, cache):
+            ratios = dn_ds_ratio(chunk['dn'].to_numpy(), chunk['ds'].to_numpy())
+            codes = chunk['code'].array
+            for family, rows in split_by_family(chunk, gene_sets):
+                writers[family].write(codes[rows], ratios[rows])
+    finally:
+        for handle in handles.values():
+            handle.close()
 
-                # Replace zeros with 0.00001
-                if dn == 0.0:
-                    dn = 0.00001
-                if ds == 0.0:
-                    ds = 0.00001
+    return {family: len(writer) for family, writer in writers.items()}
 
-                ratio = dn / ds
-                filtered_lines.append((code, ratio))
 
-            except ValueError:
-                continue  # skip lines with invalid numbers
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('mart_file', nargs='?', default='mart_export_mouse.txt')
+    parser.add_argument('--gene-sets', nargs='+', default=['bHLH_ensembl_codes.txt'],
+                        help="gene-set files, one family per file (default: bHLH_ensembl_codes.txt)")
+    parser.add_argument('--species', help="species label for output names (default: from mart file name)")
+    parser.add_argument('--out-dir', default='02_dn_ds_values')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE,
+                        help=f"bytes of the export parsed per chunk (default: {CHUNK_SIZE})")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="parse the export instead of using .mart_cache/")
+    args = parser.parse_args()
 
-# Save output
-seen = set()  # store (code, ratio) pairs we've already written
+    species = args.species or species_name(args.mart_file)
 
-with open('bHLH_dn_ds_values_mouse.txt', 'w') as out:
-    for code, ratio in filtered_lines:
-        pair = (code, round(ratio, 5))  # round to match the output format
-        if pair not in seen:
-            out.write(f"{code}\t{ratio:.5f}\n")
-            seen.add(pair)
+    # Read gene-set Ensembl codes
+    gene_sets = load_gene_sets(args.gene_sets)
+    for family, codes in gene_sets.items():
+        print(f"{family}: {len(codes)} genes")
 
-print(f"Number of matches found: {len(seen)}")
+    output_files = {family: family_output_file(args.out_dir, family, species)
+                    for family in gene_sets}
 
-print("Results saved to bHLH_dn_ds_values_.txt")
+    n_matches = process_gene_families(args.mart_file, gene_sets, output_files,
+                                      args.chunksize, args.cache)
 
+    for family, count in n_matches.items():
+        print(f"Number of matches found ({family}): {count}")
+        print(f"Results saved to {output_files[family]}")
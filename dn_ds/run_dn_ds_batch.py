@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Batch dN/dS processing of every mart_export_<species>.txt in a directory
+
+Each species is handled by one worker of a process pool and its export is
+read once, writing the full_genome/ output and every gene-family output
+(bHLH_TFs/, ...) from the same pass, followed by the per-gene summaries
+(see aggregate_dn_ds.py).
+"""
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aggregate_dn_ds import summarize_species
+from process_mart_export import CHUNK_SIZE
+from process_mart_export_bHLH import (family_output_file, load_gene_sets,
+                                      process_gene_families, species_name)
+
+
+def find_mart_exports(input_dir):
+    """{species: path} for every mart_export_<species>.txt in input_dir"""
+    exports = {}
+    for path in sorted(glob.glob(os.path.join(input_dir, 'mart_export_*.txt'))):
+        exports[species_name(path)] = path
+    return exports
+
+
+def species_outputs(out_dir, species, families):
+    """Output path of the full genome and of every family for one species"""
+    outputs = {'full_genome': os.path.join(
+        out_dir, 'full_genome', f"full_genome_dn_ds_values_{species}.txt")}
+    for family in families:
+        outputs[family] = family_output_file(out_dir, family, species)
+    return outputs
+
+
+def process_species(species, mart_file, gene_sets, out_dir, chunksize=CHUNK_SIZE, cache=True):
+    """Full-genome and gene-family outputs for one species (pool worker)"""
+    start = time.time()
+    gene_sets = {'full_genome': None, **gene_sets}
+    outputs = species_outputs(out_dir, species, [f for f in gene_sets if f != 'full_genome'])
+    counts = process_gene_families(mart_file, gene_sets, outputs, chunksize, cache)
+    summaries = summarize_species(mart_file, species, gene_sets, out_dir, cache)
+    for family, (n_genes, _) in summaries.items():
+        counts[f"{family} (per-gene summary)"] = n_genes
+    return species, counts, time.time() - start
+
+
+def update_species_outputs(species, mart_file, gene_sets, out_dir):
+    """Incremental counterpart of process_species (see update_dn_ds.py)"""
+    from update_dn_ds import update_species
+
+    start = time.time()
+    result = update_species(mart_file, species, gene_sets, out_dir)
+    if result is None:
+        counts = {'no usable snapshot': 'all outputs recomputed'}
+    else:
+        added, changed, removed, report = result
+        counts = {'added genes': len(added), 'changed genes': len(changed),
+                  'removed genes': len(removed),
+                  'moved ratios': int((report['status'] == 'changed').sum())}
+    return species, counts, time.time() - start
+
+
+def run_batch(exports, gene_sets, out_dir, workers=None, chunksize=CHUNK_SIZE, cache=True,
+              incremental=False):
+    """Process all species in a process pool, yielding results as they finish"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if incremental:
+            futures = [pool.submit(update_species_outputs, species, path, gene_sets, out_dir)
+                       for species, path in exports.items()]
+        else:
+            futures = [pool.submit(process_species, species, path, gene_sets, out_dir,
+                                   chunksize, cache)
+                       for species, path in exports.items()]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--input-dir', default='.',
+                        help="directory holding mart_export_<species>.txt files (default: .)")
+    parser.add_argument('--gene-sets', nargs='*', default=['bHLH_ensembl_codes.txt'],
+                        help="gene-set files, one family per file (default: bHLH_ensembl_codes.txt)")
+    parser.add_argument('--out-dir', default='02_dn_ds_values')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE,
+                        help=f"bytes of the export parsed per chunk (default: {CHUNK_SIZE})")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="parse the exports instead of using .mart_cache/")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only recompute genes that changed since the last run")
+    args = parser.parse_args()
+
+    print("="*70)
+    print("dN/dS Batch Processing")
+    print("="*70)
+    print("")
+
+    exports = find_mart_exports(args.input_dir)
+    if not exports:
+        print(f"⚠ No mart_export_<species>.txt files found in {args.input_dir}")
+        raise SystemExit(1)
+
+    gene_sets = load_gene_sets(args.gene_sets)
+    print(f"Species: {', '.join(exports)}")
+    print(f"Gene families: {', '.join(gene_sets) or 'none'}")
+    print("")
+
+    start = time.time()
+    for species, counts, elapsed in run_batch(exports, gene_sets, args.out_dir, args.workers,
+                                              args.chunksize, args.cache, args.incremental):
+        print(f"✓ {species} ({elapsed:.1f}s)")
+        for family, count in counts.items():
+            print(f"    {family}: {count}")
+
+    print("")
+    print(f"✓ {len(exports)} species processed in {time.time() - start:.1f}s")
+    print(f"Results saved to {args.out_dir}/")
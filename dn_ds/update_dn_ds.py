@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Incremental dN/dS update when a new Ensembl/BioMart release lands
+
+Every processed export leaves a snapshot (02_dn_ds_values/.snapshots/)
+holding, per gene, an order-independent hash of its rows and its median
+ratio, keyed by a hash of the gene sets it was split by. A new export of
+the same species is compared gene by gene against that snapshot; only
+added, changed and removed genes are recomputed, and the existing value
+and per-gene summary files are patched in place.
+A change report (02_dn_ds_values/changes/) lists the genes whose ratio
+moved.
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import numpy as np
+import pandas as pd
+
+from aggregate_dn_ds import gene_summary, summary_output_file
+from mart_cache import load_mart_columns
+from process_mart_export import UniqueRatioWriter, dn_ds_ratio
+from process_mart_export_bHLH import load_gene_sets, species_name
+from run_dn_ds_batch import process_species, species_outputs
+
+SNAPSHOT_DIR = '.snapshots'
+
+# Smallest median change reported (the precision of the output files)
+RATIO_TOLERANCE = 0.00001
+
+_HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def snapshot_file(out_dir, species):
+    return os.path.join(out_dir, SNAPSHOT_DIR, f"{species}.npz")
+
+
+def report_file(out_dir, species):
+    return os.path.join(out_dir, 'changes', f"{species}_changes.tsv")
+
+
+def gene_hashes(genes, codes, dn, ds):
+    """Series of an order-independent hash of every gene's (dN, dS) rows
+
+    Row hashes are summed per gene (mod 2**64), so reordering rows between
+    releases does not count as a change.
+    """
+    codes = np.asarray(codes)
+    row_hash = (pd.util.hash_array(np.asarray(dn)) * _HASH_MIX
+                + pd.util.hash_array(np.asarray(ds)))
+
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    hashes = np.add.reduceat(row_hash[order], starts) if len(order) else row_hash
+
+    return pd.Series(hashes, index=pd.Index(genes[sorted_codes[starts]], name='gene'))
+
+
+def gene_sets_key(gene_sets):
+    """SHA-256 hex digest of the family names and member codes of the gene sets"""
+    digest = hashlib.sha256()
+    for family in sorted(gene_sets):
+        digest.update(f"{family}\t{','.join(sorted(gene_sets[family]))}\n".encode())
+    return digest.hexdigest()
+
+
+def load_snapshot(path, key):
+    """(hashes, medians) Series indexed by gene
+
+    None without a snapshot or when it was taken with other gene sets
+    (key, see gene_sets_key), since family membership may have changed.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if 'key' not in data or str(data['key']) != key:
+            return None
+        index = pd.Index(data['genes'], name='gene')
+        return pd.Series(data['hashes'], index=index), pd.Series(data['medians'], index=index)
+
+
+def save_snapshot(path, hashes, medians, key):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    medians = medians.reindex(hashes.index)
+    np.savez(path, key=np.array(key), genes=hashes.index.to_numpy(dtype=str),
+             hashes=hashes.to_numpy(dtype=np.uint64), medians=medians.to_numpy(dtype=np.float64))
+
+
+def classify_genes(old_hashes, new_hashes):
+    """(added, changed, removed) gene Indexes between two snapshots"""
+    added = new_hashes.index.difference(old_hashes.index)
+    removed = old_hashes.index.difference(new_hashes.index)
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed = common[new_hashes[common].to_numpy() != old_hashes[common].to_numpy()]
+    return added, changed, removed
+
+
+def _rewrite(path, keep_lines, new_text):
+    """Atomically replace a file with kept lines followed by new_text"""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, 'w') as out:
+        out.writelines(keep_lines)
+        out.write(new_text)
+    os.replace(tmp, path)
+
+
+def patch_values_file(path, drop_genes, codes, ratios):
+    """Drop the rows of drop_genes, then append the recomputed rows
+
+    codes (Categorical) and ratios hold the recomputed rows only; genes
+    outside drop_genes keep their lines byte for byte.
+    """
+    with open(path, 'r') as f:
+        keep = [line for line in f if line.split('\t', 1)[0] not in drop_genes]
+
+    new_rows = io.StringIO()
+    UniqueRatioWriter(new_rows).write(codes, ratios)
+    _rewrite(path, keep, new_rows.getvalue())
+
+
+def patch_summary_file(path, drop_genes, summary):
+    """Same as patch_values_file for a per-gene summary (keeps the header)"""
+    with open(path, 'r') as f:
+        header = f.readline()
+        keep = [header] + [line for line in f if line.split('\t', 1)[0] not in drop_genes]
+
+    new_rows = io.StringIO()
+    summary.to_csv(new_rows, sep='\t', header=False, float_format='%.5f')
+    _rewrite(path, keep, new_rows.getvalue())
+
+
+def change_report(added, changed, removed, old_medians, new_medians):
+    """DataFrame of added and removed genes and changed genes whose median moved"""
+    report = pd.DataFrame({
+        'status': (['added'] * len(added) + ['changed'] * len(changed)
+                   + ['removed'] * len(removed)),
+    }, index=pd.Index(added.append(changed).append(removed), name='gene'))
+    report['old_median'] = old_medians.reindex(report.index)
+    report['new_median'] = new_medians.reindex(report.index)
+    report['delta'] = report['new_median'] - report['old_median']
+
+    moved = (report['status'] != 'changed') | (report['delta'].abs() >= RATIO_TOLERANCE)
+    return report[moved]
+
+
+def update_species(mart_file, species, gene_sets, out_dir):
+    """Bring the outputs of one species up to date with mart_file
+
+    Falls back to a full run when there is no snapshot, the gene sets
+    changed since it was taken or an output file is missing. Returns
+    (added, changed, removed, report) or None after a full run; the
+    report is also written to 02_dn_ds_values/changes/.
+    """
+    genes, codes, dn, ds = load_mart_columns(mart_file)
+    codes = np.asarray(codes)
+    new_hashes = gene_hashes(genes, codes, dn, ds)
+
+    outputs = species_outputs(out_dir, species, gene_sets)
+    summaries = {family: summary_output_file(out_dir, family, species) for family in outputs}
+    key = gene_sets_key(gene_sets)
+    snapshot = load_snapshot(snapshot_file(out_dir, species), key)
+    complete = all(os.path.exists(p) for p in [*outputs.values(), *summaries.values()])
+
+    if snapshot is None or not complete:
+        process_species(species, mart_file, gene_sets, out_dir)
+        medians = pd.read_csv(summaries['full_genome'], sep='\t', index_col='gene')['median']
+        save_snapshot(snapshot_file(out_dir, species), new_hashes, medians, key)
+        return None
+
+    old_hashes, old_medians = snapshot
+    added, changed, removed = classify_genes(old_hashes, new_hashes)
+    affected = added.append(changed)
+    drop = set(affected) | set(removed)
+
+    # Rows of added/changed genes only
+    rows = np.flatnonzero(pd.Index(genes).isin(affected)[codes])
+    sub_codes, sub_dn, sub_ds = codes[rows], np.asarray(dn)[rows], np.asarray(ds)[rows]
+    ratios = dn_ds_ratio(sub_dn, sub_ds)
+
+    new_medians = old_medians.drop(removed, errors='ignore')
+    for family, path in outputs.items():
+        gene_set = gene_sets.get(family)
+        selected = (np.ones(len(rows), dtype=bool) if gene_set is None
+                    else pd.Index(genes).isin(gene_set)[sub_codes])
+        patch_values_file(path, drop, pd.Categorical.from_codes(sub_codes[selected], genes),
+                          ratios[selected])
+
+        summary = gene_summary(genes, sub_codes, sub_dn, sub_ds, gene_set)
+        patch_summary_file(summaries[family], drop, summary)
+        if family == 'full_genome':
+            new_medians = pd.concat([new_medians.drop(summary.index, errors='ignore'),
+                                     summary['median']])
+
+    report = change_report(added, changed, removed, old_medians, new_medians)
+    os.makedirs(os.path.dirname(report_file(out_dir, species)), exist_ok=True)
+    report.to_csv(report_file(out_dir, species), sep='\t', float_format='%.5f')
+
+    save_snapshot(snapshot_file(out_dir, species), new_hashes, new_medians, key)
+    return added, changed, removed, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('mart_file')
+    parser.add_argument('--gene-sets', nargs='*', default=['bHLH_ensembl_codes.txt'],
+                        help="gene-set files, one family per file (default: bHLH_ensembl_codes.txt)")
+    parser.add_argument('--species', help="species label for output names (default: from mart file name)")
+    parser.add_argument('--out-dir', default='02_dn_ds_values')
+    args = parser.parse_args()
+
+    species = args.species or species_name(args.mart_file)
+    result = update_species(args.mart_file, species, load_gene_sets(args.gene_sets), args.out_dir)
+
+    if result is None:
+        print(f"✓ {species}: no usable snapshot, all outputs recomputed")
+        raise SystemExit(0)
+
+    added, changed, removed, report = result
+    print(f"✓ {species}: {len(added)} added, {len(changed)} changed, {len(removed)} removed genes")
+    print(f"  {(report['status'] == 'changed').sum()} genes with a moved ratio")
+    print(f"Change report saved to {report_file(args.out_dir, species)}")
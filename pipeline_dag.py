@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+
+"""
+Content-hashed DAG runner for the project pipeline (pipeline.json)
+
+Every step of pipeline.json declares its working directory, command,
+parameters, inputs and outputs (files, directories or glob patterns,
+relative to the working directory):
+
+    {"name": "msa", "cwd": "blast_conservation", "cmd": "python3 msa_scheduler.py ...",
+     "params": {...}, "inputs": [...], "outputs": [...], "after": [...]}
+
+A step depends on the steps producing any of its inputs (and on the steps
+listed in "after"). Before a step runs, its key is computed: a SHA-256
+of the command, the parameters and the content of every input. The key
+and the content hashes of the outputs are recorded in .pipeline_state.json
+after a successful run. A step is skipped when its key is unchanged and
+its outputs still hash to the recorded values, so after a one-file change
+only the steps downstream of that file run again, and a rerun step whose
+outputs come out identical does not invalidate the steps after it.
+
+Independent branches (ChIP-seq, conservation, dN/dS) run concurrently.
+Each command gets PIPELINE_WORKDIR (the absolute working directory of the
+step) and PARAM_<NAME> for every parameter in its environment; {name}
+placeholders in the command are replaced by the parameter values.
+"""
+
+import argparse
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+PIPELINE_FILE = 'pipeline.json'
+STATE_FILE = '.pipeline_state.json'
+
+
+class Step:
+    """One declared step of the pipeline"""
+
+    def __init__(self, spec, root):
+        self.root = root
+        self.name = spec['name']
+        self.cwd = os.path.normpath(os.path.join(root, spec.get('cwd', '.')))
+        self.params = spec.get('params', {})
+        self.cmd = spec['cmd'].format(**self.params)
+        self.inputs = [self._path(p) for p in spec.get('inputs', [])]
+        self.outputs = [self._path(p) for p in spec.get('outputs', [])]
+        self.after = list(spec.get('after', []))
+        self.depends = set()
+
+    def _path(self, pattern):
+        return os.path.normpath(os.path.join(self.cwd, pattern))
+
+    def produces(self, pattern):
+        """True if one of the outputs of this step can match an input pattern"""
+        for output in self.outputs:
+            if (output == pattern or pattern.startswith(output + os.sep)
+                    or output.startswith(pattern + os.sep)
+                    or fnmatch.fnmatch(output, pattern) or fnmatch.fnmatch(pattern, output)):
+                return True
+        return False
+
+
+def load_pipeline(pipeline_file):
+    """{name: Step} with the dependencies resolved, in declaration order"""
+    root = os.path.dirname(os.path.abspath(pipeline_file))
+    with open(pipeline_file, 'r') as f:
+        specs = json.load(f)['steps']
+
+    steps = {}
+    for spec in specs:
+        if spec['name'] in steps:
+            raise ValueError(f"Duplicate step name: {spec['name']}")
+        steps[spec['name']] = Step(spec, root)
+
+    for step in steps.values():
+        for other in steps.values():
+            if other is not step and any(other.produces(p) for p in step.inputs):
+                step.depends.add(other.name)
+        for name in step.after:
+            if name not in steps:
+                raise ValueError(f"{step.name}: unknown step in 'after': {name}")
+            step.depends.add(name)
+
+    _check_acyclic(steps)
+    return steps
+
+
+def _check_acyclic(steps):
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Cycle in pipeline: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in steps[name].depends:
+            visit(dep, path + [name])
+        state[name] = 'done'
+
+    for name in steps:
+        visit(name, [])
+
+
+def select_steps(steps, targets):
+    """Names of the targets and everything upstream of them"""
+    if not targets:
+        return set(steps)
+    selected, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in steps:
+            raise ValueError(f"Unknown step: {name}")
+        if name not in selected:
+            selected.add(name)
+            stack.extend(steps[name].depends)
+    return selected
+
+
+class ContentHasher:
+    """SHA-256 of files, memoized by (size, mtime_ns) across runs"""
+
+    def __init__(self, memo, root):
+        self.memo = memo
+        self.root = root
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        stat = os.stat(path)
+        key = f"{stat.st_size}:{stat.st_mtime_ns}"
+        name = os.path.relpath(path, self.root)
+        with self.lock:
+            cached = self.memo.get(name)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(8 << 20), b''):
+                digest.update(block)
+        with self.lock:
+            self.memo[name] = [key, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def pattern(self, pattern):
+        """{path: digest} of every file under a path or glob pattern"""
+        digests = {}
+        for match in sorted(glob.glob(pattern)) or [pattern]:
+            if os.path.isdir(match):
+                for directory, dirnames, filenames in os.walk(match):
+                    dirnames.sort()
+                    for name in sorted(filenames):
+                        path = os.path.join(directory, name)
+                        digests[path] = self.file(path)
+            elif os.path.exists(match):
+                digests[match] = self.file(match)
+            else:
+                digests[match] = None
+        return digests
+
+
+def step_key(step, hasher):
+    """Hash of the command, parameters and input contents of a step
+
+    Paths are hashed relative to the pipeline root, so the project can be
+    moved without invalidating the recorded steps.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([step.cmd, step.params], sort_keys=True).encode())
+    for pattern in step.inputs:
+        for path, file_digest in sorted(hasher.pattern(pattern).items()):
+            digest.update(f"{os.path.relpath(path, step.root)}\0{file_digest}\n".encode())
+    return digest.hexdigest()
+
+
+def output_digests(step, hasher):
+    """{path relative to the root: digest} of every output file"""
+    digests = {}
+    for pattern in step.outputs:
+        for path, file_digest in hasher.pattern(pattern).items():
+            digests[os.path.relpath(path, step.root)] = file_digest
+    return digests
+
+
+def load_state(state_file):
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    return {'steps': {}, 'files': {}}
+
+
+def save_state(state, state_file):
+    tmp = f"{state_file}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, state_file)
+
+
+def run_pipeline(steps, selected, state, state_file, jobs=4, force=(), dry_run=False, log=print):
+    """Run the selected steps, returns {name: status}"""
+    hasher = ContentHasher(state['files'], os.path.dirname(os.path.abspath(state_file)))
+    status = {}
+    pending = [name for name in steps if name in selected]
+    running = {}
+
+    def execute(step):
+        env = dict(os.environ, PIPELINE_WORKDIR=step.cwd,
+                   **{f"PARAM_{k.upper()}": str(v) for k, v in step.params.items()})
+        log_file = os.path.join(os.path.dirname(state_file), '.pipeline_logs', f"{step.name}.log")
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        began = time.time()
+        with open(log_file, 'w') as out:
+            result = subprocess.run(step.cmd, shell=True, cwd=step.cwd, env=env,
+                                    stdout=out, stderr=subprocess.STDOUT)
+        return result.returncode, time.time() - began, log_file
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                step = steps[name]
+                deps = [d for d in step.depends if d in selected]
+                if any(status.get(d) in ('failed', 'blocked') for d in deps):
+                    status[name] = 'blocked'
+                    pending.remove(name)
+                    log(f"  - {name}: blocked by a failed step")
+                    continue
+                if not all(status.get(d) in ('done', 'cached', 'would run') for d in deps):
+                    continue
+
+                pending.remove(name)
+                if any(status.get(d) == 'would run' for d in deps):
+                    # Dry run: the inputs are not known until upstream has run
+                    status[name] = 'would run'
+                    log(f"  > {name}: would run after upstream steps")
+                    continue
+
+                key = step_key(step, hasher)
+                record = state['steps'].get(name)
+                if (name not in force and record and record['key'] == key
+                        and record['outputs'] == output_digests(step, hasher)):
+                    status[name] = 'cached'
+                    log(f"  = {name}: up to date")
+                elif dry_run:
+                    status[name] = 'would run'
+                    log(f"  > {name}: would run ({step.cmd})")
+                else:
+                    log(f"  > {name}: running ({step.cmd})")
+                    running[pool.submit(execute, step)] = (name, key)
+
+            if not running:
+                if pending:
+                    continue
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                returncode, seconds, log_file = future.result()
+                if returncode == 0:
+                    status[name] = 'done'
+                    state['steps'][name] = {'key': key, 'outputs': output_digests(steps[name], hasher),
+                                            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                            'seconds': round(seconds, 2)}
+                    save_state(state, state_file)
+                    log(f"  ✓ {name} ({seconds:.1f}s)")
+                else:
+                    status[name] = 'failed'
+                    log(f"  ✗ {name} failed with exit code {returncode}, see {log_file}")
+
+    save_state(state, state_file)
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('targets', nargs='*', help="steps to bring up to date (default: all)")
+    parser.add_argument('--pipeline', default=PIPELINE_FILE)
+    parser.add_argument('--jobs', type=int, default=4, help="steps run at the same time")
+    parser.add_argument('--force', nargs='*', default=[], help="rerun these steps even if up to date")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would run")
+    parser.add_argument('--list', action='store_true', help="list the steps and their dependencies")
+    args = parser.parse_args()
+
+    steps = load_pipeline(args.pipeline)
+    if args.list:
+        for name, step in steps.items():
+            print(f"{name}: {', '.join(sorted(step.depends)) or '-'}")
+        sys.exit(0)
+
+    state_file = os.path.join(os.path.dirname(os.path.abspath(args.pipeline)), STATE_FILE)
+    selected = select_steps(steps, args.targets)
+
+    print(f"Running {len(selected)} steps with up to {args.jobs} at a time...")
+    start = time.time()
+    status = run_pipeline(steps, selected, load_state(state_file), state_file,
+                          args.jobs, set(args.force), args.dry_run)
+
+    counts = {}
+    for value in status.values():
+        counts[value] = counts.get(value, 0) + 1
+    print(f"Finished in {time.time() - start:.1f}s: "
+          + ', '.join(f"{n} {value}" for value, n in sorted(counts.items())))
+    sys.exit(1 if any(value in ('failed', 'blocked') for value in status.values()) else 0)